@@ -0,0 +1,257 @@
+"""
+历史数据回填
+
+HourlyBackfill：在每小时图表页逐日点击“前一天”，把过去的日期写入 hourly_usage
+
+- 检查点保存在 SQLite 的 backfill_checkpoints 表中，中断后重跑会从未完成的日期继续
+- hourly_usage 中已有完整 24 小时数据的日期直接跳过
+- 只用一个 context 从图表默认日期单向后退一遍：图表没有按日期直达的入口，
+  多个 worker 各自从默认日期点到自己的分段只会重复翻页、增加对站点的请求
+- 每两次“前一天”请求之间至少间隔 day_interval_sec 秒
+- 中断时把正在处理的日期记为 failed，续跑和检查点表都能看出停在哪里
+
+DailyHistoryCrawler：在每日图表页逐期点击“上一期”，把更早的账单周期写入 daily_usage
+"""
+
+import time
+import asyncio
+import logging
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Union
+
+from kyuden_scraper import KyudenScraper, launch_chromium
+from db import KyudenSQLite
+from columnar import UsageColumns
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """全局最小间隔限速（协程安全）"""
+
+    def __init__(self, min_interval_sec: float):
+        self.min_interval_sec = max(0.0, min_interval_sec)
+        self._lock = asyncio.Lock()
+        self._next_at = 0.0
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_at = loop.time() + self.min_interval_sec
+
+def _archive(db: KyudenSQLite, kind: str, payload: Dict[str, Any], target_date: Optional[date] = None,
+             ingested: bool = True):
+    """把历史 payload 存档，便于日后离线重新解析（db.py reparse）；ingested=False（没解析出数据）时不标记为已入库"""
+    digest, _ = db.archive_payload(kind, payload, target_date)
+    if ingested:
+        db.mark_payloads_ingested([(digest, target_date)])
+
+class HourlyBackfill:
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        db_path: Union[str, Path],
+        start: date,
+        end: date,
+        storage_state_path: Optional[Union[str, Path]] = None,
+        day_interval_sec: float = 5.0,
+        anchor: Optional[date] = None,
+        job: Optional[str] = None,
+        pacing: str = "normal",
+        headless: bool = True,
+    ):
+        if start > end:
+            raise ValueError("--from 不能晚于 --to")
+        self.username = username
+        self.password = password
+        self.db_path = Path(db_path)
+        self.start = start
+        self.end = end
+        self.storage_state_path = storage_state_path
+        self.day_interval_sec = day_interval_sec
+        # 每小时图表默认显示的日期（与 parse_hourly_usage_data 的默认归属一致）
+        self.anchor = anchor or date.today()
+        if end > self.anchor:
+            raise ValueError(f"--to 不能晚于图表默认显示的日期 {self.anchor}")
+        self.job = job or f"hourly:{start.isoformat()}:{end.isoformat()}"
+        self.pacing = pacing
+        self.headless = headless
+        self.stats: Dict[str, Any] = {"done": 0, "empty": 0, "failed": 0, "rows": 0}
+
+    def plan(self, db: KyudenSQLite) -> List[date]:
+        """待回填的日期（倒序，离图表默认日期最近的在前）"""
+        complete = db.hourly_complete_days(self.start, self.end)
+        done = db.backfill_done_days(self.job)
+        days, d = [], self.end
+        while d >= self.start:
+            iso = d.isoformat()
+            if iso not in complete and iso not in done:
+                days.append(d)
+            d -= timedelta(days=1)
+        total = (self.end - self.start).days + 1
+        self.stats.update({
+            "days_in_range": total,
+            "skipped_complete": len(complete),
+            "skipped_checkpoint": len(done - complete),
+            "planned": len(days),
+        })
+        return days
+
+    async def _walk(self, browser, db: KyudenSQLite, days: List[date], limiter: RateLimiter):
+        """从图表默认日期开始逐日后退，依次处理 days（倒序）"""
+        scraper = KyudenScraper(
+            storage_state_path=self.storage_state_path,
+            browser=browser,
+            pacing=self.pacing,
+        )
+        day: Optional[date] = None
+        try:
+            await scraper.init_browser(headless=self.headless, use_storage_state=True)
+            if not await scraper.ensure_logged_in(self.username, self.password):
+                raise RuntimeError("登录失败")
+
+            payload = await scraper.open_chart_payload("hourly")
+            offset = 0  # 当前图表距 anchor 的天数
+            for day in days:
+                target = (self.anchor - day).days
+                while offset < target:
+                    await limiter.wait()
+                    payload = await scraper.previous_chart_payload()
+                    offset += 1
+                rows = scraper.parse_hourly_usage_data(payload, target_date=day, columnar=True)
+                n = db.upsert_hourly(rows).written if rows else 0
+                _archive(db, "hourly", payload, day, ingested=bool(rows))
+                status = "done" if rows else "empty"
+                db.mark_backfill_day(self.job, day, status, n)
+                self.stats[status] += 1
+                self.stats["rows"] += n
+                logger.info(f"回填 {day} 完成: {n} 行")
+            day = None
+        except Exception as e:
+            # 图表位置已不可信，剩余日期留给下次续跑
+            failed_day = day or (days[0] if days else None)
+            logger.error(f"回填在 {failed_day} 中断: {e}")
+            self.stats["failed"] += 1
+            if failed_day is not None:
+                db.mark_backfill_day(self.job, failed_day, "failed", 0)
+        finally:
+            await scraper.close()
+
+    async def run(self, browser=None) -> Dict[str, Any]:
+        started = time.perf_counter()
+        with KyudenSQLite(self.db_path) as db:
+            db.init_schema()
+            days = self.plan(db)
+            logger.info(
+                f"回填任务 {self.job}: 区间 {self.stats['days_in_range']} 天，"
+                f"已完整 {self.stats['skipped_complete']}，检查点已完成 {self.stats['skipped_checkpoint']}，"
+                f"待处理 {len(days)}"
+            )
+            if not days:
+                return self.stats
+
+            playwright = None
+            if browser is None:
+                from playwright.async_api import async_playwright
+                playwright = await async_playwright().start()
+                browser = await launch_chromium(playwright, headless=self.headless)
+            limiter = RateLimiter(self.day_interval_sec)
+            try:
+                await self._walk(browser, db, days, limiter)
+            finally:
+                if playwright is not None:
+                    await browser.close()
+                    await playwright.stop()
+        self.stats["elapsed_sec"] = round(time.perf_counter() - started, 3)
+        logger.info(f"回填任务 {self.job} 结束: {self.stats}")
+        return self.stats
+
+class DailyHistoryCrawler:
+    """
+    每日数据的长周期爬取：从当前账单周期开始，用“上一期”控件逐期后退，
+    每期解析后立即写入 daily_usage；一旦某一期的日期已全部在库中就停止，
+    因此重复运行只需要爬取新增的部分
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        db_path: Union[str, Path],
+        storage_state_path: Optional[Union[str, Path]] = None,
+        max_periods: int = 24,
+        period_interval_sec: float = 5.0,
+        pacing: str = "normal",
+        headless: bool = True,
+    ):
+        self.username = username
+        self.password = password
+        self.db_path = Path(db_path)
+        self.storage_state_path = storage_state_path
+        self.max_periods = max(1, max_periods)
+        self.period_interval_sec = period_interval_sec
+        self.pacing = pacing
+        self.headless = headless
+        self.stats: Dict[str, Any] = {"periods": 0, "rows": 0, "stopped_by": None}
+
+    def _ingest(self, db: KyudenSQLite, rows: UsageColumns) -> bool:
+        """写入一期数据；返回 False 表示该期已全部在库（应停止后退）"""
+        if not rows:
+            return False
+        first, last = rows.min_date(), rows.max_date()
+        existing = db.daily_dates_between(first, last)
+        if {date.fromordinal(d).isoformat() for d in set(rows.days)} <= existing:
+            return False
+        n = db.upsert_daily(rows).written
+        self.stats["periods"] += 1
+        self.stats["rows"] += n
+        logger.info(f"写入账单周期 {first} ~ {last}: {n} 行")
+        return True
+
+    async def run(self, browser=None) -> Dict[str, Any]:
+        started = time.perf_counter()
+        scraper = KyudenScraper(storage_state_path=self.storage_state_path, browser=browser, pacing=self.pacing)
+        limiter = RateLimiter(self.period_interval_sec)
+        try:
+            with KyudenSQLite(self.db_path) as db:
+                db.init_schema()
+                await scraper.init_browser(headless=self.headless, use_storage_state=True)
+                if not await scraper.ensure_logged_in(self.username, self.password):
+                    raise RuntimeError("登录失败")
+
+                payload = await scraper.open_chart_payload("daily")
+                rows = scraper.parse_usage_data(payload, columnar=True)
+                # 只存档当前周期：更早的周期依赖 reference_date 推断年份，离线重解析无法还原
+                _archive(db, "daily", payload, ingested=bool(rows))
+                # 当前周期通常与库中数据部分重叠，照常写入但不作为停止条件
+                if rows:
+                    self.stats["rows"] += db.upsert_daily(rows).written
+                    self.stats["periods"] += 1
+                reference = rows.min_date() if rows else date.today()
+
+                for _ in range(self.max_periods):
+                    await limiter.wait()
+                    payload = await scraper.previous_chart_payload()
+                    rows = scraper.parse_usage_data(payload, reference_date=reference - timedelta(days=1), columnar=True)
+                    if not rows:
+                        self.stats["stopped_by"] = "empty-period"
+                        break
+                    if rows.min_date() >= reference:
+                        self.stats["stopped_by"] = "no-earlier-period"
+                        break
+                    if not self._ingest(db, rows):
+                        self.stats["stopped_by"] = "already-stored"
+                        break
+                    reference = rows.min_date()
+                else:
+                    self.stats["stopped_by"] = "max-periods"
+                self.stats["earliest"] = reference.isoformat()
+        finally:
+            await scraper.close()
+        self.stats["elapsed_sec"] = round(time.perf_counter() - started, 3)
+        logger.info(f"每日历史爬取结束: {self.stats}")
+        return self.stats
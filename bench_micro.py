@@ -0,0 +1,383 @@
+"""
+微基准测试：解析、序列化与 SQLite upsert 的吞吐量和峰值内存
+
+覆盖:
+- KyudenScraper.parse_usage_data / parse_hourly_usage_data（dict 与 columnar=True 两种模式）
+- KyudenScraper._save_dataset（csv / json）
+- KyudenSQLite.upsert_daily / upsert_hourly（dict 列表与 UsageColumns 两种输入）
+- --account-scaling：同一个库里 1 到 10,000 个账号时，单账号 upsert 与范围查询的延迟
+
+合成数据与 test_real_data.json / 图表 JSON 的结构一致，规模从 1 天到数年、从 1 个到数千个账号
+（常规用例的多账号用互不重叠的日期区间模拟相同的数据量）
+
+用法:
+    python bench_micro.py                           # 默认规模，结果写入 bench_results/
+    python bench_micro.py --quick                   # 只跑小规模
+    python bench_micro.py --accounts 1000 --only upsert_hourly
+    python bench_micro.py --compare bench_results/micro_20250901_120000.json
+    python bench_micro.py --account-scaling 1,10,100,1000,10000 --scaling-days 14
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional, List, Dict, Any, Tuple
+
+from array import array
+
+from kyuden_scraper import KyudenScraper
+from db import KyudenSQLite, _percentile
+from columnar import UsageColumns
+
+RESULTS_DIR = Path("bench_results")
+BASE_DATE = date(2020, 1, 1)
+
+# (名称, 天数, 账号数)
+DEFAULT_CASES: List[Tuple[str, int, int]] = [
+    ("1d", 1, 1),
+    ("30d", 30, 1),
+    ("1y", 365, 1),
+    ("3y", 365 * 3, 1),
+    ("1y_x100", 365, 100),
+]
+QUICK_CASES: List[Tuple[str, int, int]] = [("1d", 1, 1), ("30d", 30, 1), ("1y", 365, 1)]
+
+# ---------- 合成数据 ----------
+
+def gen_daily_payload(days: int, start: date = BASE_DATE, seed: int = 0) -> Dict[str, Any]:
+    """与 body_0$Data 结构一致的每日图表 JSON"""
+    rnd = random.Random(seed)
+    labels, d = [], start
+    while len(labels) < days:
+        # 图表只给出“月/日”，2/29 在推断出的年份不是闰年时无法解析，合成数据中跳过
+        if (d.month, d.day) != (2, 29):
+            labels.append(d)
+        d += timedelta(days=1)
+    return {
+        "columns": [
+            ["使用電力量"] + [round(rnd.uniform(1.5, 20.0), 1) for _ in labels],
+            ["dummy"] + [None] * days,
+        ],
+        "shiyoKikan": ["x"] + [f"{d.month}/{d.day}" for d in labels],
+        "groups": [["使用電力量", "dummy"]],
+        "order": ["使用電力量", "dummy"],
+    }
+
+def gen_hourly_payload(seed: int = 0) -> Dict[str, Any]:
+    rnd = random.Random(seed)
+    return {
+        "columns": [
+            ["使用電力量"] + [round(rnd.uniform(0.1, 1.5), 1) for _ in range(24)],
+            ["dummy"] + [None] * 24,
+        ],
+        "shiyoKikan": ["x"] + [f"{h}時" for h in range(24)],
+        "groups": [["使用電力量", "dummy"]],
+        "order": ["使用電力量", "dummy"],
+    }
+
+def gen_daily_rows(days: int, accounts: int = 1, seed: int = 0) -> List[Dict[str, Any]]:
+    """dict 形式的记录（test_real_data.json 的形状，走 upsert 的兼容路径）"""
+    rnd = random.Random(seed)
+    now = datetime.now()
+    rows = []
+    for i in range(days * accounts):
+        d = BASE_DATE + timedelta(days=i)
+        rows.append({"date": d, "date_str": f"{d.month}/{d.day}",
+                     "usage_kwh": round(rnd.uniform(1.5, 20.0), 1), "timestamp": now})
+    return rows
+
+def gen_hourly_rows(days: int, accounts: int = 1, seed: int = 0) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    now = datetime.now()
+    rows = []
+    for i in range(days * accounts):
+        d = BASE_DATE + timedelta(days=i)
+        iso = d.isoformat()
+        for h in range(24):
+            rows.append({"date": d, "date_str": iso, "hour": h,
+                         "usage_kwh": round(rnd.uniform(0.1, 1.5), 1), "timestamp": now})
+    return rows
+
+def gen_daily_columns(days: int, accounts: int = 1, seed: int = 0) -> UsageColumns:
+    rnd = random.Random(seed)
+    start = BASE_DATE.toordinal()
+    n = days * accounts
+    return UsageColumns(array("l", range(start, start + n)),
+                        array("d", (round(rnd.uniform(1.5, 20.0), 1) for _ in range(n))))
+
+def gen_hourly_columns(days: int, accounts: int = 1, seed: int = 0) -> UsageColumns:
+    rnd = random.Random(seed)
+    start = BASE_DATE.toordinal()
+    n = days * accounts
+    return UsageColumns(array("l", (start + i for i in range(n) for _ in range(24))),
+                        array("d", (round(rnd.uniform(0.1, 1.5), 1) for _ in range(n * 24))),
+                        hours=array("b", list(range(24)) * n))
+
+# ---------- 测量 ----------
+
+@contextmanager
+def _in_tempdir():
+    old = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix="kyuden-micro-")
+    os.chdir(tmp)
+    try:
+        yield Path(tmp)
+    finally:
+        os.chdir(old)
+
+def measure(fn: Callable[[Any], Any], setup: Callable[[], Any] = lambda: None, repeat: int = 3) -> Dict[str, float]:
+    """fn(setup()) 计时取最优；另做一次 tracemalloc 运行取峰值内存（不计入计时）"""
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        t0 = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - t0)
+    arg = setup()
+    tracemalloc.start()
+    try:
+        fn(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"best_sec": min(times), "mean_sec": sum(times) / len(times), "peak_kib": peak / 1024.0}
+
+def _fresh_db(workdir: Path) -> KyudenSQLite:
+    path = workdir / f"bench_{time.perf_counter_ns()}.db"
+    db = KyudenSQLite(path)
+    db.connect()
+    db.init_schema()
+    return db
+
+def run_suite(cases: List[Tuple[str, int, int]], only: Optional[List[str]] = None, repeat: int = 3) -> List[Dict[str, Any]]:
+    scraper = KyudenScraper()
+    results: List[Dict[str, Any]] = []
+
+    def record(bench: str, case: str, rows: int, m: Dict[str, float]):
+        r = {"bench": bench, "case": case, "rows": rows,
+             "best_sec": round(m["best_sec"], 6), "mean_sec": round(m["mean_sec"], 6),
+             "rows_per_sec": round(rows / m["best_sec"], 1) if m["best_sec"] > 0 else None,
+             "peak_kib": round(m["peak_kib"], 1)}
+        results.append(r)
+        print(f"{bench:<20}{case:<10}{rows:>10}{r['best_sec']:>12.4f}{r['rows_per_sec'] or 0:>14.0f}{r['peak_kib']:>12.1f}")
+
+    def wanted(name: str) -> bool:
+        return not only or name in only
+
+    print(f"{'bench':<20}{'case':<10}{'rows':>10}{'best(s)':>12}{'rows/s':>14}{'peak(KiB)':>12}")
+    with _in_tempdir() as workdir:
+        for case, days, accounts in cases:
+            n = days * accounts
+            if wanted("parse_daily"):
+                payloads = [gen_daily_payload(days, seed=a) for a in range(accounts)]
+                m = measure(lambda ps: [scraper.parse_usage_data(p) for p in ps], lambda: payloads, repeat)
+                record("parse_daily", case, n, m)
+            if wanted("parse_hourly"):
+                payload = gen_hourly_payload()
+                targets = [BASE_DATE + timedelta(days=i) for i in range(n)]
+                m = measure(lambda ts: [scraper.parse_hourly_usage_data(payload, target_date=t) for t in ts],
+                            lambda: targets, repeat)
+                record("parse_hourly", case, n * 24, m)
+            if wanted("parse_daily_col"):
+                payloads = [gen_daily_payload(days, seed=a) for a in range(accounts)]
+                m = measure(lambda ps: [scraper.parse_usage_data(p, columnar=True) for p in ps], lambda: payloads, repeat)
+                record("parse_daily_col", case, n, m)
+            if wanted("parse_hourly_col"):
+                payload = gen_hourly_payload()
+                targets = [BASE_DATE + timedelta(days=i) for i in range(n)]
+                m = measure(lambda ts: [scraper.parse_hourly_usage_data(payload, target_date=t, columnar=True) for t in ts],
+                            lambda: targets, repeat)
+                record("parse_hourly_col", case, n * 24, m)
+
+            daily_rows = gen_daily_rows(days, accounts) if any(map(wanted, ("save_csv", "save_json", "upsert_daily"))) else []
+            hourly_rows = gen_hourly_rows(days, accounts) if any(map(wanted, ("upsert_hourly", "upsert_hourly_rerun", "save_json"))) else []
+            if wanted("save_csv"):
+                m = measure(lambda rows: scraper._save_dataset(rows, "bench_daily", "csv"), lambda: daily_rows, repeat)
+                record("save_csv", case, len(daily_rows), m)
+            if wanted("save_json"):
+                m = measure(lambda rows: scraper._save_dataset(rows, "bench_hourly", "json"), lambda: hourly_rows, repeat)
+                record("save_json", case, len(hourly_rows), m)
+            if wanted("upsert_daily"):
+                m = measure(lambda db: (db.upsert_daily(daily_rows), db.close()), lambda: _fresh_db(workdir), repeat)
+                record("upsert_daily", case, len(daily_rows), m)
+            if wanted("upsert_hourly"):
+                m = measure(lambda db: (db.upsert_hourly(hourly_rows), db.close()), lambda: _fresh_db(workdir), repeat)
+                record("upsert_hourly", case, len(hourly_rows), m)
+            if wanted("upsert_hourly_rerun"):
+                # 与库中完全相同的数据再 upsert 一次（每小时重复抓取的常见情况）
+                def seeded(rows=hourly_rows):
+                    db = _fresh_db(workdir)
+                    db.upsert_hourly(rows)
+                    return db
+                m = measure(lambda db: (db.upsert_hourly(hourly_rows), db.close()), seeded, repeat)
+                record("upsert_hourly_rerun", case, len(hourly_rows), m)
+            if wanted("upsert_daily_col"):
+                cols = gen_daily_columns(days, accounts)
+                m = measure(lambda db: (db.upsert_daily(cols), db.close()), lambda: _fresh_db(workdir), repeat)
+                record("upsert_daily_col", case, len(cols), m)
+            if wanted("upsert_hourly_col"):
+                cols = gen_hourly_columns(days, accounts)
+                m = measure(lambda db: (db.upsert_hourly(cols), db.close()), lambda: _fresh_db(workdir), repeat)
+                record("upsert_hourly_col", case, len(cols), m)
+            if wanted("read_hourly") or wanted("read_hourly_col"):
+                # 读取对比：逐行记录（iter_hourly）与列式分块（iter_hourly_columns）
+                db = _fresh_db(workdir)
+                db.upsert_hourly(gen_hourly_columns(days, accounts))
+                total = db.conn.execute("SELECT COUNT(*) FROM hourly_usage").fetchone()[0]
+                if wanted("read_hourly"):
+                    m = measure(lambda d: sum(1 for _ in d.iter_hourly()), lambda: db, repeat)
+                    record("read_hourly", case, total, m)
+                if wanted("read_hourly_col"):
+                    m = measure(lambda d: sum(len(c) for c in d.iter_hourly_columns()), lambda: db, repeat)
+                    record("read_hourly_col", case, total, m)
+                db.close()
+    return results
+
+# ---------- 多账号扩展性 ----------
+
+def _seed_accounts(db: KyudenSQLite, accounts: int, days: int, seed: int = 0):
+    """直接批量写入 accounts 与 v3 用电量表（只为快速建出规模，不经过 upsert 的变化检测）"""
+    rnd = random.Random(seed)
+    first = BASE_DATE.toordinal() - date(1970, 1, 1).toordinal()
+    conn = db.conn
+    conn.execute("BEGIN;")
+    conn.execute("INSERT INTO fetch_batches (fetched_at) VALUES (?);", (datetime.now().isoformat(),))
+    batch = conn.execute("SELECT MAX(id) FROM fetch_batches;").fetchone()[0]
+    now = datetime.now().isoformat()
+    conn.executemany("INSERT OR IGNORE INTO accounts (id, name, created_at) VALUES (?, ?, ?);",
+                     ((a, f"account-{a}", now) for a in range(2, accounts + 1)))
+    conn.executemany("INSERT INTO daily_usage_v3 (account, day, usage_kwh, batch) VALUES (?, ?, ?, ?);",
+                     ((a, first + d, round(rnd.uniform(5, 25), 2), batch)
+                      for a in range(1, accounts + 1) for d in range(days)))
+    conn.executemany("INSERT INTO hourly_usage_v3 (account, day, hour, usage_kwh, batch) VALUES (?, ?, ?, ?, ?);",
+                     ((a, first + d, h, round(rnd.uniform(0.1, 2.0), 2), batch)
+                      for a in range(1, accounts + 1) for d in range(days) for h in range(24)))
+    conn.execute("COMMIT;")
+
+def run_account_scaling(counts: List[int], days: int = 14, samples: int = 200) -> List[Dict[str, Any]]:
+    """
+    每个账号数各建一个库（每个账号 days 天的每日 + 每小时数据），随机抽 samples 个账号测:
+    upsert 新的一天（24 行）、该账号全部范围的 iter_hourly、top_peak_hours、hour_of_day_profile
+    延迟应与账号数无关：所有查询都落在 (account, day) 主键前缀或 (account, usage_kwh) 索引上
+    """
+    results = []
+    ops = ("upsert_hourly", "iter_hourly", "top_peaks", "profile")
+    print(f"{'accounts':>9}{'rows':>11}" + "".join(f"{op + ' p50/p95(ms)':>26}" for op in ops))
+    with _in_tempdir() as workdir:
+        for n in counts:
+            db = _fresh_db(workdir)
+            _seed_accounts(db, n, days)
+            rows = db.conn.execute("SELECT COUNT(*) FROM hourly_usage_v3;").fetchone()[0]
+            rnd = random.Random(n)
+            picked = rnd.sample(range(1, n + 1), min(n, samples))
+            start, end = BASE_DATE, BASE_DATE + timedelta(days=days - 1)
+            new_day = BASE_DATE + timedelta(days=days)
+            lat: Dict[str, List[float]] = {op: [] for op in ops}
+            for i, a in enumerate(picked * max(1, samples // len(picked))):
+                calls = (
+                    ("upsert_hourly", lambda: db.upsert_hourly(
+                        [{"date": new_day, "hour": h, "usage_kwh": 1.0 + i + h / 100} for h in range(24)], account=a)),
+                    ("iter_hourly", lambda: sum(1 for _ in db.iter_hourly(start, end, account=a))),
+                    ("top_peaks", lambda: db.top_peak_hours(5, account=a)),
+                    ("profile", lambda: db.hour_of_day_profile(start, end, account=a)),
+                )
+                for op, fn in calls:
+                    t0 = time.perf_counter()
+                    fn()
+                    lat[op].append((time.perf_counter() - t0) * 1000)
+            r = {"accounts": n, "rows_hourly": rows, "days_per_account": days, "samples": len(lat["upsert_hourly"])}
+            for op in ops:
+                r[op] = {"p50_ms": round(_percentile(lat[op], 50), 3), "p95_ms": round(_percentile(lat[op], 95), 3)}
+            results.append(r)
+            print(f"{n:>9}{rows:>11}" + "".join(f"{r[op]['p50_ms']:>17.3f}/{r[op]['p95_ms']:<8.3f}" for op in ops))
+            db.close()
+    return results
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def compare(current: List[Dict[str, Any]], baseline_path: str):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["bench"], r["case"]): r for r in json.load(f)["results"]}
+    print(f"\n与基线 {baseline_path} 对比（>1 表示变慢 / 内存变大）")
+    print(f"{'bench':<16}{'case':<10}{'time x':>10}{'peak x':>10}")
+    for r in current:
+        b = baseline.get((r["bench"], r["case"]))
+        if not b:
+            continue
+        t = r["best_sec"] / b["best_sec"] if b["best_sec"] else float("nan")
+        p = r["peak_kib"] / b["peak_kib"] if b["peak_kib"] else float("nan")
+        flag = "  <-- regression" if t > 1.2 or p > 1.2 else ""
+        print(f"{r['bench']:<16}{r['case']:<10}{t:>10.2f}{p:>10.2f}{flag}")
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for parsing, serialization and SQLite upserts")
+    parser.add_argument("--quick", action="store_true", help="只跑小规模用例")
+    parser.add_argument("--accounts", type=int, default=None, help="额外加入 1 年 x N 个账号的用例")
+    parser.add_argument("--only", default=None,
+                        help="逗号分隔: parse_daily,parse_hourly,parse_daily_col,parse_hourly_col,save_csv,save_json,"
+                             "upsert_daily,upsert_hourly,upsert_hourly_rerun,upsert_daily_col,upsert_hourly_col,"
+                             "read_hourly,read_hourly_col")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default=None, help="结果 JSON 路径（默认 bench_results/micro_<时间>.json）")
+    parser.add_argument("--compare", default=None, help="与之前保存的结果 JSON 对比")
+    parser.add_argument("--account-scaling", default=None, metavar="N,N,...",
+                        help="只跑多账号扩展性测试，例如 1,10,100,1000,10000")
+    parser.add_argument("--scaling-days", type=int, default=14, help="扩展性测试中每个账号的天数")
+    args = parser.parse_args(argv)
+
+    if args.account_scaling:
+        counts = [int(x) for x in args.account_scaling.split(",") if x]
+        report = {"meta": {"created_at": datetime.now().isoformat(), "git_rev": _git_rev(),
+                           "sqlite": __import__("sqlite3").sqlite_version},
+                  "account_scaling": run_account_scaling(counts, days=args.scaling_days)}
+        out = Path(args.out) if args.out else RESULTS_DIR / f"accounts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {out}")
+        return
+
+    cases = list(QUICK_CASES if args.quick else DEFAULT_CASES)
+    if args.accounts:
+        cases.append((f"1y_x{args.accounts}", 365, args.accounts))
+    only = args.only.split(",") if args.only else None
+
+    results = run_suite(cases, only=only, repeat=args.repeat)
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_rev": _git_rev(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sqlite": __import__("sqlite3").sqlite_version,
+        },
+        "results": results,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"micro_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {out}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    # 解析函数每次调用都会打 INFO 日志，基准测试中只保留警告以上
+    logging.getLogger().setLevel(logging.WARNING)
+    main()
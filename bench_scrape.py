@@ -0,0 +1,136 @@
+"""
+端到端基准测试：对本地替身站点（standin_site.py）执行 N 次完整的 KyudenScraper.scrape，
+按阶段统计 p50 / p95 耗时（阶段划分来自 PacingPolicy 的阶段记录）
+
+用法:
+    python bench_scrape.py --runs 20 --mode both --pacing minimal
+    python bench_scrape.py --runs 20 --warm            # 复用同一个 Browser（模拟常驻模式）
+    python bench_scrape.py --runs 10 --fresh-login     # 每次都删除 storage state，测量完整登录
+"""
+
+import json
+import time
+import asyncio
+import logging
+import tempfile
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from kyuden_scraper import KyudenScraper, launch_chromium
+import standin_site
+
+logger = logging.getLogger(__name__)
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值百分位（q 取 0..100）"""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = (len(xs) - 1) * q / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    return {
+        name: {
+            "n": len(vals),
+            "p50": round(percentile(vals, 50), 4),
+            "p95": round(percentile(vals, 95), 4),
+            "mean": round(sum(vals) / len(vals), 4),
+            "max": round(max(vals), 4),
+        }
+        for name, vals in samples.items() if vals
+    }
+
+async def run_benchmark(
+    runs: int = 10,
+    mode: str = "both",
+    backend: str = "browser",
+    pacing: str = "minimal",
+    fresh_login: bool = False,
+    warm: bool = False,
+    latency_ms: float = 0.0,
+    headless: bool = True,
+) -> Dict[str, Any]:
+    server, base_url = standin_site.start_in_thread(latency_ms=latency_ms)
+    workdir = Path(tempfile.mkdtemp(prefix="kyuden-bench-"))
+    state_path = workdir / "storage_state.json"
+    samples: Dict[str, List[float]] = {"total": []}
+    failures = 0
+
+    playwright = browser = None
+    if warm:
+        from playwright.async_api import async_playwright
+        playwright = await async_playwright().start()
+        browser = await launch_chromium(playwright, headless=headless)
+    try:
+        for i in range(runs):
+            if fresh_login:
+                for p in (state_path, state_path.with_name(state_path.stem + ".meta.json")):
+                    if p.exists():
+                        p.unlink()
+            scraper = KyudenScraper(
+                storage_state_path=state_path,
+                base_url=base_url,
+                pacing=pacing,
+                browser=browser,
+            )
+            started = time.perf_counter()
+            result = await scraper.scrape("bench", "bench", mode=mode, save_format="none",
+                                          headless=headless, backend=backend)
+            samples["total"].append(time.perf_counter() - started)
+            if not result or not any(result.values()):
+                failures += 1
+            for name, p in (scraper.run_info.get("pacing") or {}).get("phases", {}).items():
+                samples.setdefault(name, []).append(p["wall_sec"])
+            logger.info(f"run {i + 1}/{runs}: {samples['total'][-1]:.3f}s via {scraper.last_backend}")
+    finally:
+        if browser is not None:
+            await browser.close()
+            await playwright.stop()
+        server.shutdown()
+        server.server_close()
+
+    return {
+        "config": {
+            "runs": runs, "mode": mode, "backend": backend, "pacing": pacing,
+            "fresh_login": fresh_login, "warm": warm, "latency_ms": latency_ms,
+        },
+        "failures": failures,
+        "server_hits": dict(server.state.hits),
+        "phases": summarize(samples),
+    }
+
+def print_report(report: Dict[str, Any]):
+    print(f"config: {report['config']}  failures: {report['failures']}")
+    print(f"{'phase':<14}{'n':>5}{'p50(s)':>10}{'p95(s)':>10}{'mean(s)':>10}{'max(s)':>10}")
+    for name, s in report["phases"].items():
+        print(f"{name:<14}{s['n']:>5}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['mean']:>10.3f}{s['max']:>10.3f}")
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="End-to-end scrape benchmark against the local stand-in site")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("-m", "--mode", choices=["daily", "hourly", "both"], default="both")
+    parser.add_argument("--backend", choices=["browser", "http", "auto"], default="browser")
+    parser.add_argument("--pacing", choices=["cautious", "normal", "minimal"], default="minimal")
+    parser.add_argument("--fresh-login", action="store_true", help="每次运行前删除 storage state")
+    parser.add_argument("--warm", action="store_true", help="所有运行复用同一个 Browser")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="替身站点的模拟网络延迟")
+    parser.add_argument("--json", dest="json_path", help="把报告写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(
+        runs=args.runs, mode=args.mode, backend=args.backend, pacing=args.pacing,
+        fresh_login=args.fresh_login, warm=args.warm, latency_ms=args.latency_ms,
+    ))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    # kyuden_scraper 导入时已按 INFO 配置日志，基准测试只保留警告以上
+    logging.getLogger().setLevel(logging.WARNING)
+    main()
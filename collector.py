@@ -1,42 +1,420 @@
 import os
+import sys
+import json
+import time
+import signal
 import asyncio
-from datetime import date
+from datetime import date, datetime, timedelta
 from pathlib import Path
+from typing import Optional, Dict, Any
 import logging
 
-from kyuden_scraper import KyudenScraper
-from db import KyudenSQLite, DEFAULT_DB_PATH
+from kyuden_scraper import KyudenScraper, launch_chromium
+from db import KyudenSQLite, PayloadArchive, UpsertResult, DEFAULT_DB_PATH
+from netpolicy import NetworkPolicy
+from tracing import get_tracer, configure as configure_tracing
+from metrics import CollectorMetrics
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-async def run_collect(username: str, password: str, mode: str, hourly_target_date: str | None, db_path: str):
+DEFAULT_SOCKET_PATH = os.getenv("KYUDEN_SOCKET", "run/kyuden.sock")
+
+async def run_collect(
+    username: str,
+    password: str,
+    mode: str,
+    hourly_target_date: str | None,
+    db_path: str,
+    browser=None,
+    metrics: Optional[CollectorMetrics] = None,
+) -> Dict[str, Any]:
+    """抓取一次并入库；browser 非空时复用调用方持有的 Browser（常驻模式）
+
+    设置了 KYUDEN_METRICS_DIR 时，运行结束后刷新 Prometheus textfile
+    """
     if not username or not password:
         raise RuntimeError("Missing KYUDEN_USER/KYUDEN_PASS in environment")
+    metrics_dir = os.getenv("KYUDEN_METRICS_DIR")
+    if metrics is None and metrics_dir:
+        metrics = CollectorMetrics(db_path)
 
     storage_state = os.getenv("KYUDEN_STATE", ".kyuden_storage_state.json")
-    scraper = KyudenScraper(storage_state_path=storage_state, max_login_retries=int(os.getenv("KYUDEN_MAX_LOGIN_RETRIES", "2")))
-
-    result = await scraper.scrape(
-        username=username,
-        password=password,
-        mode=mode,
-        save_format="none",              # 只拿内存数据
-        headless=True,
-        hourly_target_date=hourly_target_date,
+    net_policy_spec = os.getenv("KYUDEN_NET_POLICY")
+    scraper = KyudenScraper(
         storage_state_path=storage_state,
+        max_login_retries=int(os.getenv("KYUDEN_MAX_LOGIN_RETRIES", "2")),
+        browser=browser,
+        network_policy=NetworkPolicy.load(net_policy_spec) if net_policy_spec else None,
+        pacing=os.getenv("KYUDEN_PACING", "normal"),
+        sleep_budget_sec=float(os.environ["KYUDEN_SLEEP_BUDGET"]) if os.getenv("KYUDEN_SLEEP_BUDGET") else None,
+        alert_handler=metrics.alert_handler if metrics else None,
+        payload_archive=PayloadArchive(db_path, skip_unchanged=os.getenv("KYUDEN_SKIP_UNCHANGED", "1") != "0")
+        if os.getenv("KYUDEN_PAYLOAD_ARCHIVE", "1") != "0" else None,
     )
 
-    daily_rows = result.get("daily") or []
-    hourly_rows = result.get("hourly") or []
-    logger.info(f"fetched daily={len(daily_rows)}, hourly={len(hourly_rows)}")
+    tracer = get_tracer()
+    started = datetime.now()
+    run: Dict[str, Any] = {"started_at": started, "mode": mode, "outcome": "error"}
+    n1 = n2 = 0
+    upserts: Dict[str, Any] = {}
+    try:
+        with tracer.span("run_collect", mode=mode) as root:
+            result = await scraper.scrape(
+                username=username,
+                password=password,
+                mode=mode,
+                save_format="none",              # 只拿内存数据
+                headless=True,
+                hourly_target_date=hourly_target_date,
+                storage_state_path=storage_state,
+                backend=os.getenv("KYUDEN_BACKEND", "browser"),
+            )
+
+            daily_rows = result.get("daily") or []
+            hourly_rows = result.get("hourly") or []
+            logger.info(
+                f"fetched daily={len(daily_rows)}, hourly={len(hourly_rows)} via {scraper.last_backend} "
+                f"(session check: {scraper.run_info.get('validation_path')})"
+            )
+
+            # 入库（幂等 UPSERT）
+            ingest_started = time.perf_counter()
+            with tracer.span("ingest"), KyudenSQLite(Path(db_path)) as db:
+                db.init_schema()
+                with tracer.span("upsert_daily") as sp:
+                    r1 = db.upsert_daily(daily_rows) if daily_rows else UpsertResult()
+                    sp.count("rows_written_daily", r1.written)
+                    sp.count("rows_unchanged_daily", r1.unchanged)
+                with tracer.span("upsert_hourly") as sp:
+                    r2 = db.upsert_hourly(hourly_rows) if hourly_rows else UpsertResult()
+                    sp.count("rows_written_hourly", r2.written)
+                    sp.count("rows_unchanged_hourly", r2.unchanged)
+                    sp.count("rows_skipped_hourly", r2.skipped)
+                n1, n2 = r1.written, r2.written
+                upserts = {"daily": r1.as_dict(), "hourly": r2.as_dict()}
+                logger.info(f"upsert daily={upserts['daily']}, hourly={upserts['hourly']}")
+                # 入库成功后才把本次 payload 记为已入库，下次内容相同时才会跳过（payload_hashes 只含解析出数据的 kind）
+                unchanged = scraper.run_info.get("unchanged") or []
+                hashes = scraper.run_info.get("payload_hashes") or {}
+                db.mark_payloads_ingested([h for k, h in hashes.items() if k not in unchanged])
+            run["ingest_sec"] = time.perf_counter() - ingest_started
+            root.set(backend=scraper.last_backend, session=scraper.run_info.get("session"))
+        run["outcome"] = _classify_outcome(mode, result, scraper.run_info)
+    except Exception as e:
+        run["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        finished = datetime.now()
+        phases = {name: p["wall_sec"] for name, p in ((scraper.run_info.get("pacing") or {}).get("phases") or {}).items()}
+        if "ingest_sec" in run:
+            phases["ingest"] = round(run.pop("ingest_sec"), 3)
+        if "browser_launch_sec" in scraper.run_info:
+            phases["browser_launch"] = scraper.run_info["browser_launch_sec"]
+            if metrics:
+                metrics.observe_browser_launch(scraper.run_info["browser_launch_sec"])
+        run.update(
+            finished_at=finished,
+            duration_sec=(finished - started).total_seconds(),
+            backend=scraper.last_backend,
+            session=scraper.run_info.get("session"),
+            validation_path=scraper.run_info.get("validation_path"),
+            login_attempts=scraper.run_info.get("login_attempts", 0),
+            phases=phases,
+            rows_daily=n1,
+            rows_hourly=n2,
+        )
+        _record_run(db_path, run)
+        if metrics and metrics_dir:
+            try:
+                metrics.write_textfile(metrics_dir)
+            except Exception as e:
+                logger.warning(f"写入指标文件失败: {e}")
+    return {
+        "mode": mode,
+        "outcome": run["outcome"],
+        "backend": scraper.last_backend,
+        "fetched_daily": len(daily_rows),
+        "fetched_hourly": len(hourly_rows),
+        "unchanged": scraper.run_info.get("unchanged") or [],
+        "upsert": upserts,
+        "validation_path": scraper.run_info.get("validation_path"),
+        "session": scraper.run_info.get("session"),
+        "network": scraper.run_info.get("network"),
+        "nav_plan": scraper.run_info.get("nav_plan"),
+        "pacing": scraper.run_info.get("pacing"),
+    }
+
+def _classify_outcome(mode: str, result: Dict[str, Any], run_info: Dict[str, Any]) -> str:
+    """ok | unchanged | partial | no-data | login-failed（异常由调用方记为 error）"""
+    if not result and run_info.get("session") is None and run_info.get("login_attempts"):
+        return "login-failed"
+    wanted = ["daily", "hourly"] if mode == "both" else [mode]
+    unchanged = run_info.get("unchanged") or []
+    if all(k in unchanged for k in wanted):
+        return "unchanged"
+    got = [k for k in wanted if result.get(k) or k in unchanged]
+    if not got:
+        return "no-data"
+    return "ok" if len(got) == len(wanted) else "partial"
+
+def _record_run(db_path: str, run: Dict[str, Any]):
+    """写入 collection_runs；运行记录失败不影响采集本身"""
+    try:
+        with KyudenSQLite(Path(db_path)) as db:
+            db.init_schema()
+            db.record_run(run)
+    except Exception as e:
+        logger.warning(f"记录采集运行失败: {e}")
+
+def _next_hourly_run(now: datetime, minute: int) -> datetime:
+    """下一个整点 + minute 分（与 kyuden-hourly.timer 的节奏一致）"""
+    candidate = now.replace(minute=minute, second=0, microsecond=0)
+    if candidate <= now:
+        candidate += timedelta(hours=1)
+    return candidate
+
+def _next_daily_run(now: datetime, hour: int, minute: int) -> datetime:
+    """下一个 hour:minute（与 kyuden-daily.timer 的 01:05 一致）"""
+    candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if candidate <= now:
+        candidate += timedelta(days=1)
+    return candidate
+
+def _process_tree_rss_mb(root_pid: Optional[int] = None) -> Optional[float]:
+    """统计本进程及所有子孙进程（Playwright driver + Chromium）的 RSS，单位 MB。
+
+    依赖 /proc，非 Linux 平台返回 None（此时只按任务数回收浏览器）。
+    """
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return None
+    root_pid = root_pid or os.getpid()
+    children: Dict[int, list] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            # comm 字段可能含空格，取最后一个 ')' 之后的字段
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    total_kb = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            for line in (proc / str(pid) / "status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total_kb += int(line.split()[1])
+                    break
+        except (OSError, ValueError):
+            continue
+    return total_kb / 1024.0
+
+class CollectorDaemon:
+    """常驻采集进程：整个生命周期只持有一个 Playwright/Browser。
+
+    - 按内部 asyncio 计划执行 hourly / daily 任务
+    - 通过本地 Unix socket 接收即时触发（一行命令：daily | hourly | both | status）
+    - 累计任务数达到 recycle_after_jobs 或进程树 RSS 超过 recycle_rss_mb 时重启浏览器
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        db_path: str,
+        socket_path: str = DEFAULT_SOCKET_PATH,
+        hourly_minute: int = 5,
+        daily_at: str = "01:05",
+        recycle_after_jobs: int = 50,
+        recycle_rss_mb: Optional[float] = 1024.0,
+        headless: bool = True,
+        metrics_port: Optional[int] = None,
+        metrics_host: str = "127.0.0.1",
+    ):
+        self.username = username
+        self.password = password
+        self.db_path = db_path
+        self.socket_path = Path(socket_path)
+        self.hourly_minute = hourly_minute
+        daily_hour, daily_minute = (int(x) for x in daily_at.split(":"))
+        self.daily_hour = daily_hour
+        self.daily_minute = daily_minute
+        self.recycle_after_jobs = max(1, recycle_after_jobs)
+        self.recycle_rss_mb = recycle_rss_mb
+        self.headless = headless
+        self.metrics = CollectorMetrics(db_path)
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+
+        self._playwright = None
+        self.browser = None
+        self.jobs_since_launch = 0
+        self.jobs_total = 0
+        self.last_results: Dict[str, Dict[str, Any]] = {}
+        self._job_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
 
-    # 入库（幂等 UPSERT）
-    with KyudenSQLite(Path(db_path)) as db:
-        db.init_schema()
-        n1 = db.upsert_daily(daily_rows) if daily_rows else 0
-        n2 = db.upsert_hourly(hourly_rows) if hourly_rows else 0
-        logger.info(f"upsert daily={n1}, hourly={n2}")
+    async def start_browser(self):
+        from playwright.async_api import async_playwright
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        launch_started = time.perf_counter()
+        self.browser = await launch_chromium(self._playwright, headless=self.headless)
+        self.metrics.observe_browser_launch(time.perf_counter() - launch_started)
+        self.jobs_since_launch = 0
+        logger.info("常驻浏览器已启动")
+
+    async def stop_browser(self):
+        if self.browser:
+            try:
+                await self.browser.close()
+            except Exception as e:
+                logger.warning(f"关闭浏览器失败: {e}")
+            self.browser = None
+            logger.info("常驻浏览器已关闭")
+
+    async def shutdown(self):
+        await self.stop_browser()
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+            logger.info("Playwright 已停止")
+
+    async def _maybe_recycle(self):
+        """按任务数 / RSS 阈值回收浏览器"""
+        reason = None
+        if self.jobs_since_launch >= self.recycle_after_jobs:
+            reason = f"jobs={self.jobs_since_launch}"
+        elif self.recycle_rss_mb is not None:
+            rss = _process_tree_rss_mb()
+            if rss is not None and rss > self.recycle_rss_mb:
+                reason = f"rss={rss:.0f}MB"
+        if reason:
+            logger.info(f"回收浏览器（{reason}）")
+            await self.stop_browser()
+            await self.start_browser()
+
+    async def run_job(self, mode: str, hourly_target_date: Optional[str] = None) -> Dict[str, Any]:
+        """串行执行一次采集任务（同一时刻只跑一个任务）"""
+        async with self._job_lock:
+            if self.browser is None or not self.browser.is_connected():
+                await self.start_browser()
+            started = datetime.now()
+            try:
+                summary = await run_collect(
+                    self.username, self.password, mode, hourly_target_date, self.db_path,
+                    browser=self.browser, metrics=self.metrics,
+                )
+                summary["ok"] = True
+            except Exception as e:
+                logger.error(f"采集任务失败 mode={mode}: {e}")
+                summary = {"mode": mode, "ok": False, "error": str(e)}
+            summary["started_at"] = started.isoformat()
+            summary["elapsed_sec"] = round((datetime.now() - started).total_seconds(), 3)
+            self.jobs_since_launch += 1
+            self.jobs_total += 1
+            self.last_results[mode] = summary
+            await self._maybe_recycle()
+            return summary
+
+    async def _schedule_loop(self, mode: str, next_run):
+        while not self._stop.is_set():
+            due = next_run(datetime.now())
+            wait = max(0.0, (due - datetime.now()).total_seconds())
+            logger.info(f"下一次 {mode} 任务: {due.isoformat(timespec='seconds')}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=wait)
+                return
+            except asyncio.TimeoutError:
+                pass
+            await self.run_job(mode)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "browser_connected": bool(self.browser and self.browser.is_connected()),
+            "jobs_since_launch": self.jobs_since_launch,
+            "jobs_total": self.jobs_total,
+            "rss_mb": _process_tree_rss_mb(),
+            "last_results": self.last_results,
+        }
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = (await reader.readline()).decode().strip()
+            parts = line.split()
+            cmd = parts[0] if parts else ""
+            if cmd in ("daily", "hourly", "both"):
+                target = parts[1] if len(parts) > 1 else None
+                reply = await self.run_job(cmd, hourly_target_date=target)
+            elif cmd == "status":
+                reply = self.status()
+            else:
+                reply = {"ok": False, "error": f"unknown command: {line!r}"}
+            writer.write((json.dumps(reply, ensure_ascii=False, default=str) + "\n").encode())
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"处理 socket 请求失败: {e}")
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except NotImplementedError:
+                pass
+
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        server = await asyncio.start_unix_server(self._handle_client, path=str(self.socket_path))
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"常驻模式已启动，socket: {self.socket_path}")
+        metrics_server = None
+        if self.metrics_port:
+            metrics_server = await self.metrics.serve(self.metrics_host, self.metrics_port)
+
+        await self.start_browser()
+        tasks = [
+            asyncio.create_task(self._schedule_loop(
+                "hourly", lambda now: _next_hourly_run(now, self.hourly_minute))),
+            asyncio.create_task(self._schedule_loop(
+                "daily", lambda now: _next_daily_run(now, self.daily_hour, self.daily_minute))),
+        ]
+        try:
+            await self._stop.wait()
+        finally:
+            logger.info("收到停止信号，退出常驻模式")
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            server.close()
+            await server.wait_closed()
+            if metrics_server is not None:
+                metrics_server.close()
+                await metrics_server.wait_closed()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+            await self.shutdown()
+
+async def send_trigger(socket_path: str, command: str) -> Dict[str, Any]:
+    """向常驻进程发送一行命令并返回其 JSON 回复"""
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    writer.write((command + "\n").encode())
+    await writer.drain()
+    line = await reader.readline()
+    writer.close()
+    return json.loads(line.decode() or "{}")
 
 def main():
     import argparse
@@ -46,9 +424,80 @@ def main():
     parser.add_argument("-m", "--mode", choices=["daily", "hourly", "both"], default="hourly")
     parser.add_argument("--hourly-date", help="小时数据归属日期（YYYY-MM-DD）")
     parser.add_argument("--db", default=str(DEFAULT_DB_PATH), help="SQLite 文件路径")
+    parser.add_argument("--daemon", action="store_true", help="常驻模式：复用同一个浏览器，内部定时执行 hourly/daily")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="常驻模式的 Unix socket 路径")
+    parser.add_argument("--hourly-minute", type=int, default=5, help="常驻模式下每小时第几分钟执行 hourly")
+    parser.add_argument("--daily-at", default="01:05", help="常驻模式下每日执行 daily 的时间（HH:MM）")
+    parser.add_argument("--recycle-after-jobs", type=int, default=int(os.getenv("KYUDEN_RECYCLE_JOBS", "50")),
+                        help="执行多少次任务后重启浏览器")
+    parser.add_argument("--recycle-rss-mb", type=float, default=float(os.getenv("KYUDEN_RECYCLE_RSS_MB", "1024")),
+                        help="进程树 RSS 超过该值（MB）后重启浏览器，<=0 表示不检查")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("KYUDEN_METRICS_PORT", "0")),
+                        help="常驻模式下在该端口提供 Prometheus /metrics（0 表示不启用）")
+    parser.add_argument("--metrics-host", default=os.getenv("KYUDEN_METRICS_HOST", "127.0.0.1"))
+    parser.add_argument("--trigger", metavar="COMMAND",
+                        help="向已运行的常驻进程发送命令（daily | hourly | both | status）后退出")
+    sub = parser.add_subparsers(dest="command")
+    bf = sub.add_parser("backfill", help="回填历史小时数据（可中断续跑）")
+    bf.add_argument("--from", dest="date_from", required=True, help="起始日期 YYYY-MM-DD")
+    bf.add_argument("--to", dest="date_to", default=None, help="结束日期 YYYY-MM-DD（默认昨天）")
+    bf.add_argument("--day-interval", type=float, default=5.0, help="两次翻页请求之间的最小间隔（秒）")
+    bf.add_argument("--job", default=None, help="检查点任务名（默认按日期区间生成）")
+    hs = sub.add_parser("history", help="逐期后退爬取每日历史数据，遇到库中已有的周期即停止")
+    hs.add_argument("--max-periods", type=int, default=24, help="最多后退多少个账单周期")
+    hs.add_argument("--period-interval", type=float, default=5.0, help="两次翻页请求之间的最小间隔（秒）")
     args = parser.parse_args()
+    configure_tracing(os.getenv("KYUDEN_TRACE"))
+
+    if args.command == "history":
+        from backfill import DailyHistoryCrawler
+        crawler = DailyHistoryCrawler(
+            args.username, args.password, args.db,
+            storage_state_path=os.getenv("KYUDEN_STATE", ".kyuden_storage_state.json"),
+            max_periods=args.max_periods,
+            period_interval_sec=args.period_interval,
+            pacing=os.getenv("KYUDEN_PACING", "normal"),
+        )
+        stats = asyncio.run(crawler.run())
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return
+
+    if args.command == "backfill":
+        from backfill import HourlyBackfill
+        date_to = date.fromisoformat(args.date_to) if args.date_to else date.today() - timedelta(days=1)
+        job = HourlyBackfill(
+            args.username, args.password, args.db,
+            start=date.fromisoformat(args.date_from),
+            end=date_to,
+            storage_state_path=os.getenv("KYUDEN_STATE", ".kyuden_storage_state.json"),
+            day_interval_sec=args.day_interval,
+            job=args.job,
+            pacing=os.getenv("KYUDEN_PACING", "normal"),
+        )
+        stats = asyncio.run(job.run())
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return
+
+    if args.trigger:
+        reply = asyncio.run(send_trigger(args.socket, args.trigger))
+        print(json.dumps(reply, ensure_ascii=False, indent=2))
+        sys.exit(0 if reply.get("ok", True) else 1)
+
+    if args.daemon:
+        daemon = CollectorDaemon(
+            args.username, args.password, args.db,
+            socket_path=args.socket,
+            hourly_minute=args.hourly_minute,
+            daily_at=args.daily_at,
+            recycle_after_jobs=args.recycle_after_jobs,
+            recycle_rss_mb=args.recycle_rss_mb if args.recycle_rss_mb > 0 else None,
+            metrics_port=args.metrics_port or None,
+            metrics_host=args.metrics_host,
+        )
+        asyncio.run(daemon.serve_forever())
+        return
 
     asyncio.run(run_collect(args.username, args.password, args.mode, args.hourly_date, args.db))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,126 @@
+"""
+列式解析：把图表 JSON 的 columns / shiyoKikan 直接转成定长类型数组，不为每个数据点构造 dict
+
+- 日期存为 date.toordinal() 的 array('l')，小时为 array('b')，用电量为 array('d')
+- 整批只取一次抓取时间 fetched_at
+- KyudenSQLite.upsert_daily / upsert_hourly 直接接受 UsageColumns
+- 安装了 NumPy 时可用 to_numpy() 零拷贝得到 ndarray（NumPy 不是必需依赖）
+
+年份推断规则与 KyudenScraper.parse_usage_data 共用 infer_year
+"""
+
+from array import array
+from datetime import date, datetime
+from typing import Optional, Dict, Any, Iterator, Tuple
+
+def infer_year(month: int, day: int, reference_date: Optional[date], today: date) -> int:
+    """
+    图表只给出“月/日”，按以下规则推断年份:
+    - 有 reference_date 时：该日期不晚于 reference_date
+    - 否则按当前月份推断（跨年的账单周期）
+    """
+    if reference_date is not None:
+        year = reference_date.year
+        if (month, day) > (reference_date.month, reference_date.day):
+            year -= 1
+        return year
+    year = today.year
+    if month < today.month:
+        year = today.year + 1
+    elif month > today.month:
+        year = today.year - 1
+    if today.month == 9 and month == 8:
+        year = today.year
+    return year
+
+class UsageColumns:
+    """一批用电量数据的列式表示（daily 时 hours 为 None）"""
+
+    __slots__ = ("days", "hours", "usage", "fetched_at")
+
+    def __init__(self, days: array, usage: array, hours: Optional[array] = None,
+                 fetched_at: Optional[datetime] = None):
+        if len(days) != len(usage) or (hours is not None and len(hours) != len(days)):
+            raise ValueError("列长度不一致")
+        self.days = days
+        self.usage = usage
+        self.hours = hours
+        self.fetched_at = fetched_at or datetime.now()
+
+    def __len__(self) -> int:
+        return len(self.usage)
+
+    def __bool__(self) -> bool:
+        return len(self.usage) > 0
+
+    @property
+    def is_hourly(self) -> bool:
+        return self.hours is not None
+
+    def min_date(self) -> date:
+        return date.fromordinal(min(self.days))
+
+    def max_date(self) -> date:
+        return date.fromordinal(max(self.days))
+
+    def db_params(self) -> Iterator[Tuple]:
+        """逐行产出 upsert 用的参数元组：(date, usage, fetched_at) 或 (date, hour, usage, fetched_at)"""
+        ts = self.fetched_at.isoformat()
+        iso: Dict[int, str] = {}
+        if self.hours is None:
+            for d, u in zip(self.days, self.usage):
+                yield (iso.get(d) or iso.setdefault(d, date.fromordinal(d).isoformat()), u, ts)
+        else:
+            for d, h, u in zip(self.days, self.hours, self.usage):
+                yield (iso.get(d) or iso.setdefault(d, date.fromordinal(d).isoformat()), h, u, ts)
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """{'date': datetime64[D], 'hour': int8, 'usage_kwh': float64}（需要 NumPy）"""
+        import numpy as np
+        # 0001-01-01 的 ordinal 为 1，而 datetime64[D] 以 1970-01-01 为 0
+        epoch = date(1970, 1, 1).toordinal()
+        out = {
+            "date": (np.frombuffer(self.days, dtype=np.dtype(f"i{self.days.itemsize}")) - epoch).astype("datetime64[D]"),
+            "usage_kwh": np.frombuffer(self.usage, dtype=np.float64),
+        }
+        if self.hours is not None:
+            out["hour"] = np.frombuffer(self.hours, dtype=np.int8)
+        return out
+
+    def to_rows(self):
+        """还原为 parse_usage_data / parse_hourly_usage_data 的记录结构（UsageBatch）"""
+        from records import DailyUsage, HourlyUsage, UsageBatch
+        batch = UsageBatch("hourly" if self.hours is not None else "daily", fetched_at=self.fetched_at)
+        for i, d in enumerate(self.days):
+            day = date.fromordinal(d)
+            if self.hours is None:
+                batch.append(DailyUsage(day, f"{day.month}/{day.day}", self.usage[i], self.fetched_at))
+            else:
+                batch.append(HourlyUsage(day, day.isoformat(), self.hours[i], self.usage[i], self.fetched_at))
+        return batch
+
+def parse_daily_columns(data: Dict[str, Any], reference_date: Optional[date] = None,
+                        fetched_at: Optional[datetime] = None) -> UsageColumns:
+    fetched_at = fetched_at or datetime.now()
+    today = fetched_at.date()
+    days, usage = array("l"), array("d")
+    for date_str, value in zip(data["shiyoKikan"][1:], data["columns"][0][1:]):
+        if value is None or "/" not in date_str:
+            continue
+        month, day = map(int, date_str.split("/"))
+        days.append(date(infer_year(month, day, reference_date, today), month, day).toordinal())
+        usage.append(float(value))
+    return UsageColumns(days, usage, fetched_at=fetched_at)
+
+def parse_hourly_columns(data: Dict[str, Any], target_date: Optional[date] = None,
+                         fetched_at: Optional[datetime] = None) -> UsageColumns:
+    fetched_at = fetched_at or datetime.now()
+    ordinal = (target_date or date.today()).toordinal()
+    columns = data.get("columns") or [[]]
+    hours, usage = array("b"), array("d")
+    for hour, value in enumerate(columns[0][1:]):
+        if value is None:
+            continue
+        hours.append(hour)
+        usage.append(float(value))
+    return UsageColumns(array("l", [ordinal]) * len(hours), usage, hours=hours, fetched_at=fetched_at)
@@ -1,16 +1,54 @@
+import os
+import json
+import time
+import math
+import calendar
+import zlib
+import hashlib
 import sqlite3
+from array import array
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Dict, Any, Optional, List
-from datetime import datetime, date
+from typing import Iterable, Dict, Any, Optional, List, Union, Tuple, Iterator
+from datetime import datetime, date, timedelta
+
+from columnar import UsageColumns, parse_daily_columns, parse_hourly_columns
+from records import UsageBatch, DailyUsage, HourlyUsage
 
 DEFAULT_DB_PATH = Path("/data/kyuden_usage.db")
 
-DDL_STATEMENTS = [
+# 用电量表的结构版本（PRAGMA user_version）:
+# 1 = daily_usage / hourly_usage 以 ISO 日期字符串为主键，每行重复完整的 fetched_at
+# 2 = daily_usage_v2 / hourly_usage_v2 以纪元日（1970-01-01 = 0）和小时为 WITHOUT ROWID 主键，
+#     抓取时间去重到 fetch_batches；daily_usage / hourly_usage 成为保留原列名的只读兼容视图
+# 3 = daily_usage_v3 / hourly_usage_v3 在版本 2 的基础上以账号开头：(account, day[, hour])，
+#     汇总表同样按账号划分；兼容视图只显示默认账号
+# 新建的库直接使用最新版本，旧库用 `db.py --migrate` 在线迁移；版本 1 / 2 的库只支持默认账号
+SCHEMA_VERSION = 3
+DEFAULT_ACCOUNT_ID = 1
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_JD_EPOCH = 2440587.5  # julianday('1970-01-01')
+_EPOCH_OF = f"CAST(julianday({{d}}) - {_JD_EPOCH} AS INTEGER)"  # ISO 日期 -> 纪元日
+_DATE_OF = f"date({{d}} + {_JD_EPOCH})"                         # 纪元日 -> ISO 日期
+
+_LAST_SEEN_DDL_UNSCOPED = """
+    CREATE TABLE IF NOT EXISTS usage_last_seen (
+        kind TEXT PRIMARY KEY,              -- daily | hourly
+        seen_at TEXT NOT NULL,              -- 最近一次 upsert 批次的抓取时间（无论数据是否变化）
+        first_date TEXT NOT NULL,           -- 该批次覆盖的日期范围
+        last_date TEXT NOT NULL,
+        rows INTEGER NOT NULL
+    );
+    """
+
+USAGE_DDL = {
+    1: [
+    _LAST_SEEN_DDL_UNSCOPED,
     """
     CREATE TABLE IF NOT EXISTS daily_usage (
         date TEXT PRIMARY KEY,              -- ISO 日期（JST），YYYY-MM-DD
         usage_kwh REAL NOT NULL,
-        fetched_at TEXT NOT NULL            -- ISO 时间戳
+        fetched_at TEXT NOT NULL            -- ISO 时间戳：该值最近一次写入 / 变化时的抓取时间
     );
     """,
     """
@@ -22,9 +60,599 @@ DDL_STATEMENTS = [
         PRIMARY KEY (date, hour)
     );
     """,
+    ],
+    2: [
+    _LAST_SEEN_DDL_UNSCOPED,
+    """
+    CREATE TABLE IF NOT EXISTS fetch_batches (
+        id INTEGER PRIMARY KEY,
+        fetched_at TEXT NOT NULL UNIQUE     -- ISO 时间戳，每个抓取批次只存一次
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_usage_v2 (
+        day INTEGER PRIMARY KEY,            -- 纪元日：JST 日期距 1970-01-01 的天数
+        usage_kwh REAL NOT NULL,
+        batch INTEGER NOT NULL              -- fetch_batches.id：该值最近一次写入 / 变化时的抓取批次
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hourly_usage_v2 (
+        day INTEGER NOT NULL,
+        hour INTEGER NOT NULL,              -- 0..23
+        usage_kwh REAL NOT NULL,
+        batch INTEGER NOT NULL,
+        PRIMARY KEY (day, hour)
+    ) WITHOUT ROWID;
+    """,
+    ],
+    3: [
+    """
+    CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,          -- 账号名（fleet.py 的 name），id=1 为默认账号
+        created_at TEXT NOT NULL
+    );
+    """,
+    f"""
+    INSERT OR IGNORE INTO accounts (id, name, created_at)
+    VALUES ({DEFAULT_ACCOUNT_ID}, 'default', strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'));
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS fetch_batches (
+        id INTEGER PRIMARY KEY,
+        fetched_at TEXT NOT NULL UNIQUE     -- ISO 时间戳，每个抓取批次只存一次
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_usage_v3 (
+        account INTEGER NOT NULL,           -- accounts.id
+        day INTEGER NOT NULL,               -- 纪元日
+        usage_kwh REAL NOT NULL,
+        batch INTEGER NOT NULL,             -- fetch_batches.id
+        PRIMARY KEY (account, day)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hourly_usage_v3 (
+        account INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        hour INTEGER NOT NULL,              -- 0..23
+        usage_kwh REAL NOT NULL,
+        batch INTEGER NOT NULL,
+        PRIMARY KEY (account, day, hour)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hourly_compacted (
+        account INTEGER NOT NULL,
+        day INTEGER NOT NULL,               -- 纪元日
+        usage_kwh REAL NOT NULL,            -- 压缩前该日 hourly_usage_v3 的 SUM(usage_kwh)
+        hours INTEGER NOT NULL,             -- 压缩前的小时数
+        compacted_at TEXT NOT NULL,
+        PRIMARY KEY (account, day)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS usage_last_seen (
+        account INTEGER NOT NULL,           -- accounts.id
+        kind TEXT NOT NULL,                 -- daily | hourly
+        seen_at TEXT NOT NULL,              -- 该账号最近一次 upsert 批次的抓取时间（无论数据是否变化）
+        first_date TEXT NOT NULL,           -- 该批次覆盖的日期范围
+        last_date TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        PRIMARY KEY (account, kind)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hourly_retention (
+        account INTEGER PRIMARY KEY,
+        compacted_before INTEGER NOT NULL,  -- 纪元日：早于该日的 hourly 数据已压缩进 hourly_compacted
+        keep_months INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """,
+    ],
+}
+
+# 兼容视图：列名与版本 1 的表相同，供外部脚本 / 手写 SQL 继续读取（不可写入）
+COMPAT_VIEWS = {
+    2: [
+    f"""
+    CREATE VIEW IF NOT EXISTS daily_usage AS
+    SELECT {_DATE_OF.format(d="d.day")} AS date, d.usage_kwh AS usage_kwh, b.fetched_at AS fetched_at
+    FROM daily_usage_v2 d JOIN fetch_batches b ON b.id = d.batch;
+    """,
+    f"""
+    CREATE VIEW IF NOT EXISTS hourly_usage AS
+    SELECT {_DATE_OF.format(d="h.day")} AS date, h.hour AS hour, h.usage_kwh AS usage_kwh, b.fetched_at AS fetched_at
+    FROM hourly_usage_v2 h JOIN fetch_batches b ON b.id = h.batch;
+    """,
+    ],
+    3: [
+    f"""
+    CREATE VIEW IF NOT EXISTS daily_usage AS
+    SELECT {_DATE_OF.format(d="d.day")} AS date, d.usage_kwh AS usage_kwh, b.fetched_at AS fetched_at
+    FROM daily_usage_v3 d JOIN fetch_batches b ON b.id = d.batch WHERE d.account = {DEFAULT_ACCOUNT_ID};
+    """,
+    f"""
+    CREATE VIEW IF NOT EXISTS hourly_usage AS
+    SELECT {_DATE_OF.format(d="h.day")} AS date, h.hour AS hour, h.usage_kwh AS usage_kwh, b.fetched_at AS fetched_at
+    FROM hourly_usage_v3 h JOIN fetch_batches b ON b.id = h.batch WHERE h.account = {DEFAULT_ACCOUNT_ID};
+    """,
+    ],
+}
+
+# upsert 的目标：(表名, 主键列, 抓取时间列)
+USAGE_TABLES = {
+    1: {"daily": ("daily_usage", ("date",), "fetched_at"),
+        "hourly": ("hourly_usage", ("date", "hour"), "fetched_at")},
+    2: {"daily": ("daily_usage_v2", ("day",), "batch"),
+        "hourly": ("hourly_usage_v2", ("day", "hour"), "batch")},
+    3: {"daily": ("daily_usage_v3", ("account", "day"), "batch"),
+        "hourly": ("hourly_usage_v3", ("account", "day", "hour"), "batch")},
+}
+
+DDL_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+        job TEXT NOT NULL,                  -- 回填任务名，例如 hourly:2025-01-01:2025-03-31
+        date TEXT NOT NULL,                 -- 已处理的日期（ISO）
+        status TEXT NOT NULL,               -- done | empty | failed
+        rows INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (job, date)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS collection_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at TEXT NOT NULL,           -- ISO 时间戳
+        finished_at TEXT NOT NULL,
+        duration_sec REAL NOT NULL,
+        mode TEXT NOT NULL,                 -- daily | hourly | both
+        outcome TEXT NOT NULL,              -- ok | unchanged | partial | no-data | login-failed | error
+        backend TEXT,                       -- browser | http
+        session TEXT,                       -- reused | fresh-login | NULL（未登录成功）
+        validation_path TEXT,               -- 登录态校验路径（cookie / probe / dom / http-fetch）
+        login_attempts INTEGER NOT NULL DEFAULT 0,
+        phases TEXT,                        -- JSON: {阶段名: 墙钟秒数}
+        rows_daily INTEGER NOT NULL DEFAULT 0,     -- 实际写入（新增 + 更新）的行数
+        rows_hourly INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_collection_runs_started ON collection_runs (started_at);",
+    """
+    CREATE TABLE IF NOT EXISTS raw_payloads (
+        hash TEXT NOT NULL,                 -- 规范化 JSON 的 SHA-256
+        kind TEXT NOT NULL,                 -- daily | hourly
+        target_date TEXT NOT NULL DEFAULT '',  -- hourly 的日期归属（ISO），daily 为 ''
+        first_fetched_at TEXT NOT NULL,
+        last_fetched_at TEXT NOT NULL,
+        fetch_count INTEGER NOT NULL DEFAULT 1,
+        ingested_at TEXT,                   -- 最近一次解析入库的时间，NULL 表示尚未入库
+        raw_size INTEGER NOT NULL,          -- 未压缩字节数
+        payload BLOB NOT NULL,              -- zlib 压缩的规范化 JSON
+        -- 同样的字节可能属于不同日期（例如全零的 hourly 日），每个日期各存一行，日期归属从不改写
+        PRIMARY KEY (hash, kind, target_date)
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_raw_payloads_ingested ON raw_payloads (kind, ingested_at);",
     # 可选索引（主键已覆盖最常见查询）
 ]
 
+# 读取路径专用索引：覆盖索引让范围查询 / 按小时聚合只读索引页，不回表
+# 版本 2 的表本身按 (day, hour) 聚簇存放，范围查询直接扫主键，只需要峰值索引（自动附带主键列）
+READ_INDEXES = {
+    1: [
+        "CREATE INDEX IF NOT EXISTS idx_hourly_range ON hourly_usage (date, hour, usage_kwh);",
+        "CREATE INDEX IF NOT EXISTS idx_hourly_peak ON hourly_usage (usage_kwh DESC, date, hour);",
+        "CREATE INDEX IF NOT EXISTS idx_daily_range ON daily_usage (date, usage_kwh);",
+    ],
+    2: [
+        "CREATE INDEX IF NOT EXISTS idx_hourly_v2_peak ON hourly_usage_v2 (usage_kwh DESC);",
+    ],
+    # 账号打头：每个账号的峰值查询只读该账号的索引段
+    3: [
+        "CREATE INDEX IF NOT EXISTS idx_hourly_v3_peak ON hourly_usage_v3 (account, usage_kwh DESC);",
+    ],
+}
+
+# 读取 SQL 固定为模块常量：sqlite3 按 SQL 文本缓存预编译语句，相同文本的重复调用不再重新 prepare
+_MIN_DATE, _MAX_DATE = "0000-01-01", "9999-12-31"
+SQL_DAILY_RANGE = (
+    "SELECT date, usage_kwh, fetched_at FROM daily_usage "
+    "WHERE date BETWEEN ? AND ? ORDER BY date;"
+)
+SQL_HOURLY_RANGE = (
+    "SELECT date, hour, usage_kwh, fetched_at FROM hourly_usage "
+    "WHERE date BETWEEN ? AND ? ORDER BY date, hour;"
+)
+SQL_HOUR_PROFILE = (
+    "SELECT hour, AVG(usage_kwh), MIN(usage_kwh), MAX(usage_kwh), COUNT(*) "
+    "FROM hourly_usage INDEXED BY idx_hourly_range WHERE date BETWEEN ? AND ? GROUP BY hour ORDER BY hour;"
+)
+SQL_TOP_PEAKS = (
+    "SELECT date, hour, usage_kwh, fetched_at FROM hourly_usage "
+    "WHERE date BETWEEN ? AND ? ORDER BY usage_kwh DESC, date, hour LIMIT ?;"
+)
+# 限定了日期范围时，先按范围取行再排序，比沿 idx_hourly_peak 扫描整张表过滤日期更省
+SQL_TOP_PEAKS_IN_RANGE = (
+    "SELECT date, hour, usage_kwh, fetched_at FROM hourly_usage INDEXED BY idx_hourly_range "
+    "WHERE date BETWEEN ? AND ? ORDER BY usage_kwh DESC, date, hour LIMIT ?;"
+)
+SQL_DAILY_TOTALS = (
+    "SELECT date, usage_kwh, hours FROM hourly_daily_totals "
+    "WHERE date BETWEEN ? AND ? ORDER BY date;"
+)
+
+# 批量读取：日期在 SQL 中直接换算为 date.toordinal()（julianday('0001-01-01') = 1721425.5），
+# Python 侧不再逐格解析 TEXT 日期
+_ORDINAL_OF = "CAST(julianday({d}) - 1721424.5 AS INTEGER)"
+SQL_HOURLY_COLUMNS = (
+    f"SELECT {_ORDINAL_OF.format(d='date')}, hour, usage_kwh FROM hourly_usage INDEXED BY idx_hourly_range "
+    "WHERE date BETWEEN ? AND ? ORDER BY date, hour;"
+)
+SQL_DAILY_COLUMNS = (
+    f"SELECT {_ORDINAL_OF.format(d='date')}, usage_kwh FROM daily_usage INDEXED BY idx_daily_range "
+    "WHERE date BETWEEN ? AND ? ORDER BY date;"
+)
+
+# 按结构版本选用的 SQL；版本 2 的日期参数为纪元日。
+# 逐行读取时版本 2 直接返回纪元日与批次 id（不 JOIN、不在 SQL 里格式化日期），由 _decoders() 在 Python 侧缓存换算
+# usage_last_seen 的读写：版本 3 按 (account, kind) 记录，更早的版本只有默认账号
+_SQL_RECORD_SEEN_UNSCOPED = """
+    INSERT INTO usage_last_seen (kind, seen_at, first_date, last_date, rows)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(kind) DO UPDATE SET
+        seen_at=excluded.seen_at, first_date=excluded.first_date,
+        last_date=excluded.last_date, rows=excluded.rows;
+    """
+_SQL_LAST_SEEN_UNSCOPED = "SELECT kind, seen_at, first_date, last_date, rows FROM usage_last_seen;"
+
+SQL_BY_VERSION = {
+    1: {
+        "daily_range": SQL_DAILY_RANGE,
+        "hourly_range": SQL_HOURLY_RANGE,
+        "hour_profile": SQL_HOUR_PROFILE,
+        "top_peaks": SQL_TOP_PEAKS,
+        "top_peaks_in_range": SQL_TOP_PEAKS_IN_RANGE,
+        "hourly_columns": SQL_HOURLY_COLUMNS,
+        "daily_columns": SQL_DAILY_COLUMNS,
+        "daily_dates": "SELECT date FROM daily_usage WHERE date BETWEEN ? AND ?;",
+        "hourly_complete_days": "SELECT date FROM hourly_usage WHERE date BETWEEN ? AND ? GROUP BY date HAVING COUNT(*) >= ?;",
+        "latest_daily": "SELECT MAX(date) FROM daily_usage;",
+        "latest_hourly": "SELECT date, hour FROM hourly_usage ORDER BY date DESC, hour DESC LIMIT 1;",
+        "daily_totals": SQL_DAILY_TOTALS,
+        "existing_daily": "SELECT date, usage_kwh FROM daily_usage WHERE date BETWEEN ? AND ?;",
+        "existing_hourly": "SELECT date, hour, usage_kwh FROM hourly_usage WHERE date BETWEEN ? AND ?;",
+        "record_seen": _SQL_RECORD_SEEN_UNSCOPED,
+        "last_seen": _SQL_LAST_SEEN_UNSCOPED,
+    },
+    2: {
+        "daily_range": "SELECT day, usage_kwh, batch FROM daily_usage_v2 WHERE day BETWEEN ? AND ? ORDER BY day;",
+        "hourly_range": "SELECT day, hour, usage_kwh, batch FROM hourly_usage_v2 WHERE day BETWEEN ? AND ? ORDER BY day, hour;",
+        "hour_profile": (
+            "SELECT hour, AVG(usage_kwh), MIN(usage_kwh), MAX(usage_kwh), COUNT(*) "
+            "FROM hourly_usage_v2 WHERE day BETWEEN ? AND ? GROUP BY hour ORDER BY hour;"
+        ),
+        "top_peaks": (
+            "SELECT day, hour, usage_kwh, batch FROM hourly_usage_v2 INDEXED BY idx_hourly_v2_peak "
+            "WHERE day BETWEEN ? AND ? ORDER BY usage_kwh DESC, day, hour LIMIT ?;"
+        ),
+        # +usage_kwh 让排序不走峰值索引，改为按主键取范围内的行
+        "top_peaks_in_range": (
+            "SELECT day, hour, usage_kwh, batch FROM hourly_usage_v2 "
+            "WHERE day BETWEEN ? AND ? ORDER BY +usage_kwh DESC, day, hour LIMIT ?;"
+        ),
+        "hourly_columns": f"SELECT day + {_EPOCH_ORDINAL}, hour, usage_kwh FROM hourly_usage_v2 WHERE day BETWEEN ? AND ? ORDER BY day, hour;",
+        "daily_columns": f"SELECT day + {_EPOCH_ORDINAL}, usage_kwh FROM daily_usage_v2 WHERE day BETWEEN ? AND ? ORDER BY day;",
+        "daily_dates": f"SELECT {_DATE_OF.format(d='day')} FROM daily_usage_v2 WHERE day BETWEEN ? AND ?;",
+        "hourly_complete_days": (
+            f"SELECT {_DATE_OF.format(d='day')} FROM hourly_usage_v2 WHERE day BETWEEN ? AND ? "
+            "GROUP BY day HAVING COUNT(*) >= ?;"
+        ),
+        "latest_daily": f"SELECT {_DATE_OF.format(d='MAX(day)')} FROM daily_usage_v2;",
+        "latest_hourly": f"SELECT {_DATE_OF.format(d='day')}, hour FROM hourly_usage_v2 ORDER BY day DESC, hour DESC LIMIT 1;",
+        "daily_totals": SQL_DAILY_TOTALS,
+        "existing_daily": "SELECT day, usage_kwh FROM daily_usage_v2 WHERE day BETWEEN ? AND ?;",
+        "existing_hourly": "SELECT day, hour, usage_kwh FROM hourly_usage_v2 WHERE day BETWEEN ? AND ?;",
+        "record_seen": _SQL_RECORD_SEEN_UNSCOPED,
+        "last_seen": _SQL_LAST_SEEN_UNSCOPED,
+    },
+    # 版本 3：第一个参数为账号 id，所有范围查询都落在 (account, day) 主键前缀上
+    3: {
+        "daily_range": "SELECT day, usage_kwh, batch FROM daily_usage_v3 WHERE account = ? AND day BETWEEN ? AND ? ORDER BY day;",
+        "hourly_range": (
+            "SELECT day, hour, usage_kwh, batch FROM hourly_usage_v3 "
+            "WHERE account = ? AND day BETWEEN ? AND ? ORDER BY day, hour;"
+        ),
+        "hour_profile": (
+            "SELECT hour, AVG(usage_kwh), MIN(usage_kwh), MAX(usage_kwh), COUNT(*) "
+            "FROM hourly_usage_v3 WHERE account = ? AND day BETWEEN ? AND ? GROUP BY hour ORDER BY hour;"
+        ),
+        "top_peaks": (
+            "SELECT day, hour, usage_kwh, batch FROM hourly_usage_v3 INDEXED BY idx_hourly_v3_peak "
+            "WHERE account = ? AND day BETWEEN ? AND ? ORDER BY usage_kwh DESC, day, hour LIMIT ?;"
+        ),
+        "top_peaks_in_range": (
+            "SELECT day, hour, usage_kwh, batch FROM hourly_usage_v3 "
+            "WHERE account = ? AND day BETWEEN ? AND ? ORDER BY +usage_kwh DESC, day, hour LIMIT ?;"
+        ),
+        "hourly_columns": (
+            f"SELECT day + {_EPOCH_ORDINAL}, hour, usage_kwh FROM hourly_usage_v3 "
+            "WHERE account = ? AND day BETWEEN ? AND ? ORDER BY day, hour;"
+        ),
+        "daily_columns": (
+            f"SELECT day + {_EPOCH_ORDINAL}, usage_kwh FROM daily_usage_v3 "
+            "WHERE account = ? AND day BETWEEN ? AND ? ORDER BY day;"
+        ),
+        "daily_dates": f"SELECT {_DATE_OF.format(d='day')} FROM daily_usage_v3 WHERE account = ? AND day BETWEEN ? AND ?;",
+        "hourly_complete_days": (
+            f"SELECT {_DATE_OF.format(d='day')} FROM hourly_usage_v3 WHERE account = ? AND day BETWEEN ? AND ? "
+            "GROUP BY day HAVING COUNT(*) >= ? "
+            f"UNION SELECT {_DATE_OF.format(d='day')} FROM hourly_compacted WHERE account = ? AND day BETWEEN ? AND ? "
+            "AND hours >= ?;"
+        ),
+        "latest_daily": f"SELECT {_DATE_OF.format(d='MAX(day)')} FROM daily_usage_v3 WHERE account = ?;",
+        "latest_hourly": (
+            f"SELECT {_DATE_OF.format(d='day')}, hour FROM hourly_usage_v3 "
+            "WHERE account = ? ORDER BY day DESC, hour DESC LIMIT 1;"
+        ),
+        "daily_totals": (
+            "SELECT date, usage_kwh, hours FROM hourly_daily_totals "
+            "WHERE account = ? AND date BETWEEN ? AND ? ORDER BY date;"
+        ),
+        "existing_daily": "SELECT day, usage_kwh FROM daily_usage_v3 WHERE account = ? AND day BETWEEN ? AND ?;",
+        "existing_hourly": "SELECT day, hour, usage_kwh FROM hourly_usage_v3 WHERE account = ? AND day BETWEEN ? AND ?;",
+        "record_seen": """
+            INSERT INTO usage_last_seen (account, kind, seen_at, first_date, last_date, rows)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(account, kind) DO UPDATE SET
+                seen_at=excluded.seen_at, first_date=excluded.first_date,
+                last_date=excluded.last_date, rows=excluded.rows;
+            """,
+        "last_seen": "SELECT kind, seen_at, first_date, last_date, rows FROM usage_last_seen WHERE account = ?;",
+    },
+}
+_MIN_DAY, _MAX_DAY = date.min.toordinal() - _EPOCH_ORDINAL, date.max.toordinal() - _EPOCH_ORDINAL
+
+# 汇总表：由触发器在 upsert 的同一事务内按受影响的键重新求和，rebuild_rollups() 可从头重建
+ROLLUP_TABLES = ("hourly_daily_totals", "weekly_usage", "monthly_usage")
+
+# 周以周一开始：date(d, 'weekday 0', '-6 days') 即 d 所在周的周一
+_WEEK_OF = "date({d}, 'weekday 0', '-6 days')"
+_MONTH_OF = "substr({d}, 1, 7)"
+
+# 汇总键在日期上的范围（ISO 日期表达式，{k} 为汇总键），触发器据此按主键范围重新求和
+_WEEK_SPAN = ("{k}", "date({k}, '+6 days')")
+_MONTH_SPAN = ("{k} || '-01'", "date({k} || '-01', '+1 month', '-1 day')")
+
+def _rollup_triggers(source: str, target: str, key_col: str, key_expr: str, count_col: str,
+                     day_col: str = "date", date_expr: str = "{d}", scoped: bool = False,
+                     span: Optional[Tuple[str, str]] = None, day_of: str = "{d}") -> List[str]:
+    """
+    为 source 表生成 INSERT / UPDATE / DELETE 触发器，对受影响的汇总键用 SUM(...) 重新计算 target 中的一行
+    （不做增减累加，浮点误差不会随写入次数累积；每次只读该键覆盖的一日 / 一周 / 一月的行）
+    date_expr 把 source 的日期列换算为 ISO 日期（版本 2 起的纪元日用 _DATE_OF），day_of 是它的逆换算；
+    span 为汇总键覆盖的 ISO 日期范围，None 表示按日汇总；scoped=True 时汇总键前面加上 account 列（版本 3）
+    """
+    def recompute(row: str) -> str:
+        day = f"{row}.{day_col}"
+        key = key_expr.format(d=date_expr.format(d=day))
+        if span is None:
+            members = f"{day_col} = {day}"
+        else:
+            lo, hi = (day_of.format(d=e.format(k=key)) for e in span)
+            members = f"{day_col} BETWEEN {lo} AND {hi}"
+        cols, values, match = key_col, key, f"{key_col} = {key}"
+        if scoped:
+            cols, values = f"account, {key_col}", f"{row}.account, {key}"
+            match = f"account = {row}.account AND {match}"
+            members = f"account = {row}.account AND {members}"
+        return f"""
+        DELETE FROM {target} WHERE {match};
+        INSERT INTO {target} ({cols}, usage_kwh, {count_col})
+        SELECT {values}, SUM(usage_kwh), COUNT(*) FROM {source} WHERE {members} HAVING COUNT(*) > 0;"""
+
+    name = f"trg_{source}_{target}_sum"
+    watched = f"account, {day_col}, usage_kwh" if scoped else f"{day_col}, usage_kwh"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {name}_ins AFTER INSERT ON {source} BEGIN{recompute('NEW')}\n    END;",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_upd AFTER UPDATE OF {watched} ON {source} "
+        f"BEGIN{recompute('OLD')}{recompute('NEW')}\n    END;",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_del AFTER DELETE ON {source} BEGIN{recompute('OLD')}\n    END;",
+    ]
+
+_ROLLUP_DDL_UNSCOPED = [
+    """
+    CREATE TABLE IF NOT EXISTS hourly_daily_totals (
+        date TEXT PRIMARY KEY,              -- 由 hourly_usage 按日汇总
+        usage_kwh REAL NOT NULL,
+        hours INTEGER NOT NULL              -- 已有的小时数（24 表示完整）
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS weekly_usage (
+        week_start TEXT PRIMARY KEY,        -- 该周周一（ISO），由 daily_usage 汇总
+        usage_kwh REAL NOT NULL,
+        days INTEGER NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS monthly_usage (
+        month TEXT PRIMARY KEY,             -- YYYY-MM，由 daily_usage 汇总
+        usage_kwh REAL NOT NULL,
+        days INTEGER NOT NULL
+    );
+    """,
+]
+
+ROLLUP_DDL = {
+    1: _ROLLUP_DDL_UNSCOPED,
+    2: _ROLLUP_DDL_UNSCOPED,
+    3: [
+    """
+    CREATE TABLE IF NOT EXISTS hourly_daily_totals (
+        account INTEGER NOT NULL,
+        date TEXT NOT NULL,                 -- 由 hourly_usage_v3 按账号、日汇总
+        usage_kwh REAL NOT NULL,
+        hours INTEGER NOT NULL,
+        PRIMARY KEY (account, date)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS weekly_usage (
+        account INTEGER NOT NULL,
+        week_start TEXT NOT NULL,           -- 该周周一（ISO）
+        usage_kwh REAL NOT NULL,
+        days INTEGER NOT NULL,
+        PRIMARY KEY (account, week_start)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS monthly_usage (
+        account INTEGER NOT NULL,
+        month TEXT NOT NULL,                -- YYYY-MM
+        usage_kwh REAL NOT NULL,
+        days INTEGER NOT NULL,
+        PRIMARY KEY (account, month)
+    ) WITHOUT ROWID;
+    """,
+    ],
+}
+
+ROLLUP_TRIGGERS = {
+    1: [
+        *_rollup_triggers("hourly_usage", "hourly_daily_totals", "date", "{d}", "hours"),
+        *_rollup_triggers("daily_usage", "weekly_usage", "week_start", _WEEK_OF, "days", span=_WEEK_SPAN),
+        *_rollup_triggers("daily_usage", "monthly_usage", "month", _MONTH_OF, "days", span=_MONTH_SPAN),
+    ],
+    2: [
+        *_rollup_triggers("hourly_usage_v2", "hourly_daily_totals", "date", "{d}", "hours", "day", _DATE_OF),
+        *_rollup_triggers("daily_usage_v2", "weekly_usage", "week_start", _WEEK_OF, "days", "day", _DATE_OF,
+                          span=_WEEK_SPAN, day_of=_EPOCH_OF),
+        *_rollup_triggers("daily_usage_v2", "monthly_usage", "month", _MONTH_OF, "days", "day", _DATE_OF,
+                          span=_MONTH_SPAN, day_of=_EPOCH_OF),
+    ],
+    3: [
+        *_rollup_triggers("hourly_usage_v3", "hourly_daily_totals", "date", "{d}", "hours", "day", _DATE_OF, True),
+        *_rollup_triggers("daily_usage_v3", "weekly_usage", "week_start", _WEEK_OF, "days", "day", _DATE_OF, True,
+                          span=_WEEK_SPAN, day_of=_EPOCH_OF),
+        *_rollup_triggers("daily_usage_v3", "monthly_usage", "month", _MONTH_OF, "days", "day", _DATE_OF, True,
+                          span=_MONTH_SPAN, day_of=_EPOCH_OF),
+    ],
+}
+
+# 早期版本按增量累加维护汇总表的触发器；init_schema 遇到时删除并重建汇总表，消除已累积的浮点误差
+LEGACY_ROLLUP_TRIGGERS = [
+    f"trg_{source}_{target}_{op}"
+    for source, target in (
+        ("hourly_usage", "hourly_daily_totals"), ("daily_usage", "weekly_usage"), ("daily_usage", "monthly_usage"),
+        ("hourly_usage_v2", "hourly_daily_totals"), ("daily_usage_v2", "weekly_usage"),
+        ("daily_usage_v2", "monthly_usage"), ("hourly_usage_v3", "hourly_daily_totals"),
+        ("daily_usage_v3", "weekly_usage"), ("daily_usage_v3", "monthly_usage"),
+    )
+    for op in ("ins", "upd", "del")
+]
+
+# 版本 2 下 hourly_usage / daily_usage 是兼容视图，重建 SQL 与版本 1 通用
+_ROLLUP_REBUILD_UNSCOPED = [
+    "DELETE FROM hourly_daily_totals;",
+    "DELETE FROM weekly_usage;",
+    "DELETE FROM monthly_usage;",
+    """
+    INSERT INTO hourly_daily_totals (date, usage_kwh, hours)
+    SELECT date, SUM(usage_kwh), COUNT(*) FROM hourly_usage GROUP BY date;
+    """,
+    f"""
+    INSERT INTO weekly_usage (week_start, usage_kwh, days)
+    SELECT {_WEEK_OF.format(d="date")} AS w, SUM(usage_kwh), COUNT(*) FROM daily_usage GROUP BY w;
+    """,
+    f"""
+    INSERT INTO monthly_usage (month, usage_kwh, days)
+    SELECT {_MONTH_OF.format(d="date")} AS m, SUM(usage_kwh), COUNT(*) FROM daily_usage GROUP BY m;
+    """,
+]
+
+_V3_DATE = _DATE_OF.format(d="day")
+ROLLUP_REBUILD = {
+    1: _ROLLUP_REBUILD_UNSCOPED,
+    2: _ROLLUP_REBUILD_UNSCOPED,
+    3: [
+        "DELETE FROM hourly_daily_totals;",
+        "DELETE FROM weekly_usage;",
+        "DELETE FROM monthly_usage;",
+        f"""
+        INSERT INTO hourly_daily_totals (account, date, usage_kwh, hours)
+        SELECT account, {_V3_DATE}, SUM(usage_kwh), COUNT(*) FROM hourly_usage_v3 GROUP BY account, day;
+        """,
+        # 已被保留策略压缩的日期只剩日合计
+        f"""
+        INSERT INTO hourly_daily_totals (account, date, usage_kwh, hours)
+        SELECT account, {_V3_DATE}, usage_kwh, hours FROM hourly_compacted WHERE true
+        ON CONFLICT(account, date) DO UPDATE SET
+            usage_kwh = usage_kwh + excluded.usage_kwh,
+            hours = hours + excluded.hours;
+        """,
+        f"""
+        INSERT INTO weekly_usage (account, week_start, usage_kwh, days)
+        SELECT account, {_WEEK_OF.format(d=_V3_DATE)} AS w, SUM(usage_kwh), COUNT(*) FROM daily_usage_v3 GROUP BY account, w;
+        """,
+        f"""
+        INSERT INTO monthly_usage (account, month, usage_kwh, days)
+        SELECT account, {_MONTH_OF.format(d=_V3_DATE)} AS m, SUM(usage_kwh), COUNT(*) FROM daily_usage_v3 GROUP BY account, m;
+        """,
+    ],
+}
+
+def _mirror_triggers(kind: str, from_version: int) -> List[str]:
+    """迁移期间把旧版本表上的写入同步到版本 3 的表（默认账号），在切换时随旧表一起删除"""
+    hourly = kind == "hourly"
+    source = USAGE_TABLES[from_version][kind][0]
+    target = USAGE_TABLES[SCHEMA_VERSION][kind][0]
+    cols = "account, day, hour, usage_kwh, batch" if hourly else "account, day, usage_kwh, batch"
+    hour = "NEW.hour, " if hourly else ""
+    if from_version == 1:
+        old_day, new_day = _EPOCH_OF.format(d="OLD.date"), _EPOCH_OF.format(d="NEW.date")
+        batch = "(SELECT id FROM fetch_batches WHERE fetched_at = NEW.fetched_at)"
+        write = "\n        INSERT OR IGNORE INTO fetch_batches (fetched_at) VALUES (NEW.fetched_at);"
+    else:
+        old_day, new_day, batch, write = "OLD.day", "NEW.day", "NEW.batch", ""
+    key = f"account = {DEFAULT_ACCOUNT_ID} AND day = {old_day}" + (" AND hour = OLD.hour" if hourly else "")
+    write += f"""
+        INSERT OR REPLACE INTO {target} ({cols})
+        VALUES ({DEFAULT_ACCOUNT_ID}, {new_day}, {hour}NEW.usage_kwh, {batch});"""
+    name = f"trg_migrate_{source}"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {name}_ins AFTER INSERT ON {source} BEGIN{write}\n    END;",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_upd AFTER UPDATE ON {source} BEGIN\n"
+        f"        DELETE FROM {target} WHERE {key};{write}\n    END;",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_del AFTER DELETE ON {source} BEGIN\n"
+        f"        DELETE FROM {target} WHERE {key};\n    END;",
+    ]
+
+MIGRATE_TRIGGERS = {v: _mirror_triggers("daily", v) + _mirror_triggers("hourly", v) for v in (1, 2)}
+
+def _upsert_sql(table: str, keys: Tuple[str, ...], stamp: str, touch_unchanged: bool) -> str:
+    cols = keys + ("usage_kwh", stamp)
+    where = "" if touch_unchanged else f" WHERE {table}.usage_kwh IS NOT excluded.usage_kwh"
+    return f"""
+        INSERT INTO {table} ({", ".join(cols)})
+        VALUES ({", ".join("?" * len(cols))})
+        ON CONFLICT({", ".join(keys)}) DO UPDATE SET
+            usage_kwh=excluded.usage_kwh,
+            {stamp}=excluded.{stamp}{where};
+        """
+
+def _epoch_day(v: Any) -> int:
+    if not isinstance(v, date):
+        v = date.fromisoformat(_to_iso_date(v))
+    elif isinstance(v, datetime):
+        v = v.date()
+    return v.toordinal() - _EPOCH_ORDINAL
+
 def _to_iso_date(v: Any) -> str:
     if isinstance(v, date) and not isinstance(v, datetime):
         return v.isoformat()
@@ -39,27 +667,130 @@ def _to_iso_ts(v: Optional[Any]) -> str:
         return datetime.now().isoformat()
     return str(v)
 
+def canonical_payload(payload: Dict[str, Any]) -> bytes:
+    """payload 的规范化 JSON（键排序、无多余空白），用于计算内容哈希"""
+    return json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+def _percentile(values: List[float], q: float) -> float:
+    """线性插值百分位（q 取 0..100）"""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = (len(xs) - 1) * q / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+def parse_since(spec: str, now: Optional[datetime] = None) -> datetime:
+    """'7d' / '24h' / '30m' 表示相对现在的时间窗口，其它按 ISO 日期或时间戳解析"""
+    now = now or datetime.now()
+    units = {"d": "days", "h": "hours", "m": "minutes"}
+    if spec and spec[-1] in units and spec[:-1].replace(".", "", 1).isdigit():
+        return now - timedelta(**{units[spec[-1]]: float(spec[:-1])})
+    return datetime.fromisoformat(spec)
+
+_MISSING = object()
+
+@dataclass
+class UpsertResult:
+    """upsert 的结果：新增 / 更新 / 未变化的行数，以及因日期已被保留策略压缩而跳过的行数"""
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+
+    @property
+    def written(self) -> int:
+        """实际写入（新增 + 更新）的行数"""
+        return self.inserted + self.updated
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated + self.unchanged + self.skipped
+
+    def __add__(self, other: "UpsertResult") -> "UpsertResult":
+        return UpsertResult(self.inserted + other.inserted, self.updated + other.updated,
+                            self.unchanged + other.unchanged, self.skipped + other.skipped)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"inserted": self.inserted, "updated": self.updated, "unchanged": self.unchanged,
+                "skipped": self.skipped}
+
+@dataclass
+class RetentionPolicy:
+    """
+    hourly 数据的保留策略：最近 keep_months 个月保留逐小时数据，更早的压缩为每日合计
+    chunk_days 为每个事务压缩的天数；vacuum_pages 为每次 incremental_vacuum 归还的页数
+    """
+    keep_months: int = 12
+    chunk_days: int = 31
+    vacuum_pages: int = 1024
+    pause_sec: float = 0.02
+
+    def cutoff(self, today: Optional[date] = None) -> date:
+        """保留期的起点：早于该日期的 hourly 数据会被压缩"""
+        if self.keep_months < 1:
+            raise ValueError("keep_months 至少为 1")
+        today = today or date.today()
+        y, m = divmod(today.year * 12 + today.month - 1 - self.keep_months, 12)
+        return date(y, m + 1, min(today.day, calendar.monthrange(y, m + 1)[1]))
+
 class KyudenSQLite:
-    def __init__(self, db_path: Optional[Path] = None):
+    def __init__(self, db_path: Optional[Path] = None, read_only: bool = False):
+        """read_only=True 时以只读方式打开已有的库（不建表、不改 PRAGMA，库不存在则 connect() 报错），供指标等读取路径使用"""
         self.db_path = Path(db_path) if db_path else DEFAULT_DB_PATH
+        self.read_only = read_only
         self.conn: Optional[sqlite3.Connection] = None
+        self.schema_version = SCHEMA_VERSION
+        self._sql = SQL_BY_VERSION[SCHEMA_VERSION]
 
     def connect(self):
+        if self.read_only:
+            self.conn = sqlite3.connect(
+                f"{self.db_path.resolve().as_uri()}?mode=ro",
+                uri=True,
+                timeout=15,
+                detect_types=sqlite3.PARSE_DECLTYPES,
+            )
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA query_only=ON;")
+            self.conn.execute("PRAGMA busy_timeout=5000;")
+            self._set_version(self._detect_version(self.conn))
+            return
         self.conn = sqlite3.connect(
             str(self.db_path),
             timeout=15,
             isolation_level=None,  # autocommit; 我们会显式用事务
             detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=256,  # 读取 API 的语句都是固定文本，命中 sqlite3 的预编译缓存
         )
         self.conn.row_factory = sqlite3.Row
         cur = self.conn.cursor()
         # 推荐的运行参数
+        # 新建的库使用增量 auto_vacuum（必须在建第一张表之前设置；已有的库要 VACUUM 一次才会切换）
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL;")
         cur.execute("PRAGMA journal_mode=WAL;")
         cur.execute("PRAGMA synchronous=NORMAL;")
         cur.execute("PRAGMA foreign_keys=ON;")
         cur.execute("PRAGMA busy_timeout=5000;")
+        self._set_version(self._detect_version(cur))
         cur.close()
 
+    @staticmethod
+    def _detect_version(cur: Union[sqlite3.Connection, sqlite3.Cursor]) -> int:
+        """user_version >= 2 即为该版本；否则已有 daily_usage 表的是版本 1，空库按当前版本新建"""
+        version = cur.execute("PRAGMA user_version;").fetchone()[0]
+        if version >= 2:
+            return version
+        legacy = cur.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'daily_usage';"
+        ).fetchone()[0]
+        return 1 if legacy else SCHEMA_VERSION
+
+    def _set_version(self, version: int):
+        self.schema_version = version
+        self._sql = SQL_BY_VERSION[version]
+
     def close(self):
         if self.conn:
             self.conn.close()
@@ -74,99 +805,1184 @@ class KyudenSQLite:
 
     def init_schema(self):
         assert self.conn, "Database not connected"
+        assert not self.read_only, "只读连接不能建表"
         cur = self.conn.cursor()
         try:
-            for ddl in DDL_STATEMENTS:
+            had_rollups = cur.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'monthly_usage';"
+            ).fetchone()[0]
+            v = self.schema_version
+            views = COMPAT_VIEWS.get(v, [])
+            self._upgrade_raw_payloads(cur)
+            if v >= 3 and self._last_seen_unscoped(cur):
+                self._in_transaction(cur, self._scope_last_seen_sql())
+            legacy = self._drop_legacy_rollup_triggers(cur)
+            for ddl in DDL_STATEMENTS + USAGE_DDL[v] + views + READ_INDEXES[v] + ROLLUP_DDL[v] + ROLLUP_TRIGGERS[v]:
                 cur.execute(ddl)
+            if v >= 2:
+                cur.execute(f"PRAGMA user_version = {v};")
+        finally:
+            cur.close()
+        if not had_rollups or legacy:
+            # 已有数据的旧库第一次建汇总表时，触发器只覆盖之后的写入，先完整汇总一次；
+            # 换掉增量累加的旧触发器时同样重建，清掉已累积的误差
+            self.rebuild_rollups()
+
+    @staticmethod
+    def _last_seen_unscoped(cur: sqlite3.Cursor) -> bool:
+        """usage_last_seen 是否还是只以 kind 为主键的旧结构"""
+        return [r[1] for r in cur.execute("PRAGMA table_info(usage_last_seen);") if r[5]] == ["kind"]
+
+    @staticmethod
+    def _scope_last_seen_sql() -> List[str]:
+        """把旧的 usage_last_seen 改为按 (account, kind) 记录，原有的行归入默认账号"""
+        ddl = next(sql for sql in USAGE_DDL[3] if "usage_last_seen" in sql)
+        return [
+            "ALTER TABLE usage_last_seen RENAME TO usage_last_seen_by_kind;",
+            ddl,
+            f"""
+            INSERT INTO usage_last_seen (account, kind, seen_at, first_date, last_date, rows)
+            SELECT {DEFAULT_ACCOUNT_ID}, kind, seen_at, first_date, last_date, rows FROM usage_last_seen_by_kind;
+            """,
+            "DROP TABLE usage_last_seen_by_kind;",
+        ]
+
+    @staticmethod
+    def _drop_legacy_rollup_triggers(cur: sqlite3.Cursor) -> int:
+        """删除增量累加的旧汇总触发器，返回删除的个数"""
+        marks = ",".join("?" * len(LEGACY_ROLLUP_TRIGGERS))
+        names = [r[0] for r in cur.execute(
+            f"SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN ({marks});", LEGACY_ROLLUP_TRIGGERS)]
+        for name in names:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name};")
+        return len(names)
+
+    @staticmethod
+    def _upgrade_raw_payloads(cur: sqlite3.Cursor):
+        """旧的 raw_payloads 只以 hash 为主键（日期归属会被覆盖），改名后由 DDL 重建，再把原有行复制过去"""
+        pk = [r[1] for r in cur.execute("PRAGMA table_info(raw_payloads);") if r[5]]
+        if pk != ["hash"]:
+            return
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            cur.execute("DROP INDEX IF EXISTS idx_raw_payloads_ingested;")
+            cur.execute("ALTER TABLE raw_payloads RENAME TO raw_payloads_by_hash;")
+            for ddl in DDL_STATEMENTS:
+                if "raw_payloads" in ddl:
+                    cur.execute(ddl)
+            cur.execute(
+                """
+                INSERT INTO raw_payloads (hash, kind, target_date, first_fetched_at, last_fetched_at,
+                                          fetch_count, ingested_at, raw_size, payload)
+                SELECT hash, kind, COALESCE(target_date, ''), first_fetched_at, last_fetched_at,
+                       fetch_count, ingested_at, raw_size, payload
+                FROM raw_payloads_by_hash;
+                """
+            )
+            cur.execute("DROP TABLE raw_payloads_by_hash;")
+            cur.execute("COMMIT;")
+        except Exception:
+            cur.execute("ROLLBACK;")
+            raise
+
+    def rebuild_rollups(self) -> Dict[str, int]:
+        """在一个事务内从 hourly_usage / daily_usage 重建全部汇总表，返回各表行数"""
+        assert self.conn, "Database not connected"
+        cur = self.conn.cursor()
+        try:
+            cur.execute("BEGIN;")
+            for sql in ROLLUP_REBUILD[self.schema_version]:
+                cur.execute(sql)
+            cur.execute("COMMIT;")
+        except Exception:
+            cur.execute("ROLLBACK;")
+            raise
         finally:
             cur.close()
+        return {t: self.conn.execute(f"SELECT COUNT(*) FROM {t};").fetchone()[0] for t in ROLLUP_TABLES}
+
+    def rollup_total(self, period: str, key: Any, account: int = DEFAULT_ACCOUNT_ID) -> Optional[float]:
+        """
+        汇总值的主键查找:
+        - period='day'：key 为日期，取 hourly_daily_totals
+        - period='week'：key 为该周任意一天，取 weekly_usage
+        - period='month'：key 为 'YYYY-MM' 或该月任意一天，取 monthly_usage
+        """
+        assert self.conn, "Database not connected"
+        if period == "day":
+            table, col, k = "hourly_daily_totals", "date", _to_iso_date(key)
+        elif period == "week":
+            d = date.fromisoformat(_to_iso_date(key))
+            table, col, k = "weekly_usage", "week_start", (d - timedelta(days=d.weekday())).isoformat()
+        elif period == "month":
+            table, col, k = "monthly_usage", "month", _to_iso_date(key)[:7]
+        else:
+            raise ValueError(f"未知的汇总周期: {period}")
+        scope = self._account(account)
+        where = f"account = ? AND {col} = ?" if scope else f"{col} = ?"
+        row = self.conn.execute(f"SELECT usage_kwh FROM {table} WHERE {where};", scope + (k,)).fetchone()
+        return row[0] if row else None
+
+    # ---------- 账号 ----------
+
+    def _account(self, account: int) -> Tuple[int, ...]:
+        """账号的 SQL 参数前缀：版本 3 为 (account,)；更早的版本只有默认账号，返回 ()"""
+        if self.schema_version >= 3:
+            return (int(account),)
+        if account != DEFAULT_ACCOUNT_ID:
+            raise ValueError(f"结构版本 {self.schema_version} 只支持默认账号，请先运行 db.py --migrate")
+        return ()
 
-    def upsert_daily(self, rows: Iterable[Dict[str, Any]]) -> int:
+    def account_id(self, name: str, create: bool = True) -> Optional[int]:
+        """按名称查找账号 id，create=True 时不存在就新建"""
+        assert self.conn, "Database not connected"
+        if self.schema_version < 3:
+            raise ValueError(f"结构版本 {self.schema_version} 没有 accounts 表，请先运行 db.py --migrate")
+        row = self.conn.execute("SELECT id FROM accounts WHERE name = ?;", (name,)).fetchone()
+        if row or not create:
+            return row[0] if row else None
+        self.conn.execute("INSERT OR IGNORE INTO accounts (name, created_at) VALUES (?, ?);",
+                          (name, datetime.now().isoformat()))
+        return self.conn.execute("SELECT id FROM accounts WHERE name = ?;", (name,)).fetchone()[0]
+
+    def accounts(self) -> List[Dict[str, Any]]:
+        assert self.conn, "Database not connected"
+        if self.schema_version < 3:
+            return [{"id": DEFAULT_ACCOUNT_ID, "name": "default", "created_at": None}]
+        return [dict(r) for r in self.conn.execute("SELECT id, name, created_at FROM accounts ORDER BY id;")]
+
+    def upsert_daily(self, rows: Union[Iterable[Dict[str, Any]], UsageBatch, UsageColumns],
+                     touch_unchanged: bool = False, account: int = DEFAULT_ACCOUNT_ID,
+                     record_seen: bool = True) -> UpsertResult:
         """
         rows 中的每条记录至少包含:
         - date: date | str (YYYY-MM-DD)
         - usage_kwh: float
         - timestamp/fetched_at: datetime | str | None
+        也可以直接传入 UsageBatch（DailyUsage 记录）或 UsageColumns（列式解析结果），
+        二者都不再逐条猜测键名 / 转换类型
+
+        只写入新增或 usage_kwh 有变化的行，fetched_at 因此表示“最近一次变化”；
+        本批的抓取时间记在 usage_last_seen 中。touch_unchanged=True 时恢复旧行为（未变化的行也刷新 fetched_at）
+        account 为 accounts.id（见 account_id()），默认账号为 1
+        record_seen=False 时不更新 usage_last_seen（导入旧快照时用，避免最近抓取时间倒退）
         """
         assert self.conn, "Database not connected"
-        rows_list: List[Dict[str, Any]] = list(rows)
-        if not rows_list:
-            return 0
+        if isinstance(rows, UsageColumns):
+            if rows.is_hourly:
+                raise ValueError("upsert_daily 不接受带 hours 列的 UsageColumns")
+            data = list(rows.db_params())
+        elif isinstance(rows, UsageBatch) and not rows.is_hourly:
+            data = list(rows.db_params())
+        else:
+            data = []
+            for r in rows:
+                d = _to_iso_date(r.get("date") or r.get("date_str"))
+                u = float(r.get("usage_kwh"))
+                ts = r.get("fetched_at", r.get("timestamp"))
+                data.append((d, u, _to_iso_ts(ts)))
+        return self._upsert_changed("daily", data, touch_unchanged, account, record_seen)
 
-        data = []
-        for r in rows_list:
-            d = _to_iso_date(r.get("date") or r.get("date_str"))
-            u = float(r.get("usage_kwh"))
-            ts = r.get("fetched_at", r.get("timestamp"))
-            data.append((d, u, _to_iso_ts(ts)))
+    def upsert_hourly(self, rows: Union[Iterable[Dict[str, Any]], UsageBatch, UsageColumns],
+                      touch_unchanged: bool = False, account: int = DEFAULT_ACCOUNT_ID,
+                      record_seen: bool = True) -> UpsertResult:
+        """
+        rows 中的每条记录至少包含:
+        - date: date | str (YYYY-MM-DD)
+        - hour: int (0..23)
+        - usage_kwh: float
+        - timestamp/fetched_at: datetime | str | None
+        也可以直接传入 hourly 的 UsageBatch 或带 hours 列的 UsageColumns
+        变化检测、touch_unchanged、account 与 record_seen 同 upsert_daily
+        """
+        assert self.conn, "Database not connected"
+        if isinstance(rows, UsageColumns):
+            if not rows.is_hourly:
+                raise ValueError("upsert_hourly 需要带 hours 列的 UsageColumns")
+            data = list(rows.db_params())
+        elif isinstance(rows, UsageBatch) and rows.is_hourly:
+            data = list(rows.db_params())
+        else:
+            data = []
+            for r in rows:
+                d = _to_iso_date(r.get("date") or r.get("date_str"))
+                h = int(r.get("hour"))
+                u = float(r.get("usage_kwh"))
+                ts = r.get("fetched_at", r.get("timestamp"))
+                data.append((d, h, u, _to_iso_ts(ts)))
+        return self._upsert_changed("hourly", data, touch_unchanged, account, record_seen)
 
-        sql = """
-        INSERT INTO daily_usage (date, usage_kwh, fetched_at)
-        VALUES (?, ?, ?)
-        ON CONFLICT(date) DO UPDATE SET
-            usage_kwh=excluded.usage_kwh,
-            fetched_at=excluded.fetched_at;
+    def _upsert_changed(self, kind: str, data: List[Tuple], touch_unchanged: bool,
+                        account: int = DEFAULT_ACCOUNT_ID, record_seen: bool = True) -> UpsertResult:
         """
+        data 为 (date, usage, ts) 或 (date, hour, usage, ts) 元组。
+        先按日期范围读出已有值（走主键索引），只把新增 / 变化的行交给 UPSERT；
+        UPSERT 自身也带 WHERE 条件，即使与其它写入者并发也不会重写未变化的行
+        """
+        result = UpsertResult()
+        if not data:
+            return result
+        hourly = kind == "hourly"
+        if self.schema_version < SCHEMA_VERSION:
+            # 长连接（如回填）期间库可能已被 --migrate 切换到新版本
+            self._set_version(self._detect_version(self.conn))
+        scope = self._account(account)
+        v2 = self.schema_version >= 2
+        table, keys, stamp = USAGE_TABLES[self.schema_version][kind]
+        lo = min(t[0] for t in data)
+        hi = max(t[0] for t in data)
+        bounds: Tuple[Any, Any] = (lo, hi)
+        if v2:
+            # 版本 2 以纪元日为键：每个不同的日期只换算一次
+            epoch = {d: _epoch_day(d) for d in {t[0] for t in data}}
+            data = [(epoch[t[0]],) + t[1:] for t in data]
+            bounds = (epoch[lo], epoch[hi])
+        if hourly and scope:
+            # 已被保留策略压缩的日期只保留日合计，不再写回逐小时数据
+            before = self.conn.execute(
+                "SELECT compacted_before FROM hourly_retention WHERE account = ?;", scope).fetchone()
+            if before and bounds[0] < before[0]:
+                kept = [t for t in data if t[0] >= before[0]]
+                result.skipped += len(data) - len(kept)
+                if not kept:
+                    return result
+                data = kept
+                bounds = (min(t[0] for t in data), bounds[1])
+        select = self._sql["existing_hourly" if hourly else "existing_daily"]
+        if hourly:
+            existing = {(d, h): u for d, h, u in self.conn.execute(select, scope + bounds)}
+        else:
+            existing = {d: u for d, u in self.conn.execute(select, scope + bounds)}
+
+        to_write = []
+        for t in data:
+            key = (t[0], t[1]) if hourly else t[0]
+            old = existing.get(key, _MISSING)
+            usage = t[-2]
+            if old is _MISSING:
+                result.inserted += 1
+                to_write.append(t)
+            elif old != usage:
+                result.updated += 1
+                to_write.append(t)
+            else:
+                result.unchanged += 1
+                if touch_unchanged:
+                    to_write.append(t)
+            existing[key] = usage
+
+        sql = _upsert_sql(table, keys, stamp, touch_unchanged)
+        seen_at = max(t[-1] for t in data)
         cur = self.conn.cursor()
         try:
             cur.execute("BEGIN;")
-            cur.executemany(sql, data)
+            if to_write and v2:
+                # 抓取时间去重：同一批次只在 fetch_batches 里存一次，行内只存批次 id
+                stamps = sorted({t[-1] for t in to_write})
+                cur.executemany("INSERT OR IGNORE INTO fetch_batches (fetched_at) VALUES (?);", [(ts,) for ts in stamps])
+                batch = dict(cur.execute(
+                    f"SELECT fetched_at, id FROM fetch_batches WHERE fetched_at IN ({', '.join('?' * len(stamps))});",
+                    stamps))
+                to_write = [scope + t[:-1] + (batch[t[-1]],) for t in to_write]
+            if to_write:
+                cur.executemany(sql, to_write)
+            if record_seen:
+                cur.execute(self._sql["record_seen"], scope + (kind, seen_at, lo, hi, len(data)))
             cur.execute("COMMIT;")
         except Exception:
             cur.execute("ROLLBACK;")
             raise
         finally:
             cur.close()
-        return len(data)
+        return result
+
+    def daily_dates_between(self, start: Any, end: Any, account: int = DEFAULT_ACCOUNT_ID) -> set:
+        """daily_usage 中 [start, end] 范围内已存在的日期（ISO 字符串集合）"""
+        assert self.conn, "Database not connected"
+        cur = self.conn.execute(self._sql["daily_dates"], self._params(account, start, end))
+        return {r[0] for r in cur.fetchall()}
+
+    def hourly_complete_days(self, start: date, end: date, hours_per_day: int = 24,
+                             account: int = DEFAULT_ACCOUNT_ID) -> set:
+        """返回 [start, end] 内 hourly_usage 已有完整 24 小时数据的日期（ISO 字符串集合）"""
+        assert self.conn, "Database not connected"
+        params = self._params(account, start, end) + (hours_per_day,)
+        if self.schema_version >= 3:
+            params *= 2  # 另含已压缩为日合计的日期
+        cur = self.conn.execute(self._sql["hourly_complete_days"], params)
+        return {r[0] for r in cur.fetchall()}
+
+    def latest_usage(self, account: int = DEFAULT_ACCOUNT_ID) -> Tuple[Optional[str], Optional[Tuple[str, int]]]:
+        """库中最新的每日数据日期（ISO），以及最新的每小时数据 (ISO 日期, 小时)"""
+        assert self.conn, "Database not connected"
+        scope = self._account(account)
+        latest_daily = self.conn.execute(self._sql["latest_daily"], scope).fetchone()[0]
+        row = self.conn.execute(self._sql["latest_hourly"], scope).fetchone()
+        return latest_daily, ((row[0], row[1]) if row else None)
 
-    def upsert_hourly(self, rows: Iterable[Dict[str, Any]]) -> int:
+    def last_seen(self, account: int = DEFAULT_ACCOUNT_ID) -> Dict[str, Dict[str, Any]]:
+        """该账号每种数据最近一次 upsert 批次的记录：{kind: {seen_at, first_date, last_date, rows}}"""
+        assert self.conn, "Database not connected"
+        return {r[0]: {"seen_at": r[1], "first_date": r[2], "last_date": r[3], "rows": r[4]}
+                for r in self.conn.execute(self._sql["last_seen"], self._account(account))}
+
+    def backfill_done_days(self, job: str) -> set:
+        """回填任务中已完成（done / empty）的日期"""
+        assert self.conn, "Database not connected"
+        cur = self.conn.execute(
+            "SELECT date FROM backfill_checkpoints WHERE job = ? AND status IN ('done', 'empty');",
+            (job,),
+        )
+        return {r[0] for r in cur.fetchall()}
+
+    def mark_backfill_day(self, job: str, day: Any, status: str, rows: int = 0):
+        """记录回填检查点（autocommit，单条写入即时落盘）"""
+        assert self.conn, "Database not connected"
+        self.conn.execute(
+            """
+            INSERT INTO backfill_checkpoints (job, date, status, rows, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(job, date) DO UPDATE SET
+                status=excluded.status,
+                rows=excluded.rows,
+                updated_at=excluded.updated_at;
+            """,
+            (job, _to_iso_date(day), status, rows, datetime.now().isoformat()),
+        )
+
+    def record_run(self, run: Dict[str, Any]) -> int:
         """
-        rows 中的每条记录至少包含:
-        - date: date | str (YYYY-MM-DD)
-        - hour: int (0..23)
-        - usage_kwh: float
-        - timestamp/fetched_at: datetime | str | None
+        写入一次采集运行的记录，返回行 id。run 中的键:
+        - started_at / finished_at: datetime | str
+        - duration_sec, mode, outcome（必填）
+        - backend, session, validation_path, login_attempts, error（可选）
+        - phases: {阶段名: 秒数}
+        - rows_daily / rows_hourly: 实际 upsert 的行数
         """
         assert self.conn, "Database not connected"
-        rows_list: List[Dict[str, Any]] = list(rows)
-        if not rows_list:
-            return 0
+        cur = self.conn.execute(
+            """
+            INSERT INTO collection_runs (
+                started_at, finished_at, duration_sec, mode, outcome, backend, session,
+                validation_path, login_attempts, phases, rows_daily, rows_hourly, error
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            """,
+            (
+                _to_iso_ts(run.get("started_at")),
+                _to_iso_ts(run.get("finished_at")),
+                float(run["duration_sec"]),
+                run["mode"],
+                run["outcome"],
+                run.get("backend"),
+                run.get("session"),
+                run.get("validation_path"),
+                int(run.get("login_attempts") or 0),
+                json.dumps(run.get("phases") or {}, ensure_ascii=False),
+                int(run.get("rows_daily") or 0),
+                int(run.get("rows_hourly") or 0),
+                run.get("error"),
+            ),
+        )
+        return cur.lastrowid
 
-        data = []
-        for r in rows_list:
-            d = _to_iso_date(r.get("date") or r.get("date_str"))
-            h = int(r.get("hour"))
-            u = float(r.get("usage_kwh"))
-            ts = r.get("fetched_at", r.get("timestamp"))
-            data.append((d, h, u, _to_iso_ts(ts)))
+    def runs_between(self, since: datetime, until: Optional[datetime] = None, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """[since, until) 内开始的运行记录（phases 已解析为 dict），按开始时间排序"""
+        assert self.conn, "Database not connected"
+        sql = "SELECT * FROM collection_runs WHERE started_at >= ? AND started_at < ?"
+        params: List[Any] = [since.isoformat(), (until or datetime.max).isoformat()]
+        if mode:
+            sql += " AND mode = ?"
+            params.append(mode)
+        runs = []
+        for r in self.conn.execute(sql + " ORDER BY started_at;", params):
+            d = dict(r)
+            d["phases"] = json.loads(d["phases"]) if d["phases"] else {}
+            runs.append(d)
+        return runs
 
-        sql = """
-        INSERT INTO hourly_usage (date, hour, usage_kwh, fetched_at)
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(date, hour) DO UPDATE SET
-            usage_kwh=excluded.usage_kwh,
-            fetched_at=excluded.fetched_at;
+    def run_stats(self, since: datetime, until: Optional[datetime] = None, mode: Optional[str] = None,
+                  percentiles=(50, 90, 95, 99)) -> Dict[str, Any]:
+        """时间窗口内的运行统计：结果分布、登录情况，以及总耗时 / 各阶段耗时的百分位"""
+        runs = self.runs_between(since, until, mode)
+        outcomes: Dict[str, int] = {}
+        sessions: Dict[str, int] = {}
+        samples: Dict[str, List[float]] = {"total": []}
+        for r in runs:
+            outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+            key = r["session"] or "none"
+            sessions[key] = sessions.get(key, 0) + 1
+            samples["total"].append(r["duration_sec"])
+            for name, sec in r["phases"].items():
+                samples.setdefault(name, []).append(sec)
+
+        def summarize(vals: List[float]) -> Dict[str, float]:
+            out = {"n": len(vals)}
+            out.update({f"p{q}": round(_percentile(vals, q), 3) for q in percentiles})
+            out["max"] = round(max(vals), 3)
+            return out
+
+        return {
+            "since": since.isoformat(),
+            "until": until.isoformat() if until else None,
+            "mode": mode,
+            "runs": len(runs),
+            "outcomes": outcomes,
+            "sessions": sessions,
+            "login_retries": sum(max(0, r["login_attempts"] - 1) for r in runs),
+            "rows_daily": sum(r["rows_daily"] for r in runs),
+            "rows_hourly": sum(r["rows_hourly"] for r in runs),
+            "durations": {name: summarize(vals) for name, vals in samples.items() if vals},
+        }
+
+    # ---------- 读取 API ----------
+    # 日期参数可为 date 或 ISO 字符串，None 表示不限；结果以生成器分批（fetchmany）流式返回，
+    # 多年范围的查询也不会一次载入内存。account 为 accounts.id，版本 3 下每个查询只读该账号的主键 / 索引段
+
+    def _stream(self, sql: str, params: Tuple, batch_size: int) -> Iterator[sqlite3.Row]:
+        assert self.conn, "Database not connected"
+        cur = self.conn.execute(sql, params)
+        try:
+            while True:
+                chunk = cur.fetchmany(batch_size)
+                if not chunk:
+                    return
+                yield from chunk
+        finally:
+            cur.close()
+
+    def _range(self, start: Optional[Any], end: Optional[Any]) -> Tuple[Any, Any]:
+        """日期范围的 SQL 参数：版本 1 为 ISO 字符串，版本 2 为纪元日"""
+        if self.schema_version >= 2:
+            return (_epoch_day(start) if start is not None else _MIN_DAY,
+                    _epoch_day(end) if end is not None else _MAX_DAY)
+        return (_to_iso_date(start) if start is not None else _MIN_DATE,
+                _to_iso_date(end) if end is not None else _MAX_DATE)
+
+    def _params(self, account: int, start: Optional[Any], end: Optional[Any]) -> Tuple[Any, ...]:
+        return self._account(account) + self._range(start, end)
+
+    def _decoders(self):
         """
+        逐行读取结果中日期与抓取时间的换算函数（调用方按值缓存）:
+        版本 1 为 ISO 字符串；版本 2 为纪元日与 fetch_batches.id
+        """
+        if self.schema_version < 2:
+            return (lambda d: (date.fromisoformat(d), d)), datetime.fromisoformat
+
+        def day_of(n: int) -> Tuple[date, str]:
+            day = date.fromordinal(n + _EPOCH_ORDINAL)
+            return day, day.isoformat()
+
+        def fetched_of(batch: int) -> datetime:
+            row = self.conn.execute("SELECT fetched_at FROM fetch_batches WHERE id = ?;", (batch,)).fetchone()
+            return datetime.fromisoformat(row[0])
+        return day_of, fetched_of
+
+    def iter_daily(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                   batch_size: int = 1000, account: int = DEFAULT_ACCOUNT_ID) -> Iterator[DailyUsage]:
+        """[start, end] 内的每日数据（DailyUsage，按日期升序）"""
+        day_of, fetched_of = self._decoders()
+        ts_cache: Dict[Any, datetime] = {}
+        for d, u, ts in self._stream(self._sql["daily_range"], self._params(account, start, end), batch_size):
+            day = day_of(d)[0]
+            fetched = ts_cache.get(ts) or ts_cache.setdefault(ts, fetched_of(ts))
+            yield DailyUsage(day, f"{day.month}/{day.day}", u, fetched)
+
+    def iter_hourly(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                    batch_size: int = 2400, account: int = DEFAULT_ACCOUNT_ID) -> Iterator[HourlyUsage]:
+        """
+        [start, end] 内的每小时数据（HourlyUsage，按日期、小时升序）
+        已被保留策略压缩的日期没有逐小时数据，不返回任何行；其日合计见 iter_daily_totals()
+        """
+        day_of, fetched_of = self._decoders()
+        day_cache: Dict[Any, Tuple[date, str]] = {}
+        ts_cache: Dict[Any, datetime] = {}
+        for d, h, u, ts in self._stream(self._sql["hourly_range"], self._params(account, start, end), batch_size):
+            day, iso = day_cache.get(d) or day_cache.setdefault(d, day_of(d))
+            fetched = ts_cache.get(ts) or ts_cache.setdefault(ts, fetched_of(ts))
+            yield HourlyUsage(day, iso, h, u, fetched)
+
+    def hour_of_day_profile(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                            account: int = DEFAULT_ACCOUNT_ID) -> List[Dict[str, Any]]:
+        """按小时（0..23）统计 [start, end] 内的平均 / 最小 / 最大用电量与天数"""
+        return [
+            {"hour": h, "avg_kwh": avg, "min_kwh": lo, "max_kwh": hi, "days": n}
+            for h, avg, lo, hi, n in self._stream(self._sql["hour_profile"], self._params(account, start, end), 24)
+        ]
+
+    def top_peak_hours(self, n: int = 10, start: Optional[Any] = None, end: Optional[Any] = None,
+                       account: int = DEFAULT_ACCOUNT_ID) -> List[HourlyUsage]:
+        """[start, end] 内用电量最高的 n 个小时（不限范围时走峰值索引直接取前 n 条）"""
+        params = self._params(account, start, end) + (int(n),)
+        sql = self._sql["top_peaks" if start is None and end is None else "top_peaks_in_range"]
+        day_of, fetched_of = self._decoders()
+        return [
+            HourlyUsage(*day_of(d), h, u, fetched_of(ts))
+            for d, h, u, ts in self._stream(sql, params, max(1, int(n)))
+        ]
+
+    def iter_daily_totals(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                          batch_size: int = 1000, account: int = DEFAULT_ACCOUNT_ID) -> Iterator[Tuple[date, float, int]]:
+        """由 hourly_daily_totals 汇总表读取每日合计：(date, usage_kwh, hours)"""
+        lo = _to_iso_date(start) if start is not None else _MIN_DATE
+        hi = _to_iso_date(end) if end is not None else _MAX_DATE
+        for d, u, hours in self._stream(self._sql["daily_totals"], self._account(account) + (lo, hi), batch_size):
+            yield date.fromisoformat(d), u, hours
+
+    # ---------- 批量（列式）读取 ----------
+    # 结果为 UsageColumns（array 模块的连续缓冲区），to_numpy() 零拷贝得到 datetime64[D] / int8 / float64；
+    # 读取结果不携带 fetched_at
+
+    def iter_hourly_columns(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                            chunk_rows: int = 100_000, account: int = DEFAULT_ACCOUNT_ID) -> Iterator[UsageColumns]:
+        """按 chunk_rows 行一块返回 [start, end] 内的每小时数据（已压缩的日期不返回，同 iter_hourly）"""
+        assert self.conn, "Database not connected"
+        cur = self.conn.execute(self._sql["hourly_columns"], self._params(account, start, end))
+        try:
+            while True:
+                chunk = cur.fetchmany(chunk_rows)
+                if not chunk:
+                    return
+                days, hours, usage = zip(*chunk)
+                yield UsageColumns(array("l", days), array("d", usage), hours=array("b", hours))
+        finally:
+            cur.close()
+
+    def iter_daily_columns(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                           chunk_rows: int = 100_000, account: int = DEFAULT_ACCOUNT_ID) -> Iterator[UsageColumns]:
+        assert self.conn, "Database not connected"
+        cur = self.conn.execute(self._sql["daily_columns"], self._params(account, start, end))
+        try:
+            while True:
+                chunk = cur.fetchmany(chunk_rows)
+                if not chunk:
+                    return
+                days, usage = zip(*chunk)
+                yield UsageColumns(array("l", days), array("d", usage))
+        finally:
+            cur.close()
+
+    def iter_hourly_numpy(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                          chunk_rows: int = 100_000, float_dtype: str = "float64",
+                          account: int = DEFAULT_ACCOUNT_ID) -> Iterator[Dict[str, Any]]:
+        """分块的 NumPy 读取：每块为 {'date': datetime64[D], 'hour': int8, 'usage_kwh': float_dtype}"""
+        for cols in self.iter_hourly_columns(start, end, chunk_rows, account):
+            yield _numpy_columns(cols, float_dtype)
+
+    def read_hourly_numpy(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                          float_dtype: str = "float64", account: int = DEFAULT_ACCOUNT_ID) -> Dict[str, Any]:
+        """把 [start, end] 内的每小时数据一次读成连续的 NumPy 数组（大范围请用 iter_hourly_numpy）"""
+        return _concat_numpy(self.iter_hourly_numpy(start, end, float_dtype=float_dtype, account=account),
+                             hourly=True, float_dtype=float_dtype)
+
+    def read_daily_numpy(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                         float_dtype: str = "float64", account: int = DEFAULT_ACCOUNT_ID) -> Dict[str, Any]:
+        return _concat_numpy((_numpy_columns(c, float_dtype) for c in self.iter_daily_columns(start, end, account=account)),
+                             hourly=False, float_dtype=float_dtype)
+
+    def read_hourly_arrow(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                          float_dtype: str = "float64", account: int = DEFAULT_ACCOUNT_ID):
+        """以 pyarrow.Table 返回（date32 / int8 / float），需要安装 pyarrow 与 NumPy"""
+        import pyarrow as pa
+        batches = [
+            pa.record_batch([pa.array(c["date"]), pa.array(c["hour"]), pa.array(c["usage_kwh"])],
+                            names=["date", "hour", "usage_kwh"])
+            for c in self.iter_hourly_numpy(start, end, float_dtype=float_dtype, account=account)
+        ]
+        if not batches:
+            float_type = pa.float32() if float_dtype == "float32" else pa.float64()
+            schema = pa.schema([("date", pa.date32()), ("hour", pa.int8()), ("usage_kwh", float_type)])
+            return schema.empty_table()
+        return pa.Table.from_batches(batches)
+
+    # ---------- 结构迁移（版本 1 / 2 -> 3） ----------
+
+    def storage_stats(self) -> Dict[str, Any]:
+        """文件大小、已用页大小，以及用电量表和索引各自占用的字节数（需要 SQLite 编译了 dbstat）"""
+        assert self.conn, "Database not connected"
+        page_size = self.conn.execute("PRAGMA page_size;").fetchone()[0]
+        pages = self.conn.execute("PRAGMA page_count;").fetchone()[0]
+        free = self.conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        stats: Dict[str, Any] = {
+            "file_bytes": self.db_path.stat().st_size if self.db_path.exists() else 0,
+            "used_bytes": (pages - free) * page_size,
+        }
+        try:
+            stats["objects"] = {
+                name: size for name, size in self.conn.execute(
+                    "SELECT name, SUM(pgsize) FROM dbstat "
+                    "WHERE name LIKE 'daily_usage%' OR name LIKE 'hourly_usage%' OR name LIKE 'idx_%' "
+                    "OR name LIKE 'sqlite_autoindex_%usage%' OR name = 'fetch_batches' GROUP BY name ORDER BY name;")
+            }
+        except sqlite3.OperationalError:
+            pass
+        return stats
+
+    def scan_speed(self, repeat: int = 3) -> Dict[str, Any]:
+        """全范围扫描 hourly 数据的速度（行/秒，取最快一次）：列式读取与逐行记录读取"""
+        out: Dict[str, Any] = {}
+        for name, fn in (("hourly_columns", lambda: sum(len(c) for c in self.iter_hourly_columns())),
+                         ("hourly_records", lambda: sum(1 for _ in self.iter_hourly()))):
+            best, rows = None, 0
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                rows = fn()
+                sec = time.perf_counter() - t0
+                best = sec if best is None else min(best, sec)
+            out[name] = round(rows / best) if rows and best else 0
+        out["rows"] = rows
+        return out
+
+    def migrate(self, chunk_rows: int = 20_000, pause_sec: float = 0.05, vacuum: bool = False,
+                progress=None) -> Dict[str, Any]:
+        """
+        把版本 1 / 2 的用电量表在线迁移到当前版本（数据归入默认账号），返回迁移前后的大小与扫描速度
+        - 先建新表，并在旧表上挂同步触发器：迁移期间其它进程照常写旧表，写入会同步到新表
+        - 按主键顺序分块复制，每块一个短事务（BEGIN IMMEDIATE），块之间让出写锁
+        - 最后在一个事务内核对行数、删除旧表（连同旧索引与触发器）和旧汇总表，
+          建兼容视图、按账号划分的汇总表与触发器，并从新表重建汇总（汇总表只有日 / 周 / 月粒度，重建很快）；
+          usage_last_seen 同时改为按 (account, kind) 记录
+        vacuum=True 时切换后执行 vacuum() 把空出的页还给文件系统（期间独占数据库）
+        """
+        assert self.conn, "Database not connected"
+        source = self.schema_version
+        if source >= SCHEMA_VERSION:
+            return {"migrated": False, "schema_version": source}
+        self.init_schema()
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        report: Dict[str, Any] = {"migrated": True, "from_version": source, "to_version": SCHEMA_VERSION,
+                                  "before": self.storage_stats()}
+        report["before"]["scan_rows_per_sec"] = self.scan_speed()
+        t0 = time.perf_counter()
+        target = SCHEMA_VERSION
         cur = self.conn.cursor()
         try:
-            cur.execute("BEGIN;")
-            cur.executemany(sql, data)
+            self._in_transaction(cur, USAGE_DDL[target] + READ_INDEXES[target] + MIGRATE_TRIGGERS[source])
+            report["rows"] = {
+                kind: self._copy_chunks(cur, kind, source, chunk_rows, pause_sec, progress)
+                for kind in ("daily", "hourly")
+            }
+
+            cur.execute("BEGIN IMMEDIATE;")
+            try:
+                for kind in ("daily", "hourly"):
+                    old_table, new_table = USAGE_TABLES[source][kind][0], USAGE_TABLES[target][kind][0]
+                    old = cur.execute(f"SELECT COUNT(*) FROM {old_table};").fetchone()[0]
+                    new = cur.execute(f"SELECT COUNT(*) FROM {new_table};").fetchone()[0]
+                    if old != new:
+                        raise RuntimeError(f"{old_table} 迁移后行数不一致: {old} != {new}")
+                    if source >= 2:
+                        cur.execute(f"DROP VIEW IF EXISTS {kind}_usage;")
+                    cur.execute(f"DROP TABLE {old_table};")
+                for table in ROLLUP_TABLES:
+                    cur.execute(f"DROP TABLE {table};")
+                if self._last_seen_unscoped(cur):
+                    for sql in self._scope_last_seen_sql():
+                        cur.execute(sql)
+                for sql in COMPAT_VIEWS[target] + ROLLUP_DDL[target] + ROLLUP_TRIGGERS[target] + ROLLUP_REBUILD[target]:
+                    cur.execute(sql)
+                cur.execute(f"PRAGMA user_version = {target};")
+                cur.execute("COMMIT;")
+            except Exception:
+                cur.execute("ROLLBACK;")
+                raise
+            self._set_version(target)
+        finally:
+            cur.close()
+        if vacuum:
+            self.vacuum()
+        report["duration_sec"] = round(time.perf_counter() - t0, 3)
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        report["after"] = self.storage_stats()
+        report["after"]["scan_rows_per_sec"] = self.scan_speed()
+        return report
+
+    @staticmethod
+    def _in_transaction(cur: sqlite3.Cursor, statements: List[str]):
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            for sql in statements:
+                cur.execute(sql)
             cur.execute("COMMIT;")
         except Exception:
             cur.execute("ROLLBACK;")
             raise
+
+    def _copy_chunks(self, cur: sqlite3.Cursor, kind: str, source: int, chunk_rows: int,
+                     pause_sec: float, progress) -> int:
+        """按日期分块把旧表复制到新表（默认账号）；每块的上界为从当前位置起第 chunk_rows 行所在的日期"""
+        hourly = kind == "hourly"
+        old_table = USAGE_TABLES[source][kind][0]
+        new_table = USAGE_TABLES[SCHEMA_VERSION][kind][0]
+        cols = "account, day, hour, usage_kwh, batch" if hourly else "account, day, usage_kwh, batch"
+        hour = "t.hour, " if hourly else ""
+        if source == 1:
+            key, lo = "date", ""
+            copy = [
+                f"INSERT OR IGNORE INTO fetch_batches (fetched_at) SELECT DISTINCT fetched_at FROM {old_table} "
+                "WHERE date > ? AND date <= ?;",
+                f"INSERT OR REPLACE INTO {new_table} ({cols}) "
+                f"SELECT {DEFAULT_ACCOUNT_ID}, {_EPOCH_OF.format(d='t.date')}, {hour}t.usage_kwh, b.id FROM {old_table} t "
+                "JOIN fetch_batches b ON b.fetched_at = t.fetched_at WHERE t.date > ? AND t.date <= ?;",
+            ]
+        else:
+            key, lo = "day", _MIN_DAY - 1
+            copy = [
+                f"INSERT OR REPLACE INTO {new_table} ({cols}) "
+                f"SELECT {DEFAULT_ACCOUNT_ID}, t.day, {hour}t.usage_kwh, t.batch FROM {old_table} t "
+                "WHERE t.day > ? AND t.day <= ?;",
+            ]
+        end = _MAX_DATE if source == 1 else _MAX_DAY
+        total = 0
+        while True:
+            row = self.conn.execute(
+                f"SELECT {key} FROM {old_table} WHERE {key} > ? ORDER BY {key} LIMIT 1 OFFSET ?;",
+                (lo, max(0, chunk_rows - 1)),
+            ).fetchone()
+            hi = row[0] if row else end
+            cur.execute("BEGIN IMMEDIATE;")
+            try:
+                for sql in copy:
+                    cur.execute(sql, (lo, hi))
+                total += cur.rowcount
+                cur.execute("COMMIT;")
+            except Exception:
+                cur.execute("ROLLBACK;")
+                raise
+            if progress:
+                progress(old_table, total, hi if row else None)
+            if not row:
+                return total
+            lo = hi
+            time.sleep(pause_sec)
+
+    # ---------- 保留策略（旧 hourly 数据降采样） ----------
+
+    def vacuum(self):
+        """一次性 VACUUM：重写整个文件，同时把旧库切换为 auto_vacuum=INCREMENTAL（期间独占数据库）"""
+        assert self.conn, "Database not connected"
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        self.conn.execute("VACUUM;")
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+    def apply_retention(self, policy: Optional[RetentionPolicy] = None, account: Optional[int] = None,
+                        today: Optional[date] = None, dry_run: bool = False, progress=None) -> Dict[str, Any]:
+        """
+        把早于 policy.cutoff() 的 hourly_usage_v3 行按 (账号, 日) 压缩进 hourly_compacted，返回报告
+        - 每块 chunk_days 天一个短事务（BEGIN IMMEDIATE）：先写日合计，再删逐小时行；
+          删除触发器按剩余的行重新求和（整日删除后 hourly_daily_totals 的该行随之删除），同一事务内再用压缩后的合计写回，
+          因此 iter_daily_totals / rollup_total('day') 对旧日期的结果与压缩前一致
+        - 压缩过的日期记在 hourly_retention，之后的 upsert_hourly 会跳过这些日期
+        - 库为 auto_vacuum=INCREMENTAL 时，按 vacuum_pages 分步 incremental_vacuum 归还空闲页；
+          否则空闲页留给之后的写入复用（旧库需先运行一次 `db.py --vacuum`）
+        account 为 None 时处理全部账号；dry_run=True 时只统计将被压缩的行
+        """
+        assert self.conn, "Database not connected"
+        if self.schema_version < 3:
+            raise ValueError(f"结构版本 {self.schema_version} 不支持保留策略，请先运行 db.py --migrate")
+        policy = policy or RetentionPolicy()
+        cutoff = policy.cutoff(today)
+        before_day = cutoff.toordinal() - _EPOCH_ORDINAL
+        ids = [account] if account is not None else [a["id"] for a in self.accounts()]
+        page_size = self.conn.execute("PRAGMA page_size;").fetchone()[0]
+        pages_before = self.conn.execute("PRAGMA page_count;").fetchone()[0]
+        report: Dict[str, Any] = {
+            "keep_months": policy.keep_months, "cutoff": cutoff.isoformat(), "dry_run": dry_run,
+            "accounts": {}, "rows_compacted": 0, "days_compacted": 0, "kwh_compacted": 0.0,
+        }
+        t0 = time.perf_counter()
+        kwh: List[float] = []
+        cur = self.conn.cursor()
+        try:
+            for acc in ids:
+                stats = self._compact_account(cur, int(acc), before_day, policy, dry_run, progress)
+                if stats["rows"]:
+                    report["accounts"][acc] = stats
+                    report["rows_compacted"] += stats["rows"]
+                    report["days_compacted"] += stats["days"]
+                    kwh.append(stats["kwh"])
         finally:
             cur.close()
-        return len(data)
+        report["kwh_compacted"] = math.fsum(kwh)
+        mode = self.conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+        report["auto_vacuum"] = {0: "none", 1: "full", 2: "incremental"}.get(mode, str(mode))
+        if mode == 2 and not dry_run:
+            while self.conn.execute("PRAGMA freelist_count;").fetchone()[0] > 0:
+                self.conn.execute(f"PRAGMA incremental_vacuum({int(policy.vacuum_pages)});").fetchall()
+                time.sleep(policy.pause_sec)
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        pages_after = self.conn.execute("PRAGMA page_count;").fetchone()[0]
+        free = self.conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        report["bytes_freed"] = (pages_before - pages_after) * page_size
+        report["free_bytes"] = free * page_size  # 仍留在文件内、可被之后的写入复用的空闲页
+        report["file_bytes"] = self.db_path.stat().st_size if self.db_path.exists() else 0
+        report["duration_sec"] = round(time.perf_counter() - t0, 3)
+        return report
 
-if __name__ == "__main__":
+    def _compact_account(self, cur: sqlite3.Cursor, account: int, before_day: int, policy: RetentionPolicy,
+                         dry_run: bool, progress) -> Dict[str, Any]:
+        """压缩一个账号早于 before_day 的 hourly 行；块的起点跳到下一个有数据的日期"""
+        stats: Dict[str, Any] = {"rows": 0, "days": 0, "kwh": 0.0}
+        sums: List[float] = []
+        lo = _MIN_DAY
+        while True:
+            row = self.conn.execute(
+                "SELECT MIN(day) FROM hourly_usage_v3 WHERE account = ? AND day >= ? AND day < ?;",
+                (account, lo, before_day),
+            ).fetchone()
+            if row[0] is None:
+                break
+            lo = row[0]
+            hi = min(lo + max(1, policy.chunk_days), before_day)
+            rng = (account, lo, hi)
+            if dry_run:
+                days = self.conn.execute(
+                    "SELECT SUM(usage_kwh), COUNT(*) FROM hourly_usage_v3 "
+                    "WHERE account = ? AND day >= ? AND day < ? GROUP BY day;", rng).fetchall()
+                rows = sum(n for _, n in days)
+            else:
+                cur.execute("BEGIN IMMEDIATE;")
+                try:
+                    days = cur.execute(
+                        "SELECT day, SUM(usage_kwh), COUNT(*) FROM hourly_usage_v3 "
+                        "WHERE account = ? AND day >= ? AND day < ? GROUP BY day;", rng).fetchall()
+                    now = datetime.now().isoformat(timespec="seconds")
+                    cur.executemany(
+                        """
+                        INSERT INTO hourly_compacted (account, day, usage_kwh, hours, compacted_at)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(account, day) DO UPDATE SET
+                            usage_kwh = usage_kwh + excluded.usage_kwh,
+                            hours = hours + excluded.hours,
+                            compacted_at = excluded.compacted_at;
+                        """,
+                        [(account, d, u, n, now) for d, u, n in days],
+                    )
+                    cur.execute("DELETE FROM hourly_usage_v3 WHERE account = ? AND day >= ? AND day < ?;", rng)
+                    rows = cur.rowcount
+                    if rows != sum(n for _, _, n in days):
+                        raise RuntimeError(f"账号 {account} 压缩的行数不一致: {rows}")
+                    cur.execute(
+                        f"""
+                        INSERT INTO hourly_daily_totals (account, date, usage_kwh, hours)
+                        SELECT account, {_V3_DATE}, usage_kwh, hours FROM hourly_compacted
+                        WHERE account = ? AND day >= ? AND day < ?
+                        ON CONFLICT(account, date) DO UPDATE SET
+                            usage_kwh = excluded.usage_kwh, hours = excluded.hours;
+                        """,
+                        rng,
+                    )
+                    cur.execute(
+                        """
+                        INSERT INTO hourly_retention (account, compacted_before, keep_months, updated_at)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(account) DO UPDATE SET
+                            compacted_before = MAX(compacted_before, excluded.compacted_before),
+                            keep_months = excluded.keep_months, updated_at = excluded.updated_at;
+                        """,
+                        (account, hi, policy.keep_months, now),
+                    )
+                    cur.execute("COMMIT;")
+                except Exception:
+                    cur.execute("ROLLBACK;")
+                    raise
+                days = [(u, n) for _, u, n in days]
+            stats["rows"] += rows
+            stats["days"] += len(days)
+            sums.extend(u for u, _ in days)
+            if progress:
+                progress(account, stats["rows"], date.fromordinal(hi - 1 + _EPOCH_ORDINAL))
+            lo = hi
+            if not dry_run:
+                time.sleep(policy.pause_sec)
+        stats["kwh"] = math.fsum(sums)
+        return stats
+
+    # ---------- 原始 payload 存档 ----------
+
+    def archive_payload(self, kind: str, payload: Dict[str, Any], target_date: Optional[Any] = None,
+                        fetched_at: Optional[datetime] = None) -> Tuple[str, bool]:
+        """
+        压缩存档一份图表 payload，返回 (hash, unchanged)
+        存档以 (hash, kind, target_date) 为键：相同内容出现在另一天时另存一行，已有行的日期归属不会被改写
+        unchanged 为 True 表示与该 kind 最近一次入库的 payload 内容相同（hourly 还要求日期归属一致），
+        调用方可以跳过解析和 upsert
+        """
+        assert self.conn, "Database not connected"
+        raw = canonical_payload(payload)
+        digest = hashlib.sha256(raw).hexdigest()
+        ts = _to_iso_ts(fetched_at)
+        target = _to_iso_date(target_date) if target_date is not None else ""
+        last = self.last_ingested_payload(kind)
+        cur = self.conn.execute(
+            "UPDATE raw_payloads SET last_fetched_at = ?, fetch_count = fetch_count + 1 "
+            "WHERE hash = ? AND kind = ? AND target_date = ?;",
+            (ts, digest, kind, target),
+        )
+        if cur.rowcount == 0:
+            self.conn.execute(
+                """
+                INSERT INTO raw_payloads (hash, kind, target_date, first_fetched_at, last_fetched_at, raw_size, payload)
+                VALUES (?, ?, ?, ?, ?, ?, ?);
+                """,
+                (digest, kind, target, ts, ts, len(raw), zlib.compress(raw, 6)),
+            )
+        unchanged = last is not None and last[0] == digest and (last[1] or "") == target
+        return digest, unchanged
+
+    def last_ingested_payload(self, kind: str) -> Optional[Tuple[str, Optional[str]]]:
+        """该 kind 最近一次入库的 (hash, target_date)；daily 的 target_date 为 None"""
+        assert self.conn, "Database not connected"
+        row = self.conn.execute(
+            "SELECT hash, target_date FROM raw_payloads WHERE kind = ? AND ingested_at IS NOT NULL "
+            "ORDER BY ingested_at DESC LIMIT 1;",
+            (kind,),
+        ).fetchone()
+        return (row[0], row[1] or None) if row else None
+
+    def mark_payloads_ingested(self, keys: Iterable[Union[str, Tuple[str, Optional[Any]]]],
+                               at: Optional[datetime] = None):
+        """
+        标记已入库的存档：keys 中的元素为 (hash, target_date) 时只标记该日期的那一行，
+        为 hash 字符串时标记该 hash 的所有行
+        """
+        assert self.conn, "Database not connected"
+        ts = _to_iso_ts(at)
+        for key in keys:
+            if isinstance(key, str):
+                self.conn.execute("UPDATE raw_payloads SET ingested_at = ? WHERE hash = ?;", (ts, key))
+            else:
+                digest, target = key
+                target = _to_iso_date(target) if target is not None else ""
+                self.conn.execute("UPDATE raw_payloads SET ingested_at = ? WHERE hash = ? AND target_date = ?;",
+                                  (ts, digest, target))
+
+    def iter_archived_payloads(self, kind: Optional[str] = None, since: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """按首次抓取时间顺序逐条解压返回存档（payload 为 dict）"""
+        assert self.conn, "Database not connected"
+        sql = "SELECT hash, kind, target_date, first_fetched_at, last_fetched_at, payload FROM raw_payloads WHERE 1=1"
+        params: List[Any] = []
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        if since:
+            sql += " AND last_fetched_at >= ?"
+            params.append(since.isoformat())
+        for r in self.conn.execute(sql + " ORDER BY first_fetched_at;", params):
+            d = dict(r)
+            d["target_date"] = d["target_date"] or None
+            d["payload"] = json.loads(zlib.decompress(d["payload"]))
+            yield d
+
+    def reparse_archive(self, kind: Optional[str] = None, since: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        离线重新解析存档的 payload 并 upsert（解析器修改后使用，无需重新抓取）
+        daily 的年份按该 payload 首次抓取的日期推断，与当时在线解析的结果一致
+        """
+        stats: Dict[str, Any] = {"payloads": 0, "daily": UpsertResult(), "hourly": UpsertResult()}
+        for item in self.iter_archived_payloads(kind, since):
+            first = datetime.fromisoformat(item["first_fetched_at"])
+            last = datetime.fromisoformat(item["last_fetched_at"])
+            if item["kind"] == "daily":
+                # 年份推断以首次抓取日为“今天”
+                cols = parse_daily_columns(item["payload"], fetched_at=first)
+                cols.fetched_at = last
+                stats["daily"] += self.upsert_daily(cols)
+            else:
+                target = date.fromisoformat(item["target_date"]) if item["target_date"] else first.date()
+                cols = parse_hourly_columns(item["payload"], target_date=target, fetched_at=last)
+                stats["hourly"] += self.upsert_hourly(cols)
+            stats["payloads"] += 1
+        stats["daily"] = stats["daily"].as_dict()
+        stats["hourly"] = stats["hourly"].as_dict()
+        return stats
+
+def _numpy_columns(cols: UsageColumns, float_dtype: str) -> Dict[str, Any]:
+    out = cols.to_numpy()
+    if float_dtype != "float64":
+        out["usage_kwh"] = out["usage_kwh"].astype(float_dtype)
+    return out
+
+def _concat_numpy(chunks: Iterable[Dict[str, Any]], hourly: bool, float_dtype: str) -> Dict[str, Any]:
+    import numpy as np
+    chunks = list(chunks)
+    if len(chunks) == 1:
+        return chunks[0]
+    if not chunks:
+        out = {"date": np.empty(0, dtype="datetime64[D]"), "usage_kwh": np.empty(0, dtype=float_dtype)}
+        if hourly:
+            out["hour"] = np.empty(0, dtype=np.int8)
+        return out
+    return {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+
+class PayloadArchive:
+    """
+    KyudenScraper(payload_archive=...) 使用的存档适配器，每次调用短暂打开数据库（表结构只在第一次调用时初始化）
+    skip_unchanged=False 时只存档、不跳过解析
+    """
+
+    def __init__(self, db_path: Union[str, Path], skip_unchanged: bool = True):
+        self.db_path = Path(db_path)
+        self.skip_unchanged = skip_unchanged
+        self._schema_ready = False
+
+    def observe(self, kind: str, payload: Dict[str, Any], target_date: Optional[Any] = None) -> Tuple[str, bool]:
+        with KyudenSQLite(self.db_path) as db:
+            if not self._schema_ready:
+                db.init_schema()
+                self._schema_ready = True
+            digest, unchanged = db.archive_payload(kind, payload, target_date)
+        return digest, unchanged and self.skip_unchanged
+
+    def mark_ingested(self, keys: Iterable[Union[str, Tuple[str, Optional[Any]]]]):
+        keys = list(keys)
+        if not keys:
+            return
+        with KyudenSQLite(self.db_path) as db:
+            db.mark_payloads_ingested(keys)
+
+def print_run_stats(stats: Dict[str, Any]):
+    window = f"{stats['since']} ~ {stats['until'] or 'now'}"
+    print(f"runs: {stats['runs']}  window: {window}  mode: {stats['mode'] or 'all'}")
+    if not stats["runs"]:
+        return
+    print(f"outcomes: {stats['outcomes']}")
+    print(f"sessions: {stats['sessions']}  login retries: {stats['login_retries']}")
+    print(f"rows upserted: daily={stats['rows_daily']} hourly={stats['rows_hourly']}")
+    durations = stats["durations"]
+    cols = [k for k in next(iter(durations.values())) if k != "n"]
+    print(f"{'phase':<14}{'n':>6}" + "".join(f"{c + '(s)':>10}" for c in cols))
+    for name, s in durations.items():
+        print(f"{name:<14}{s['n']:>6}" + "".join(f"{s[c]:>10.3f}" for c in cols))
+
+def print_migration_report(report: Dict[str, Any]):
+    if not report.get("migrated"):
+        print(f"schema already at version {report['schema_version']}, nothing to migrate")
+        return
+    mib = lambda n: f"{n / 1048576:.2f} MiB"
+    before, after = report["before"], report["after"]
+    print(f"migrated schema v{report['from_version']} -> v{report['to_version']} in {report['duration_sec']}s: "
+          + ", ".join(f"{t} {n} rows" for t, n in report["rows"].items()))
+    print(f"used:  {mib(before['used_bytes'])} -> {mib(after['used_bytes'])}")
+    print(f"file:  {mib(before['file_bytes'])} -> {mib(after['file_bytes'])}")
+    for name in sorted(set(before.get("objects", {})) | set(after.get("objects", {}))):
+        print(f"  {name:<28}{before.get('objects', {}).get(name, 0):>12} -> {after.get('objects', {}).get(name, 0):>12} bytes")
+    for key in ("hourly_columns", "hourly_records"):
+        print(f"scan {key}: {before['scan_rows_per_sec'][key]} -> {after['scan_rows_per_sec'][key]} rows/s "
+              f"({after['scan_rows_per_sec']['rows']} rows)")
+
+def write_query_csv(db: KyudenSQLite, what: str, start: Optional[str], end: Optional[str], top: int = 10):
+    import csv
+    import sys
+    w = csv.writer(sys.stdout)
+    if what == "daily":
+        w.writerow(["date", "usage_kwh", "fetched_at"])
+        w.writerows((r.date.isoformat(), r.usage_kwh, r.timestamp.isoformat()) for r in db.iter_daily(start, end))
+    elif what == "hourly":
+        w.writerow(["date", "hour", "usage_kwh", "fetched_at"])
+        w.writerows((r.date_str, r.hour, r.usage_kwh, r.timestamp.isoformat()) for r in db.iter_hourly(start, end))
+    elif what == "profile":
+        w.writerow(["hour", "avg_kwh", "min_kwh", "max_kwh", "days"])
+        w.writerows((p["hour"], round(p["avg_kwh"], 4), p["min_kwh"], p["max_kwh"], p["days"])
+                    for p in db.hour_of_day_profile(start, end))
+    elif what == "peaks":
+        w.writerow(["date", "hour", "usage_kwh"])
+        w.writerows((r.date_str, r.hour, r.usage_kwh) for r in db.top_peak_hours(top, start, end))
+    else:
+        w.writerow(["date", "usage_kwh", "hours"])
+        w.writerows((d.isoformat(), round(u, 4), h) for d, u, h in db.iter_daily_totals(start, end))
+
+def main(argv: Optional[List[str]] = None):
     import argparse
     parser = argparse.ArgumentParser(description="Kyuden SQLite DB manager")
     parser.add_argument("--db", default=str(DEFAULT_DB_PATH), help="SQLite 文件路径")
     parser.add_argument("--init", action="store_true", help="初始化数据库表结构")
-    args = parser.parse_args()
+    parser.add_argument("--migrate", action="store_true", help="把用电量表在线迁移到最新结构版本，并报告前后的大小与扫描速度")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="VACUUM 回收文件空间并切换为增量 auto_vacuum（与 --migrate 一起使用时在迁移后执行）")
+    sub = parser.add_subparsers(dest="command")
+
+    runs = sub.add_parser("runs", help="采集运行记录的统计（结果分布与耗时百分位）")
+    runs.add_argument("--since", default="7d", help="窗口起点: 7d / 24h / 30m 或 ISO 日期时间（默认 7d）")
+    runs.add_argument("--until", default=None, help="窗口终点（ISO，默认现在）")
+    runs.add_argument("-m", "--mode", choices=["daily", "hourly", "both"], default=None)
+    runs.add_argument("--json", action="store_true", help="以 JSON 输出")
+
+    q = sub.add_parser("query", help="读取数据并以 CSV 输出到 stdout")
+    q.add_argument("what", choices=["daily", "hourly", "profile", "peaks", "totals"])
+    q.add_argument("--from", dest="date_from", default=None, help="起始日期 YYYY-MM-DD")
+    q.add_argument("--to", dest="date_to", default=None, help="结束日期 YYYY-MM-DD")
+    q.add_argument("-n", "--top", type=int, default=10, help="peaks 返回的条数")
+
+    sub.add_parser("rebuild-rollups", help="从明细表重建 hourly_daily_totals / weekly_usage / monthly_usage")
+
+    rp = sub.add_parser("reparse", help="用当前解析器重新解析存档的原始 payload 并入库")
+    rp.add_argument("--kind", choices=["daily", "hourly"], default=None)
+    rp.add_argument("--since", default=None, help="只处理该时间之后抓取过的 payload（7d / ISO）")
+
+    im = sub.add_parser("import", help="导入 KyudenScraper.save() 留下的 CSV / JSON 导出文件（不需要 pandas）")
+    im.add_argument("patterns", nargs="+", help="文件或 glob，例如 'exports/kyuden_*.csv' 'exports/**/*.json'")
+    im.add_argument("--workers", type=int, default=None, help="解析进程数（默认 CPU 数，1 表示不使用进程池）")
+    im.add_argument("--batch-rows", type=int, default=50_000, help="每个写事务的行数")
+    im.add_argument("--account", type=int, default=DEFAULT_ACCOUNT_ID, help="写入的账号（accounts.id）")
+    im.add_argument("--json", action="store_true", help="以 JSON 输出报告")
+
+    rt = sub.add_parser("retention", help="把超过保留期的 hourly 数据压缩为每日合计，并增量回收空间")
+    rt.add_argument("--keep-months", type=int, default=int(os.getenv("KYUDEN_HOURLY_KEEP_MONTHS", "12")),
+                    help="保留逐小时数据的月数（默认取 KYUDEN_HOURLY_KEEP_MONTHS，否则 12）")
+    rt.add_argument("--account", type=int, default=None, help="只处理该账号（accounts.id），默认全部")
+    rt.add_argument("--chunk-days", type=int, default=31, help="每个事务压缩的天数")
+    rt.add_argument("--vacuum-pages", type=int, default=1024, help="每次 incremental_vacuum 归还的页数")
+    rt.add_argument("--dry-run", action="store_true", help="只统计将被压缩的行，不写入")
+    args = parser.parse_args(argv)
 
     with KyudenSQLite(Path(args.db)) as db:
-        if args.init:
+        if args.init or args.command:
             db.init_schema()
-            print(f"Initialized schema in {db.db_path}")
\ No newline at end of file
+        if args.init:
+            print(f"Initialized schema in {db.db_path}")
+        if args.migrate:
+            report = db.migrate(
+                vacuum=args.vacuum,
+                progress=lambda table, rows, upto: print(f"  {table}: {rows} rows copied" + (f" (<= {upto})" if upto else "")),
+            )
+            print_migration_report(report)
+        elif args.vacuum:
+            db.vacuum()
+            print(json.dumps(db.storage_stats(), ensure_ascii=False))
+        if args.command == "runs":
+            until = datetime.fromisoformat(args.until) if args.until else None
+            stats = db.run_stats(parse_since(args.since), until, args.mode)
+            if args.json:
+                print(json.dumps(stats, ensure_ascii=False, indent=2))
+            else:
+                print_run_stats(stats)
+        elif args.command == "query":
+            write_query_csv(db, args.what, args.date_from, args.date_to, args.top)
+        elif args.command == "rebuild-rollups":
+            print(json.dumps(db.rebuild_rollups(), ensure_ascii=False))
+        elif args.command == "reparse":
+            stats = db.reparse_archive(args.kind, parse_since(args.since) if args.since else None)
+            print(json.dumps(stats, ensure_ascii=False))
+        elif args.command == "import":
+            from importer import expand_patterns, import_exports, print_import_report
+            paths = expand_patterns(args.patterns)
+            print(f"importing {len(paths)} files")
+            report = import_exports(
+                db, paths, args.workers, args.batch_rows, args.account,
+                progress=lambda done, total: print(f"  {done}/{total} files parsed"),
+            )
+            if args.json:
+                print(json.dumps(report, ensure_ascii=False, indent=2))
+            else:
+                print_import_report(report)
+        elif args.command == "retention":
+            policy = RetentionPolicy(args.keep_months, args.chunk_days, args.vacuum_pages)
+            report = db.apply_retention(
+                policy, args.account, dry_run=args.dry_run,
+                progress=lambda acc, rows, upto: print(f"  account {acc}: {rows} hourly rows compacted (<= {upto})"),
+            )
+            print(json.dumps(report, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
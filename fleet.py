@@ -0,0 +1,215 @@
+"""
+多账号采集：共享一个 Browser，每个账号使用独立的 context（new_context）
+并发上限由 concurrency 控制，内存与启动开销只随并发 context 数增长，而不是账号数
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Union
+
+from kyuden_scraper import KyudenScraper, launch_chromium
+from db import KyudenSQLite
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class FleetAccount:
+    """一个九电账号及其独立的 storage state 文件"""
+    name: str
+    username: str
+    password: str
+    storage_state_path: Optional[Union[str, Path]] = None
+    max_login_retries: int = 2
+
+@dataclass
+class AccountResult:
+    """单个账号的采集结果与耗时"""
+    name: str
+    ok: bool
+    daily: Optional[list] = None
+    hourly: Optional[list] = None
+    elapsed_sec: float = 0.0
+    queued_sec: float = 0.0
+    error: Optional[str] = None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "ok": self.ok,
+            "daily": len(self.daily) if self.daily is not None else None,
+            "hourly": len(self.hourly) if self.hourly is not None else None,
+            "elapsed_sec": round(self.elapsed_sec, 3),
+            "queued_sec": round(self.queued_sec, 3),
+            "error": self.error,
+        }
+
+def load_accounts(path: Union[str, Path]) -> List[FleetAccount]:
+    """
+    从 JSON 文件读取账号列表，格式:
+    [{"name": "home", "username": "...", "password": "...", "storage_state_path": "state/home.json"}, ...]
+    password 可写成 "env:VAR_NAME" 以从环境变量读取
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    accounts = []
+    for item in items:
+        password = item["password"]
+        if isinstance(password, str) and password.startswith("env:"):
+            password = os.getenv(password[4:], "")
+        accounts.append(FleetAccount(
+            name=item.get("name") or item["username"],
+            username=item["username"],
+            password=password,
+            storage_state_path=item.get("storage_state_path"),
+            max_login_retries=int(item.get("max_login_retries", 2)),
+        ))
+    return accounts
+
+class KyudenFleet:
+    """
+    在一个共享 Browser 上为多个账号采集数据
+    pacing 为节奏档位名（cautious / normal / minimal），sleep_budget_sec 为每个账号一次运行的睡眠预算；
+    每个账号的 KyudenScraper 各自按档位新建 PacingPolicy，预算与阶段统计互不影响
+    多账号采集不使用 payload_archive：存档按内容哈希去重、不区分账号，
+    不同账号内容相同的 payload 会被误判为“未变化”
+    """
+
+    def __init__(
+        self,
+        accounts: List[FleetAccount],
+        concurrency: int = 2,
+        headless: bool = True,
+        browser=None,
+        pacing: Optional[str] = None,
+        sleep_budget_sec: Optional[float] = None,
+    ):
+        self.accounts = list(accounts)
+        self.concurrency = max(1, concurrency)
+        self.headless = headless
+        self.pacing = pacing
+        self.sleep_budget_sec = sleep_budget_sec
+        # 外部传入的 browser 由调用方负责关闭（例如常驻模式）
+        self._external_browser = browser
+
+    async def _collect_one(
+        self,
+        browser,
+        sem: asyncio.Semaphore,
+        account: FleetAccount,
+        mode: str,
+        hourly_target_date,
+    ) -> AccountResult:
+        queued_at = time.perf_counter()
+        async with sem:
+            started = time.perf_counter()
+            scraper = KyudenScraper(
+                storage_state_path=account.storage_state_path,
+                max_login_retries=account.max_login_retries,
+                browser=browser,
+                pacing=self.pacing,
+                sleep_budget_sec=self.sleep_budget_sec,
+            )
+            try:
+                data = await scraper.scrape(
+                    account.username,
+                    account.password,
+                    mode=mode,
+                    save_format="none",
+                    headless=self.headless,
+                    hourly_target_date=hourly_target_date,
+                )
+                ok = bool(data)
+                return AccountResult(
+                    name=account.name,
+                    ok=ok,
+                    daily=data.get("daily"),
+                    hourly=data.get("hourly"),
+                    elapsed_sec=time.perf_counter() - started,
+                    queued_sec=started - queued_at,
+                    error=None if ok else "scrape returned no data",
+                )
+            except Exception as e:
+                logger.error(f"[{account.name}] 采集失败: {e}")
+                return AccountResult(
+                    name=account.name,
+                    ok=False,
+                    elapsed_sec=time.perf_counter() - started,
+                    queued_sec=started - queued_at,
+                    error=str(e),
+                )
+
+    async def run(self, mode: str = "hourly", hourly_target_date=None) -> List[AccountResult]:
+        """按账号顺序返回结果；任何单个账号失败都不会影响其它账号"""
+        assert mode in ("daily", "hourly", "both")
+        playwright = None
+        browser = self._external_browser
+        if browser is None:
+            from playwright.async_api import async_playwright
+            playwright = await async_playwright().start()
+            browser = await launch_chromium(playwright, headless=self.headless)
+
+        sem = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(
+                self._collect_one(browser, sem, acc, mode, hourly_target_date)
+                for acc in self.accounts
+            ))
+        finally:
+            if playwright is not None:
+                await browser.close()
+                await playwright.stop()
+        ok = sum(1 for r in results if r.ok)
+        logger.info(
+            f"多账号采集完成: {ok}/{len(results)} 成功，并发={self.concurrency}，"
+            f"总耗时 {time.perf_counter() - started:.1f}s"
+        )
+        return list(results)
+
+def store_results(results: List[AccountResult], db_path: Union[str, Path]) -> Dict[str, Dict[str, Any]]:
+    """把成功账号的数据按账号名（accounts 表，不存在则新建）upsert 进同一个库，返回各账号的写入统计"""
+    written: Dict[str, Dict[str, Any]] = {}
+    with KyudenSQLite(Path(db_path)) as db:
+        db.init_schema()
+        for r in results:
+            if not r.ok:
+                continue
+            account = db.account_id(r.name)
+            stats: Dict[str, Any] = {"account_id": account}
+            if r.daily:
+                stats["daily"] = db.upsert_daily(r.daily, account=account).as_dict()
+            if r.hourly:
+                stats["hourly"] = db.upsert_hourly(r.hourly, account=account).as_dict()
+            written[r.name] = stats
+    return written
+
+async def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Kyuden multi-account collector (shared browser)")
+    parser.add_argument("accounts", help="账号列表 JSON 文件")
+    parser.add_argument("-m", "--mode", choices=["daily", "hourly", "both"], default="hourly")
+    parser.add_argument("--hourly-date", help="小时数据归属日期（YYYY-MM-DD）")
+    parser.add_argument("-c", "--concurrency", type=int, default=int(os.getenv("KYUDEN_FLEET_CONCURRENCY", "2")))
+    parser.add_argument("--no-headless", action="store_true", help="Force headed mode")
+    parser.add_argument("--pacing", choices=["cautious", "normal", "minimal"], default=os.getenv("KYUDEN_PACING", "normal"),
+                        help="拟人化等待的节奏档位（每个账号各自计算）")
+    parser.add_argument("--sleep-budget", type=float, default=None, help="每个账号一次运行的拟人化等待预算（秒）")
+    parser.add_argument("--db", default=None, help="按账号名写入该 SQLite 库（需要结构版本 3）")
+    args = parser.parse_args()
+
+    fleet = KyudenFleet(load_accounts(args.accounts), concurrency=args.concurrency, headless=not args.no_headless,
+                        pacing=args.pacing, sleep_budget_sec=args.sleep_budget)
+    results = await fleet.run(mode=args.mode, hourly_target_date=args.hourly_date)
+    print(json.dumps([r.summary() for r in results], ensure_ascii=False, indent=2))
+    if args.db:
+        written = store_results(results, args.db)
+        logger.info(f"已写入 {args.db}: {json.dumps(written, ensure_ascii=False)}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    asyncio.run(main())
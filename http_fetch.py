@@ -0,0 +1,158 @@
+"""
+无浏览器的快速通道：用 storage state 中保存的 cookie 直接请求图表页面，
+从隐藏字段 input[name="body_0$Data"] 中取出图表 JSON
+
+遇到登录跳转、找不到字段等情况时抛出 FastPathUnavailable，由调用方回退到 Playwright
+"""
+
+import re
+import json
+import html
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# 只扫描 <input ...> 标签，属性顺序不限
+_DATA_INPUT_RE = re.compile(r'<input\b[^>]*\bname\s*=\s*["\']body_0\$Data["\'][^>]*>', re.IGNORECASE | re.DOTALL)
+_VALUE_ATTR_RE = re.compile(r'\bvalue\s*=\s*(["\'])(.*?)\1', re.DOTALL)
+# 登录页特征：账号输入框
+_LOGIN_FORM_MARKER = 'body_1$TxtKaiinId'
+
+class FastPathUnavailable(Exception):
+    """快速通道不可用（未登录 / 页面结构变化 / 网络错误），需回退到浏览器"""
+
+def extract_chart_payload(page_html: str) -> Dict[str, Any]:
+    """从图表页 HTML 中提取并解码 body_0$Data 的 JSON"""
+    tag = _DATA_INPUT_RE.search(page_html)
+    if not tag:
+        raise FastPathUnavailable("未找到 body_0$Data 字段")
+    value = _VALUE_ATTR_RE.search(tag.group(0))
+    if not value or not value.group(2):
+        raise FastPathUnavailable("body_0$Data 字段为空")
+    try:
+        return json.loads(html.unescape(value.group(2)))
+    except ValueError as e:
+        raise FastPathUnavailable(f"body_0$Data 不是合法 JSON: {e}")
+
+class KyudenHttpFetcher:
+    """
+    基于 requests.Session 连接池的图表抓取器（阻塞调用放到线程中执行，不阻塞事件循环）
+
+    requests.Session 不保证线程安全，而 fetch_payload 会在多个线程中并发执行，
+    因此每个线程使用自己的 Session；cookie 从同一份 storage state 装入，save_cookies 时合并各线程的续期结果
+    """
+
+    def __init__(
+        self,
+        storage_state_path: Union[str, Path],
+        base_url: str = "https://my.kyuden.co.jp",
+        timeout: float = 10.0,
+        pool_size: int = 4,
+    ):
+        self.storage_state_path = Path(storage_state_path)
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._cookies = requests.cookies.RequestsCookieJar()
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self._state: Optional[Dict[str, Any]] = None
+
+    @property
+    def session(self) -> requests.Session:
+        """当前线程的 Session（首次使用时创建）"""
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.headers.update({
+                "User-Agent": USER_AGENT,
+                "Accept-Language": "ja-JP,ja;q=0.9,en-US;q=0.8,en;q=0.7",
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            })
+            with self._lock:
+                s.cookies.update(self._cookies)
+                self._sessions.append(s)
+            self._local.session = s
+        return s
+
+    def load_cookies(self) -> int:
+        """把 storage state 里的 cookie 装入 cookie 模板（之后创建的各线程 Session 都会带上），返回装入数量"""
+        if not self.storage_state_path.exists():
+            raise FastPathUnavailable(f"storage state 不存在: {self.storage_state_path}")
+        with open(self.storage_state_path, "r", encoding="utf-8") as f:
+            self._state = json.load(f)
+        count = 0
+        with self._lock:
+            for c in self._state.get("cookies", []):
+                self._cookies.set(
+                    c["name"], c["value"],
+                    domain=c.get("domain", ""), path=c.get("path", "/"),
+                    secure=bool(c.get("secure")),
+                )
+                count += 1
+            for s in self._sessions:
+                s.cookies.update(self._cookies)
+        if not count:
+            raise FastPathUnavailable("storage state 中没有 cookie")
+        return count
+
+    def _looks_like_login(self, resp: requests.Response) -> bool:
+        path = urlparse(resp.url).path.rstrip("/")
+        if path in ("/member", "/member/login"):
+            return True
+        return _LOGIN_FORM_MARKER in resp.text
+
+    def fetch_payload_sync(self, url: str) -> Dict[str, Any]:
+        try:
+            resp = self.session.get(url, timeout=self.timeout, allow_redirects=True)
+        except requests.RequestException as e:
+            raise FastPathUnavailable(f"请求失败: {e}")
+        if resp.status_code != 200:
+            raise FastPathUnavailable(f"HTTP {resp.status_code}: {url}")
+        if self._looks_like_login(resp):
+            raise FastPathUnavailable("被重定向到登录页，登录态已失效")
+        return extract_chart_payload(resp.text)
+
+    async def fetch_payload(self, url: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.fetch_payload_sync, url)
+
+    def save_cookies(self):
+        """服务端续期的 cookie 写回 storage state，浏览器下次启动时也能用上"""
+        if not self._state:
+            return
+        with self._lock:
+            jar = {(c.name, c.domain): c for s in self._sessions for c in s.cookies}
+        changed = False
+        for c in self._state.get("cookies", []):
+            fresh = jar.get((c["name"], c.get("domain", "")))
+            if fresh is not None and fresh.value != c["value"]:
+                c["value"] = fresh.value
+                if fresh.expires:
+                    c["expires"] = fresh.expires
+                changed = True
+        if changed:
+            tmp = self.storage_state_path.with_suffix(self.storage_state_path.suffix + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, ensure_ascii=False)
+            tmp.replace(self.storage_state_path)
+            logger.info("已将续期后的 cookie 写回 storage state")
+
+    def close(self):
+        with self._lock:
+            for s in self._sessions:
+                s.close()
+            self._sessions.clear()
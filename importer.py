@@ -0,0 +1,243 @@
+"""
+导入旧的导出文件：把 KyudenScraper.save() 留下的 kyuden_daily_*.csv / kyuden_hourly_*.json 等写入 SQLite
+
+- 不依赖 pandas：CSV 用 csv 模块逐行读取（utf-8-sig，兼容 to_csv 写入的 BOM），JSON 用 json 模块
+- 按列判断种类：有 hour 列的是 hourly，否则是 daily
+- 每个文件是一份快照，快照时间取文件内最大的 timestamp（没有时取文件名中的时间戳，再退回到修改时间）；
+  同一 (日期[, 小时]) 出现在多份快照中时保留快照时间最新的值
+- 解析在进程池中进行，同时在途的文件数有上限；主进程只保留去重后的值，
+  内存与数据覆盖的日期 × 小时数成正比，与文件数量无关
+- 去重后按日期顺序分批写入，每批一个事务（走 KyudenSQLite 的变化检测 upsert，汇总表由触发器维护）；
+  库中已有且最近确认时间（值变化时的抓取时间，或最近一次抓取批次的时间）比快照更新的行不会被覆盖
+"""
+
+import os
+import csv
+import glob
+import json
+import time
+import logging
+import concurrent.futures as cf
+from array import array
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, Iterable
+
+from columnar import UsageColumns
+from db import KyudenSQLite, DEFAULT_ACCOUNT_ID
+
+logger = logging.getLogger(__name__)
+
+def expand_patterns(patterns: Iterable[str]) -> List[Path]:
+    """展开 glob（支持 **），去重并按路径排序；不匹配任何文件的模式按普通路径处理"""
+    paths = set()
+    for pattern in patterns:
+        matched = glob.glob(os.path.expanduser(pattern), recursive=True)
+        paths.update(matched or ([pattern] if os.path.exists(pattern) else []))
+    return sorted(Path(p) for p in paths if os.path.isfile(p))
+
+def _snapshot_from_name(path: Path) -> Optional[datetime]:
+    """kyuden_daily_20250901_170331.csv -> 2025-09-01 17:03:31"""
+    parts = path.stem.split("_")
+    if len(parts) >= 2:
+        try:
+            return datetime.strptime(f"{parts[-2]}_{parts[-1]}", "%Y%m%d_%H%M%S")
+        except ValueError:
+            pass
+    return None
+
+def _iter_records(path: Path) -> Iterable[Dict[str, Any]]:
+    if path.suffix.lower() == ".json":
+        with open(path, encoding="utf-8-sig") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("records") or data.get("data") or []
+        yield from data
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            yield from csv.DictReader(f)
+
+def parse_export_file(path: Path) -> Tuple[str, Optional[UsageColumns], int, Optional[str]]:
+    """
+    解析一个导出文件，返回 (路径, 列式数据, 文件字节数, 错误)；在工作进程中运行
+    列式数据的 fetched_at 为该文件的快照时间
+    """
+    path = Path(path)
+    try:
+        size = path.stat().st_size
+        days, usage, hours = array("l"), array("d"), array("b")
+        hourly: Optional[bool] = None
+        latest: Optional[datetime] = None
+        for r in _iter_records(path):
+            if hourly is None:
+                hourly = "hour" in r
+            value = r.get("usage_kwh")
+            if value in (None, ""):
+                continue
+            day = r.get("date") or ""
+            days.append(date.fromisoformat(str(day)[:10]).toordinal())
+            usage.append(float(value))
+            if hourly:
+                hours.append(int(float(r["hour"])))
+            ts = r.get("timestamp") or r.get("fetched_at")
+            if ts:
+                ts = datetime.fromisoformat(str(ts))
+                if latest is None or ts > latest:
+                    latest = ts
+        if not usage:
+            return str(path), None, size, None
+        snapshot = latest or _snapshot_from_name(path) or datetime.fromtimestamp(path.stat().st_mtime)
+        return str(path), UsageColumns(days, usage, hours=hours if hourly else None, fetched_at=snapshot), size, None
+    except Exception as e:
+        return str(path), None, 0, f"{type(e).__name__}: {e}"
+
+class SnapshotMerger:
+    """按 (日期[, 小时]) 保留快照时间最新的值；键为 ordinal（daily）或 ordinal * 24 + hour（hourly）"""
+
+    def __init__(self):
+        self.latest: Dict[str, Dict[int, Tuple[datetime, float]]] = {"daily": {}, "hourly": {}}
+        self.rows_read = {"daily": 0, "hourly": 0}
+
+    def add(self, cols: UsageColumns):
+        kind = "hourly" if cols.is_hourly else "daily"
+        target = self.latest[kind]
+        ts = cols.fetched_at
+        if cols.hours is None:
+            keys: Iterable[int] = cols.days
+        else:
+            keys = (d * 24 + h for d, h in zip(cols.days, cols.hours))
+        for key, u in zip(keys, cols.usage):
+            old = target.get(key)
+            if old is None or ts >= old[0]:
+                target[key] = (ts, u)
+        self.rows_read[kind] += len(cols)
+
+    def batches(self, kind: str, batch_rows: int) -> Iterable[List[Tuple]]:
+        """按日期顺序产出 upsert 元组：(date, usage, ts) 或 (date, hour, usage, ts)"""
+        items = self.latest[kind]
+        batch: List[Tuple] = []
+        iso: Dict[int, str] = {}
+        stamps: Dict[datetime, str] = {}
+        for key in sorted(items):
+            ts, u = items[key]
+            s = stamps.get(ts) or stamps.setdefault(ts, ts.isoformat())
+            if kind == "hourly":
+                d, h = divmod(key, 24)
+                day = iso.get(d) or iso.setdefault(d, date.fromordinal(d).isoformat())
+                batch.append((day, h, u, s))
+            else:
+                day = iso.get(key) or iso.setdefault(key, date.fromordinal(key).isoformat())
+                batch.append((day, u, s))
+            if len(batch) >= batch_rows:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def _parse_all(paths: List[Path], workers: int, merger: SnapshotMerger, report: Dict[str, Any], progress):
+    """在进程池中解析，最多 workers * 4 个文件同时在途，结果一到就并入 merger"""
+    def take(result):
+        path, cols, size, error = result
+        report["files"] += 1
+        report["bytes"] += size
+        if error:
+            report["errors"].append({"file": path, "error": error})
+            logger.warning(f"解析失败 {path}: {error}")
+        elif cols is not None:
+            merger.add(cols)
+        if progress and report["files"] % 500 == 0:
+            progress(report["files"], len(paths))
+
+    if workers <= 1:
+        for p in paths:
+            take(parse_export_file(p))
+        return
+    with cf.ProcessPoolExecutor(max_workers=workers) as pool:
+        inflight = set()
+        for p in paths:
+            inflight.add(pool.submit(parse_export_file, p))
+            if len(inflight) >= workers * 4:
+                done, inflight = cf.wait(inflight, return_when=cf.FIRST_COMPLETED)
+                for fut in done:
+                    take(fut.result())
+        for fut in cf.as_completed(inflight):
+            take(fut.result())
+
+def _existing_stamps(db: KyudenSQLite, kind: str, batch: List[Tuple], account: int) -> Dict[Tuple, str]:
+    """
+    库中每行的值最近一次被确认的时间：fetched_at 只在值变化时写入，
+    最近一次 upsert 批次（usage_last_seen）覆盖的日期还要取该批次的抓取时间
+    """
+    start, end = batch[0][0], batch[-1][0]
+    seen = db.last_seen(account).get(kind)
+
+    def stamp(day: str, fetched: datetime) -> str:
+        ts = fetched.isoformat()
+        if seen and seen["first_date"] <= day <= seen["last_date"]:
+            return max(ts, seen["seen_at"])
+        return ts
+
+    if kind == "hourly":
+        return {(r.date_str, r.hour): stamp(r.date_str, r.timestamp)
+                for r in db.iter_hourly(start, end, account=account)}
+    return {r.date.isoformat(): stamp(r.date.isoformat(), r.timestamp)
+            for r in db.iter_daily(start, end, account=account)}
+
+def _as_records(kind: str, rows: List[Tuple]) -> Iterable[Dict[str, Any]]:
+    if kind == "hourly":
+        return ({"date": d, "hour": h, "usage_kwh": u, "timestamp": ts} for d, h, u, ts in rows)
+    return ({"date": d, "usage_kwh": u, "timestamp": ts} for d, u, ts in rows)
+
+def import_exports(db: KyudenSQLite, paths: List[Path], workers: Optional[int] = None,
+                   batch_rows: int = 50_000, account: int = DEFAULT_ACCOUNT_ID, progress=None) -> Dict[str, Any]:
+    """
+    解析 paths 中的导出文件并写入 db，返回吞吐报告
+    workers 为解析进程数（默认 CPU 数，<= 1 时在当前进程中解析）；batch_rows 为每个写事务的行数
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    report: Dict[str, Any] = {"files": 0, "bytes": 0, "workers": workers, "errors": []}
+    merger = SnapshotMerger()
+    t0 = time.perf_counter()
+    _parse_all(paths, workers, merger, report, progress)
+    report["parse_sec"] = round(time.perf_counter() - t0, 3)
+
+    t1 = time.perf_counter()
+    for kind in ("daily", "hourly"):
+        stats = {"rows_read": merger.rows_read[kind], "unique": len(merger.latest[kind]),
+                 "inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "kept_newer": 0,
+                 "transactions": 0}
+        for batch in merger.batches(kind, batch_rows):
+            existing = _existing_stamps(db, kind, batch, account)
+            key = (lambda t: (t[0], t[1])) if kind == "hourly" else (lambda t: t[0])
+            # 库中的值比快照更新时保留库中的值
+            rows = [t for t in batch if existing.get(key(t), "") <= t[-1]]
+            stats["kept_newer"] += len(batch) - len(rows)
+            if rows:
+                upsert = db.upsert_hourly if kind == "hourly" else db.upsert_daily
+                result = upsert(_as_records(kind, rows), account=account, record_seen=False)
+                for k, v in result.as_dict().items():
+                    stats[k] += v
+                stats["transactions"] += 1
+        report[kind] = stats
+        merger.latest[kind].clear()
+    report["write_sec"] = round(time.perf_counter() - t1, 3)
+    report["duration_sec"] = round(time.perf_counter() - t0, 3)
+    rows = sum(report[k]["rows_read"] for k in ("daily", "hourly"))
+    report["rows_per_sec"] = round(rows / report["duration_sec"]) if report["duration_sec"] else 0
+    report["mib_per_sec"] = round(report["bytes"] / 1048576 / report["duration_sec"], 2) if report["duration_sec"] else 0
+    return report
+
+def print_import_report(report: Dict[str, Any]):
+    print(f"parsed {report['files']} files ({report['bytes'] / 1048576:.2f} MiB) with {report['workers']} workers "
+          f"in {report['parse_sec']}s, wrote in {report['write_sec']}s")
+    for kind in ("daily", "hourly"):
+        s = report[kind]
+        print(f"  {kind:<7}{s['rows_read']:>10} rows read {s['unique']:>9} unique  "
+              f"inserted {s['inserted']}  updated {s['updated']}  unchanged {s['unchanged']}  "
+              f"skipped {s['skipped']}  kept newer {s['kept_newer']}  ({s['transactions']} transactions)")
+    print(f"throughput: {report['rows_per_sec']} rows/s, {report['mib_per_sec']} MiB/s")
+    for e in report["errors"][:20]:
+        print(f"  error {e['file']}: {e['error']}")
+    if len(report["errors"]) > 20:
+        print(f"  ... {len(report['errors']) - 20} more errors")
@@ -3,25 +3,70 @@ import asyncio
 import json
 import html
 import random
+from array import array
+import time
+from contextlib import contextmanager
 from datetime import datetime, date
 import pandas as pd
 from playwright.async_api import async_playwright
 import logging
 from pathlib import Path
+from urllib.parse import urlparse
 from typing import Optional, Callable, Awaitable, Dict, Any, Union
 
+from pacing import resolve_pacing
+from columnar import UsageColumns, infer_year, parse_daily_columns, parse_hourly_columns
+from records import DailyUsage, HourlyUsage, UsageBatch, as_dicts
+from tracing import get_tracer, traced
+
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Chromium 启动参数（隐藏自动化特征）
+CHROMIUM_ARGS_HEADLESS = [
+    '--disable-blink-features=AutomationControlled',  # 隐藏自动化特征
+    '--no-first-run',
+    '--disable-dev-shm-usage',
+    '--disable-infobars',
+    '--window-size=1920,1080',
+]
+CHROMIUM_ARGS_HEADED = [
+    '--disable-blink-features=AutomationControlled',
+    '--window-size=1920,1080',
+]
+
+# 图表页“上一期 / 前一天”控件（站点改版时可通过构造参数 chart_prev_selector 覆盖）
+# 注意：该选择器是按常见命名推测的，尚未在真实站点的页面上核对过；standin_site.py 的按钮也是照它写的，
+# 替身站点上的端到端测试不能证明它在真实站点可用
+CHART_PREV_SELECTOR = 'button.fs-chart_nav__prev, a.fs-chart_nav__prev, input[type="submit"][name$="BtnPrev"]'
+
+async def launch_chromium(playwright, headless: bool = True):
+    """用统一的参数启动 Chromium；常驻进程可借此自行持有 Browser 并传给多个 KyudenScraper"""
+    return await playwright.chromium.launch(
+        headless=headless,
+        args=CHROMIUM_ARGS_HEADLESS if headless else CHROMIUM_ARGS_HEADED,
+    )
+
 class KyudenScraper:
     def __init__(
         self,
         storage_state_path: Optional[Union[str, Path]] = None,
         alert_handler: Optional[Callable[[str, Dict[str, Any]], Union[None, Awaitable[None]]]] = None,
         max_login_retries: int = 2,
+        browser=None,
+        network_policy=None,
+        session_probe: bool = True,
+        session_trust_sec: float = 600.0,
+        parallel_tabs: bool = True,
+        pacing=None,
+        sleep_budget_sec: Optional[float] = None,
+        chart_prev_selector: str = CHART_PREV_SELECTOR,
+        base_url: Optional[str] = None,
+        payload_archive=None,
     ):
-        self.base_url = "https://my.kyuden.co.jp"
+        # base_url 可覆盖，例如指向 standin_site.py 启动的本地替身站点
+        self.base_url = (base_url or "https://my.kyuden.co.jp").rstrip('/')
         self.login_url = f"{self.base_url}/member"  # 登录页面更精确
         self.chart_url = f"{self.base_url}/member/chart_days_current"
         self.browser = None
@@ -34,11 +79,78 @@ class KyudenScraper:
         self.storage_state_path = Path(storage_state_path) if storage_state_path else None
         self.alert_handler = alert_handler
         self.max_login_retries = max(1, max_login_retries)
+
+        # 共享的 Browser（由调用方持有生命周期，close() 只关闭本实例的 context）
+        self._shared_browser = browser
+
+        # 点击详情按钮后实际到达的图表 URL（供无浏览器快速通道使用），持久化在 storage state 旁的 meta 文件中
+        self.chart_urls: Dict[str, str] = {'daily': self.chart_url}
+        self.last_backend: Optional[str] = None
+
+        # 可选的请求路由策略（netpolicy.NetworkPolicy），以及每次 scrape 的运行信息
+        self.network_policy = network_policy
+        self.run_info: Dict[str, Any] = {}
+
+        # 登录态廉价校验（session.SessionValidator）参数
+        self.session_probe = session_probe
+        self.session_trust_sec = session_trust_sec
+        # 廉价校验判定“已登录”后若图表导航失败，用保存的凭据做一次 DOM 检查 / 重登并重试
+        self._credentials: Optional[tuple] = None
+        self._cheap_session = False
+
+        # mode='both' 时账户页只加载一次，两个图表在两个标签页并行获取
+        self.parallel_tabs = parallel_tabs
+
+        # 拟人化等待的节奏策略：档位名（cautious / normal / minimal）或 PacingPolicy 实例
+        self.pacing = resolve_pacing(pacing, budget_sec=sleep_budget_sec)
+        self.chart_prev_selector = chart_prev_selector
+        # 原始 payload 存档（如 db.PayloadArchive）：内容与上次入库相同时跳过解析，
+        # run_info['unchanged'] 记录被跳过的 kind，run_info['payload_hashes'] 记录本次解析出数据的 (哈希, 日期归属)
+        self.payload_archive = payload_archive
+
+    @property
+    def meta_path(self) -> Optional[Path]:
+        """storage state 旁的元数据文件，例如 storage_state.json -> storage_state.meta.json"""
+        if not self.storage_state_path:
+            return None
+        return self.storage_state_path.with_name(self.storage_state_path.stem + '.meta.json')
+
+    def _load_meta(self) -> Dict[str, Any]:
+        path = self.meta_path
+        if not path or not path.exists():
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"读取元数据失败: {e}")
+            return {}
+
+    def _save_meta(self, **updates):
+        path = self.meta_path
+        if not path:
+            return
+        meta = self._load_meta()
+        meta.update(updates)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.warning(f"写入元数据失败: {e}")
+
+    def _remember_chart_url(self, kind: str):
+        """记录点击详情按钮后到达的图表页 URL"""
+        url = self.page.url if self.page else None
+        if not url or url.rstrip('/').endswith('/member/account'):
+            return
+        if self.chart_urls.get(kind) != url:
+            self.chart_urls[kind] = url
+            self._save_meta(chart_urls=self.chart_urls)
         
     async def _random_delay(self, min_sec: float = 1.0, max_sec: float = 3.0):
-        """随机延迟，模拟真实用户操作节奏"""
-        delay = random.uniform(min_sec, max_sec)
-        await asyncio.sleep(delay)
+        """随机延迟，模拟真实用户操作节奏（按节奏档位缩放，受每次运行的睡眠预算约束）"""
+        await self.pacing.sleep(min_sec, max_sec)
         
     async def _simulate_human_typing(self, element, text: str):
         """模拟人类输入：先清空输入框，再逐字输入+随机延迟"""
@@ -53,11 +165,13 @@ class KyudenScraper:
         
         # 逐字输入
         for char in text:
-            await element.type(char, delay=random.uniform(50, 150))
+            await element.type(char, delay=self.pacing.typing_delay())
         await self._random_delay(0.3, 0.8)
         
     async def _simulate_mouse_movement(self):
         """模拟鼠标随机移动"""
+        if not self.pacing.mouse_movement:
+            return
         try:
             viewport_size = self.page.viewport_size
             if viewport_size:
@@ -69,23 +183,17 @@ class KyudenScraper:
             logger.debug(f"鼠标移动模拟失败: {e}")
         
     async def init_browser(self, headless=True, use_storage_state: bool = True):
-        """初始化浏览器（可加载 storage state 以复用登录态）"""
-        self._playwright = await async_playwright().start()
-        
-        # 使用更真实的浏览器配置
-        self.browser = await self._playwright.chromium.launch(
-            headless=headless,
-            args=[
-                '--disable-blink-features=AutomationControlled',  # 隐藏自动化特征
-                '--no-first-run',
-                '--disable-dev-shm-usage',
-                '--disable-infobars',
-                '--window-size=1920,1080',
-            ] if headless else [
-                '--disable-blink-features=AutomationControlled',
-                '--window-size=1920,1080',
-            ]
-        )
+        """初始化浏览器（可加载 storage state 以复用登录态）
+
+        若构造时传入了共享的 browser，则只新建 context/page，不再启动 Playwright。
+        """
+        if self._shared_browser is not None:
+            self.browser = self._shared_browser
+        else:
+            self._playwright = await async_playwright().start()
+            launch_started = time.perf_counter()
+            self.browser = await launch_chromium(self._playwright, headless=headless)
+            self.run_info['browser_launch_sec'] = round(time.perf_counter() - launch_started, 3)
         self._headless = headless
         
         storage_state = None
@@ -119,6 +227,9 @@ class KyudenScraper:
                 get: () => ['ja-JP', 'ja', 'en-US', 'en']
             });
         """)
+
+        if self.network_policy is not None:
+            await self.network_policy.install(self.context)
         
         self.page = await self.context.new_page()
         logger.info(f"浏览器初始化完成 (headless={headless}, use_storage_state={bool(storage_state)})")
@@ -208,7 +319,7 @@ class KyudenScraper:
                 await self.page.wait_for_url('**/member/**', timeout=15000)
             except Exception:
                 # 有时不会稳定跳转，尽量容错
-                await asyncio.sleep(1)
+                await self.pacing.pause(1)
 
             # 登录后等待，模拟用户查看页面
             await self._random_delay(2, 4)
@@ -231,17 +342,54 @@ class KyudenScraper:
             await self.page.screenshot(path='login_exception.png')
             return False
 
-    async def ensure_logged_in(self, username: str, password: str) -> bool:
-        """先尝试复用 storage state；失败则退回重登，支持最大重试次数"""
-        # 1) 尝试复用状态
-        if await self.is_logged_in():
+    def _check_session(self):
+        """廉价的登录态校验（cookie 过期 / 最近成功 / HEAD 探测），结论不明确时返回 valid=None"""
+        from session import SessionValidator
+        host = urlparse(self.base_url).hostname or ''
+        validator = SessionValidator(
+            self.storage_state_path,
+            meta=self._load_meta(),
+            base_url=self.base_url,
+            cookie_domain='kyuden.co.jp' if host.endswith('kyuden.co.jp') else host,
+            trust_window_sec=self.session_trust_sec,
+            probe=self.session_probe,
+        )
+        return validator.validate()
+
+    async def ensure_logged_in(self, username: str, password: str, cheap: bool = True) -> bool:
+        """
+        先尝试复用 storage state；失败则退回重登，支持最大重试次数
+        cheap=False 时跳过廉价信号，直接做 DOM 检查（廉价信号被证明是误判后使用）
+        """
+        self._credentials = (username, password)
+        self._cheap_session = False
+        self.run_info['login_attempts'] = 0
+        # 1) 廉价信号校验，必要时再做完整的 DOM 检查
+        if cheap:
+            check = await asyncio.to_thread(self._check_session)
+            self.run_info['validation_path'] = check.path
+            logger.info(f"登录态校验: {check.path} {check.detail}".rstrip())
+        else:
+            from session import SessionCheck
+            check = SessionCheck(None, "dom", "廉价信号已作废")
+        if check.valid is True:
+            logger.info("检测到已登录（复用状态，跳过页面检查）")
+            self.run_info['session'] = 'reused'
+            self._cheap_session = True
+            return True
+        if check.valid is None and await self.is_logged_in():
             logger.info("检测到已登录（复用状态）")
+            self.run_info['session'] = 'reused'
             return True
 
         # 2) 回退显式登录 + 重试
         for attempt in range(1, self.max_login_retries + 1):
             logger.info(f"尝试显式登录（第 {attempt}/{self.max_login_retries} 次）")
-            if await self.login(username, password):
+            self.run_info['login_attempts'] = attempt
+            with self._phase('login'):
+                ok = await self.login(username, password)
+            if ok:
+                self.run_info['session'] = 'fresh-login'
                 return True
 
             if attempt == 1 and self.storage_state_path:
@@ -256,30 +404,125 @@ class KyudenScraper:
                 await self.init_browser(headless=self._headless, use_storage_state=False)
 
             # 增加重试间隔，避免频繁请求
-            await asyncio.sleep(min(5 * attempt, 15))
+            await self.pacing.pause(min(5 * attempt, 15))
 
         await self._notify_alert("登录失败，达到最大重试次数", {"stage": "login"})
         return False
             
+    async def _recover_session(self, error: Exception) -> bool:
+        """
+        图表导航失败时调用：只有本次登录态来自廉价信号时才处理（每次运行最多一次）——
+        作废缓存的成功时间，做完整的 DOM 检查，必要时重新登录；返回 True 表示可以重试导航
+        """
+        if not self._cheap_session or not self._credentials:
+            return False
+        self._cheap_session = False
+        logger.warning(f"廉价校验判定已登录，但图表导航失败（{error}），改做页面检查 / 重新登录")
+        self.run_info['validation_path'] = f"{self.run_info.get('validation_path')}+dom-recheck"
+        self._save_meta(last_success_at=None)
+        with self._phase('session_recheck'):
+            return await self.ensure_logged_in(*self._credentials, cheap=False)
+
+    async def _navigate_chart(self, kind: str):
+        """打开账户页并进入 -daily / -hourly 图表；廉价校验误判时恢复登录态后重试一次"""
+        try:
+            await self._goto_account()
+            await self._open_chart(self.page, kind)
+        except Exception as e:
+            if not await self._recover_session(e):
+                raise
+            await self._goto_account(reuse=False)
+            await self._open_chart(self.page, kind)
+
+    async def _verify_account_page(self):
+        """打开账户页；登录态来自廉价校验时确认详情按钮存在，不存在则恢复登录态后重新打开"""
+        await self._goto_account()
+        if not self._cheap_session:
+            return
+        try:
+            await self.page.wait_for_selector(
+                'button.fs-top_card__detail_button.-hourly, button.fs-top_card__detail_button.-daily', timeout=2000)
+        except Exception as e:
+            if not await self._recover_session(e):
+                raise
+            await self._goto_account(reuse=False)
+
+    @property
+    def account_url(self) -> str:
+        return self.base_url + "/member/account"
+
+    async def _goto_account(self, page=None, reuse: bool = True):
+        """打开账户页；若页面已停留在账户页（例如 is_logged_in 刚访问过）则不再重复加载"""
+        page = page or self.page
+        if reuse and page.url.rstrip('/') == self.account_url:
+            logger.debug("已在账户页，跳过重复导航")
+            return
+        await page.goto(self.account_url, timeout=10000)
+        await self._random_delay(1, 2)  # 模拟用户查看页面
+
+    async def _open_chart(self, page, kind: str):
+        """在账户页点击 -daily / -hourly 详情按钮进入图表页"""
+        await page.click(f'button.fs-top_card__detail_button.-{kind}')
+        await page.wait_for_load_state('domcontentloaded')
+        await self._random_delay(1, 3)  # 等待数据加载
+        if page is self.page:
+            self._remember_chart_url(kind)
+
+    async def _read_chart_payload(self, page) -> Dict[str, Any]:
+        """读取图表页隐藏字段 body_0$Data 并解码为 JSON"""
+        data_element = await page.query_selector('input[name="body_0$Data"]')
+        if not data_element:
+            raise Exception("未找到数据元素")
+        data_value = await data_element.get_attribute('value')
+        if not data_value:
+            raise Exception("数据为空")
+        return json.loads(html.unescape(data_value))
+
+    async def open_chart_payload(self, kind: str) -> Dict[str, Any]:
+        """进入 -daily / -hourly 图表页并返回当前显示周期的原始 JSON（供回填 / 历史爬取逐页后退）"""
+        await self._navigate_chart(kind)
+        return await self._read_chart_payload(self.page)
+
+    async def previous_chart_payload(self) -> Dict[str, Any]:
+        """点击图表页的“上一期 / 前一天”控件，返回新显示周期的原始 JSON"""
+        await self.page.click(self.chart_prev_selector)
+        await self.page.wait_for_load_state('domcontentloaded')
+        await self._random_delay(0.5, 1.5)
+        return await self._read_chart_payload(self.page)
+
+    def _parse_payload(self, kind: str, payload: Dict[str, Any], target_date: Optional[date] = None):
+        """解析图表 payload；配置了 payload_archive 时先存档，内容与上次入库的相同则直接返回空批次"""
+        if kind == 'hourly':
+            target_date = target_date or date.today()
+        digest = None
+        if self.payload_archive is not None:
+            try:
+                digest, unchanged = self.payload_archive.observe(kind, payload, target_date)
+                if unchanged:
+                    logger.info(f"{kind} payload 与上次入库的内容相同（{digest[:12]}），跳过解析")
+                    self.run_info.setdefault('unchanged', []).append(kind)
+                    return UsageBatch(kind)
+            except Exception as e:
+                logger.warning(f"payload 存档失败，照常解析: {e}")
+        if kind == 'daily':
+            rows = self.parse_usage_data(payload)
+        else:
+            rows = self.parse_hourly_usage_data(payload, target_date=target_date)
+        if digest and rows:
+            # 只有解析出数据的 payload 才交给调用方标记入库：解析失败（返回空）的下次仍会重新解析，
+            # 部署修好的解析器后不会被当作“未变化”跳过。(hash, 日期归属)：同样的内容可能属于不同日期
+            self.run_info.setdefault('payload_hashes', {})[kind] = (digest, target_date)
+        return rows
+
     async def get_daily_usage_data(self):
         """获取每日用电量数据"""
         await self._random_delay(1, 2)  # 随机等待
-        await self.page.goto(self.base_url+"/member/account", timeout=10000)
-        await self._random_delay(1, 2)  # 模拟用户查看页面
-        await self.page.click('button.fs-top_card__detail_button.-daily')
-        await self.page.wait_for_load_state('domcontentloaded')
-        await self._random_delay(1, 3)  # 等待数据加载
-        logger.info("导航到每日图表页面完成")
         try:
-            data_element = await self.page.query_selector('input[name="body_0$Data"]')
-            if not data_element:
-                raise Exception("未找到数据元素")
-            data_value = await data_element.get_attribute('value')
-            if not data_value:
-                raise Exception("数据为空")
-            usage_data = json.loads(html.unescape(data_value))
+            await self._navigate_chart('daily')
+            logger.info("导航到每日图表页面完成")
+            usage_data = await self._read_chart_payload(self.page)
             logger.info("成功获取每日数据")
-            return self.parse_usage_data(usage_data)
+            return self._parse_payload('daily', usage_data)
         except Exception as e:
             logger.error(f"获取每日数据失败: {e}")
             return []
@@ -288,85 +531,169 @@ class KyudenScraper:
         """获取每小时用电量数据（允许传入目标日期归属）"""
         await self.page.wait_for_load_state('networkidle')
         await self._random_delay(1, 2)  # 随机等待
-        await self.page.goto(self.base_url+"/member/account", timeout=10000)
-        await self._random_delay(1, 2)  # 模拟用户查看页面
-        await self.page.click('button.fs-top_card__detail_button.-hourly')
-        await self.page.wait_for_load_state('domcontentloaded')
-        await self._random_delay(1, 3)  # 等待数据加载
-        logger.info("导航到每小时图表页面完成")
         try:
-            data_element = await self.page.query_selector('input[name="body_0$Data"]')
-            if not data_element:
-                raise Exception("未找到数据元素")
-            data_value = await data_element.get_attribute('value')
-            if not data_value:
-                raise Exception("数据为空")
-            usage_data = json.loads(html.unescape(data_value))
+            await self._navigate_chart('hourly')
+            logger.info("导航到每小时图表页面完成")
+            usage_data = await self._read_chart_payload(self.page)
             logger.info("成功获取每小时原始数据")
-            return self.parse_hourly_usage_data(usage_data, target_date=target_date)
+            return self._parse_payload('hourly', usage_data, target_date)
         except Exception as e:
             logger.error(f"获取每小时用电量数据失败: {e}")
             return []
 
-    def parse_usage_data(self, data):
-        """解析每日用电量数据"""
+    async def get_both_usage_data(self, target_date: Optional[date] = None):
+        """
+        mode='both' 的单次导航方案：账户页只加载一次，
+        每日图表在当前标签页打开，每小时图表在同一 context 的第二个标签页并行打开。
+        若已记录过每小时图表 URL，第二个标签页直接访问该 URL，不再经过账户页。
+        返回 (daily, hourly)，并在 run_info['nav_plan'] 中记录相对顺序执行节省的时间。
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await self._verify_account_page()
+        hourly_url = self.chart_urls.get('hourly') or (self._load_meta().get('chart_urls') or {}).get('hourly')
+
+        async def daily_tab():
+            t0 = loop.time()
+            try:
+                await self._open_chart(self.page, 'daily')
+                return self._parse_payload('daily', await self._read_chart_payload(self.page)), loop.time() - t0
+            except Exception as e:
+                logger.error(f"获取每日数据失败: {e}")
+                return [], loop.time() - t0
+
+        async def hourly_tab():
+            t0 = loop.time()
+            page = await self.context.new_page()
+            try:
+                if hourly_url:
+                    await page.goto(hourly_url, timeout=10000)
+                    await page.wait_for_load_state('domcontentloaded')
+                else:
+                    await page.goto(self.account_url, timeout=10000)
+                    await self._open_chart(page, 'hourly')
+                    self.chart_urls['hourly'] = page.url
+                    if not page.url.rstrip('/').endswith('/member/account'):
+                        self._save_meta(chart_urls=self.chart_urls)
+                payload = await self._read_chart_payload(page)
+                return self._parse_payload('hourly', payload, target_date), loop.time() - t0
+            except Exception as e:
+                logger.error(f"获取每小时用电量数据失败: {e}")
+                return [], loop.time() - t0
+            finally:
+                await page.close()
+
+        (daily, t_daily), (hourly, t_hourly) = await asyncio.gather(daily_tab(), hourly_tab())
+        # 顺序路径下每个图表还要各自再加载一次账户页，这里只按两个标签页各自耗时之和做保守估计
+        wall = loop.time() - started
+        sequential = (wall - max(t_daily, t_hourly)) + t_daily + t_hourly
+        self.run_info['nav_plan'] = {
+            'plan': 'parallel-tabs',
+            'hourly_direct_url': bool(hourly_url),
+            'daily_sec': round(t_daily, 3),
+            'hourly_sec': round(t_hourly, 3),
+            'wall_sec': round(wall, 3),
+            'sequential_estimate_sec': round(sequential, 3),
+            'saved_sec': round(sequential - wall, 3),
+        }
+        logger.info(
+            f"并行图表导航完成: 用时 {wall:.1f}s，顺序执行估计 {sequential:.1f}s，节省 {sequential - wall:.1f}s"
+        )
+        return daily, hourly
+
+    async def fetch_via_http(self, mode: str, target_date: Optional[date] = None) -> Optional[Dict[str, Any]]:
+        """无浏览器快速通道：用 storage state 的 cookie 直接请求图表页。
+
+        返回与 scrape() 相同结构的结果；登录态失效、图表 URL 未知或页面结构不符时返回 None。
+        """
+        if not self.storage_state_path or not self.storage_state_path.exists():
+            return None
+        from http_fetch import KyudenHttpFetcher, FastPathUnavailable
+
+        urls = dict(self.chart_urls)
+        urls.update(self._load_meta().get('chart_urls') or {})
+        kinds = [k for k in ('daily', 'hourly') if mode in (k, 'both')]
+        if any(not urls.get(k) for k in kinds):
+            logger.info("快速通道: 尚未记录图表 URL，使用浏览器")
+            return None
+
+        fetcher = KyudenHttpFetcher(self.storage_state_path, base_url=self.base_url)
         try:
+            fetcher.load_cookies()
+            payloads = await asyncio.gather(*(fetcher.fetch_payload(urls[k]) for k in kinds))
+            fetcher.save_cookies()
+        except FastPathUnavailable as e:
+            logger.info(f"快速通道不可用，回退到浏览器: {e}")
+            return None
+        finally:
+            fetcher.close()
+
+        result = {}
+        for kind, payload in zip(kinds, payloads):
+            result[kind] = self._parse_payload(kind, payload, target_date)
+        logger.info("快速通道获取数据成功（未启动浏览器）")
+        return result
+
+    @traced('parse_daily', count_result_as='rows_parsed_daily')
+    def parse_usage_data(self, data, reference_date: Optional[date] = None, columnar: bool = False):
+        """解析每日用电量数据
+
+        reference_date: 该周期最后一天不会晚于此日期（用于翻到过去的账单周期时推断年份）；
+        不传时沿用按当前月份推断年份的规则
+        columnar: 为 True 时返回 UsageColumns（类型数组，不构造逐行 dict），可直接交给 KyudenSQLite
+        """
+        try:
+            if columnar:
+                parsed = parse_daily_columns(data, reference_date=reference_date)
+                logger.info(f"每日数据解析完成，共{len(parsed)}条")
+                return parsed
             dates = data['shiyoKikan'][1:]  # 跳过第一个'x'
             usage_values = data['columns'][0][1:]  # 跳过标题
-            parsed_data = []
-            current_date = datetime.now()
-            current_year = current_date.year
-            current_month = current_date.month
+            fetched_at = datetime.now()  # 整批共用一个抓取时间
+            parsed_data = UsageBatch('daily', fetched_at=fetched_at)
+            today = fetched_at.date()
             for date_str, usage in zip(dates, usage_values):
                 if usage is None:
                     continue
                 if '/' in date_str:
                     month, day = map(int, date_str.split('/'))
-                    year = current_year
-                    if month < current_month:
-                        year = current_year + 1
-                    elif month > current_month:
-                        year = current_year - 1
-                    if current_month == 9 and month == 8:
-                        year = current_year
-                    parsed_data.append({
-                        'date': date(year, month, day),
-                        'date_str': date_str,
-                        'usage_kwh': usage,
-                        'timestamp': datetime.now()
-                    })
+                    parsed_data.append(DailyUsage(
+                        date(infer_year(month, day, reference_date, today), month, day),
+                        date_str, usage, fetched_at,
+                    ))
             logger.info(f"每日数据解析完成，共{len(parsed_data)}条")
             return parsed_data
         except Exception as e:
             logger.error(f"解析每日数据失败: {e}")
-            return []
+            return UsageColumns(array('l'), array('d')) if columnar else []
             
-    def parse_hourly_usage_data(self, data, target_date=None):
-        """解析每小时用电量数据"""
+    @traced('parse_hourly', count_result_as='rows_parsed_hourly')
+    def parse_hourly_usage_data(self, data, target_date=None, columnar: bool = False):
+        """解析每小时用电量数据（columnar=True 时返回 UsageColumns）"""
         try:
             if target_date is None:
                 target_date = date.today()
             columns = data.get('columns', [])
             if not columns or not columns[0]:
                 logger.warning("列数据为空")
-                return []
+                return UsageColumns(array('l'), array('d'), hours=array('b')) if columnar else []
+            if columnar:
+                parsed = parse_hourly_columns(data, target_date=target_date)
+                logger.info(f"每小时数据解析完成，共{len(parsed)}条")
+                return parsed
             raw_values = columns[0][1:]
-            parsed = []
+            fetched_at = datetime.now()
+            parsed = UsageBatch('hourly', fetched_at=fetched_at)
+            date_str = target_date.isoformat()
             for hour, val in enumerate(raw_values):
                 if val is None:
                     continue
-                parsed.append({
-                    'date': target_date,
-                    'date_str': target_date.isoformat(),
-                    'hour': hour,
-                    'usage_kwh': val,
-                    'timestamp': datetime.now()
-                })
+                parsed.append(HourlyUsage(target_date, date_str, hour, val, fetched_at))
             logger.info(f"每小时数据解析完成，共{len(parsed)}条")
             return parsed
         except Exception as e:
             logger.error(f"解析每小时数据失败: {e}")
-            return []
+            return UsageColumns(array('l'), array('d'), hours=array('b')) if columnar else []
             
     def _save_dataset(self, data, prefix, ext):
         if not data:
@@ -375,19 +702,11 @@ class KyudenScraper:
         ts = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{prefix}_{ts}.{ext}"
         if ext == 'csv':
-            df = pd.DataFrame(data)
+            df = pd.DataFrame([dict(item.items()) for item in data])
             df.to_csv(filename, index=False, encoding='utf-8-sig')
         else:
-            json_data = []
-            for item in data:
-                obj = item.copy()
-                if isinstance(obj.get('date'), date):
-                    obj['date'] = obj['date'].isoformat()
-                if isinstance(obj.get('timestamp'), datetime):
-                    obj['timestamp'] = obj['timestamp'].isoformat()
-                json_data.append(obj)
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, ensure_ascii=False, indent=2)
+                json.dump(as_dicts(data), f, ensure_ascii=False, indent=2)
         logger.info(f"保存文件: {filename}")
         return filename
 
@@ -409,8 +728,21 @@ class KyudenScraper:
         return results
             
     async def close(self):
+        if self._shared_browser is not None:
+            # 共享 Browser 只关闭自己的 context，Browser 由持有者负责回收
+            if self.context:
+                try:
+                    await self.context.close()
+                except Exception as e:
+                    logger.debug(f"关闭 context 失败: {e}")
+                logger.info("浏览器 context 已关闭（共享 Browser 保留）")
+            self.context = None
+            self.page = None
+            self.browser = None
+            return
         if self.browser:
             await self.browser.close()
+            self.browser = None
             logger.info("浏览器已关闭")
         if self._playwright:
             await self._playwright.stop()
@@ -428,13 +760,20 @@ class KyudenScraper:
         storage_state_path: Optional[Union[str, Path]] = None,
         max_login_retries: Optional[int] = None,
         alert_handler: Optional[Callable[[str, Dict[str, Any]], Union[None, Awaitable[None]]]] = None,
+        backend: str = 'browser',
     ):
         """
         完整爬取流程
         mode: 'daily' | 'hourly' | 'both'
         hourly_target_date: 可传入 date 或 'YYYY-MM-DD' 字符串，控制小时数据的日期归属
+        backend: 'browser' 只用 Playwright；'http' / 'auto' 先尝试无浏览器快速通道，失败再回退 Playwright
         """
         assert mode in ('daily','hourly','both')
+        assert backend in ('browser','http','auto')
+        self.run_info = {'mode': mode}
+        self.pacing.reset()
+        if self.network_policy is not None:
+            self.network_policy.stats.reset()
         # 允许在 scrape 级别覆盖构造参数
         if storage_state_path is not None:
             self.storage_state_path = Path(storage_state_path)
@@ -454,32 +793,82 @@ class KyudenScraper:
             target_date_obj = hourly_target_date
 
         try:
-            await self.init_browser(headless=headless, use_storage_state=True)
-            if not await self.ensure_logged_in(username, password):
+            with get_tracer().span('scrape', mode=mode, backend=backend) as sp:
+                result = await self._scrape_phases(
+                    username, password, mode, save_format, headless, target_date_obj, backend,
+                )
+                sp.set(backend_used=self.last_backend, validation_path=self.run_info.get('validation_path'))
+                return result
+        finally:
+            self.pacing.log_summary()
+            self.run_info['pacing'] = self.pacing.summary()
+            if self.network_policy is not None:
+                self.network_policy.log_summary()
+                self.run_info['network'] = self.network_policy.stats.as_dict()
+
+    @contextmanager
+    def _phase(self, name: str):
+        """一个抓取阶段：同时计入节奏统计（睡眠 / 工作时间）和追踪 span"""
+        with self.pacing.phase(name), get_tracer().span(name):
+            yield
+
+    async def _scrape_phases(self, username, password, mode, save_format, headless, target_date_obj, backend):
+        """scrape() 的主体，按阶段记录耗时与睡眠"""
+        phase = self._phase
+        if backend in ('http','auto'):
+            with phase('http_fetch'):
+                fast = await self.fetch_via_http(mode, target_date=target_date_obj)
+            unchanged = self.run_info.get('unchanged') or []
+            if fast and all(fast.get(k) or k in unchanged for k in fast):
+                self.last_backend = 'http'
+                self.run_info['validation_path'] = 'http-fetch'
+                self.run_info['session'] = 'reused'
+                self._save_meta(last_success_at=datetime.now().isoformat())
+                with phase('save'):
+                    self.save(daily=fast.get('daily'), hourly=fast.get('hourly'), save_format=save_format)
+                return fast
+
+        self.last_backend = 'browser'
+        try:
+            with phase('init_browser'):
+                await self.init_browser(headless=headless, use_storage_state=True)
+            with phase('session'):
+                logged_in = await self.ensure_logged_in(username, password)
+            if not logged_in:
                 logger.error("登录失败，终止")
                 return {}
 
             daily_data = hourly_data = None
-            if mode in ('daily','both'):
-                daily_data = await self.get_daily_usage_data()
-            if mode in ('hourly','both'):
-                hourly_data = await self.get_hourly_usage_data(target_date=target_date_obj)
-
-            self.save(
-                daily=daily_data if mode!='hourly' else None,
-                hourly=hourly_data if mode!='daily' else None,
-                save_format=save_format
-            )
+            if mode == 'both' and self.parallel_tabs:
+                with phase('charts'):
+                    daily_data, hourly_data = await self.get_both_usage_data(target_date=target_date_obj)
+            else:
+                if mode in ('daily','both'):
+                    with phase('daily'):
+                        daily_data = await self.get_daily_usage_data()
+                if mode in ('hourly','both'):
+                    with phase('hourly'):
+                        hourly_data = await self.get_hourly_usage_data(target_date=target_date_obj)
+
+            with phase('save'):
+                self.save(
+                    daily=daily_data if mode!='hourly' else None,
+                    hourly=hourly_data if mode!='daily' else None,
+                    save_format=save_format
+                )
             result = {}
             if daily_data is not None: result['daily'] = daily_data
             if hourly_data is not None: result['hourly'] = hourly_data
+            if any(result.values()) or self.run_info.get('unchanged'):
+                self._save_meta(last_success_at=datetime.now().isoformat())
             return result
         except Exception as e:
             await self._notify_alert("爬取过程中发生未捕获错误", {"exception": str(e)})
             logger.error(f"爬取过程中发生错误: {e}")
             return {}
         finally:
-            await self.close()
+            with phase('close'):
+                await self.close()
 
 async def main():
     import argparse, os
@@ -494,6 +883,16 @@ async def main():
     parser.add_argument('--max-login-retries', type=int, default=int(os.getenv('KYUDEN_MAX_LOGIN_RETRIES','2')))
     parser.add_argument('--headless', action='store_true', help='Run browser headless (default true)')
     parser.add_argument('--no-headless', action='store_true', help='Force headed mode')
+    parser.add_argument('--net-policy', default=os.getenv('KYUDEN_NET_POLICY'),
+                        help='请求路由策略：预置名（diet / first-party）或 JSON 规则文件路径')
+    parser.add_argument('--pacing', choices=['cautious','normal','minimal'], default=os.getenv('KYUDEN_PACING','normal'),
+                        help='拟人化等待的节奏档位')
+    parser.add_argument('--sleep-budget', type=float, default=None,
+                        help='每次运行拟人化等待的总预算（秒），用完后不再等待')
+    parser.add_argument('--base-url', default=os.getenv('KYUDEN_BASE_URL'),
+                        help='站点根地址（默认 https://my.kyuden.co.jp，可指向本地替身站点）')
+    parser.add_argument('--backend', choices=['browser','http','auto'], default=os.getenv('KYUDEN_BACKEND','browser'),
+                        help='auto/http: 先用 storage state 的 cookie 直接请求图表页，失败再启动浏览器')
     args = parser.parse_args()
 
     USERNAME = args.username
@@ -506,9 +905,18 @@ async def main():
         logger.warning('请提供正确的用户名和密码 (--username / --password 或环境变量 KYUDEN_USER / KYUDEN_PASS)')
         return
 
+    network_policy = None
+    if args.net_policy:
+        from netpolicy import NetworkPolicy
+        network_policy = NetworkPolicy.load(args.net_policy)
+
     scraper = KyudenScraper(
         storage_state_path=args.storage_state,
         max_login_retries=args.max_login_retries,
+        network_policy=network_policy,
+        pacing=args.pacing,
+        sleep_budget_sec=args.sleep_budget,
+        base_url=args.base_url,
     )
     data = await scraper.scrape(
         USERNAME, PASSWORD,
@@ -516,6 +924,7 @@ async def main():
         save_format=SAVE_FORMAT,
         headless=HEADLESS,
         hourly_target_date=args.hourly_date,
+        backend=args.backend,
     )
     for k, v in data.items():
         print(f"{k} 数据条数: {len(v)}")
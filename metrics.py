@@ -0,0 +1,316 @@
+"""
+Prometheus 指标导出：每次采集后写 node_exporter textfile，或在常驻模式下提供 /metrics
+
+指标大多从 SQLite 派生（collection_runs 与数据表），因此一次性运行（systemd timer）和常驻进程
+得到的计数器 / 直方图是一致且单调的，进程重启也不会清零:
+
+- kyuden_runs_total{mode,outcome}                  运行次数
+- kyuden_run_duration_seconds{mode}                整次运行耗时直方图
+- kyuden_phase_duration_seconds{mode,phase}        各阶段墙钟耗时直方图（含 browser_launch / ingest）
+- kyuden_login_attempts_total / kyuden_login_failures_total
+- kyuden_rows_upserted_total{table}
+- kyuden_last_run_timestamp_seconds / kyuden_last_success_timestamp_seconds
+- kyuden_latest_data_timestamp_seconds{account,table}  库中最新数据所属的时间（数据新鲜度）
+- kyuden_last_fetch_timestamp_seconds{account,table}   最近一次 upsert 批次的抓取时间（usage_last_seen）
+- kyuden_last_payload_timestamp_seconds{kind}      最近一次抓到图表 payload 的时间（内容未变、跳过入库时也会更新）
+- kyuden_sqlite_size_bytes{file}                   数据库文件与 WAL 的大小
+- kyuden_browser_launch_seconds                    本进程最近一次启动 Chromium 的耗时
+- kyuden_alerts_total{stage}                       本进程内 _notify_alert 触发次数
+
+启用方式：KYUDEN_METRICS_DIR=<textfile 目录>（写入 kyuden.prom），常驻模式另可用 --metrics-port
+"""
+
+import os
+import asyncio
+import threading
+import logging
+from datetime import datetime, date
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, Union
+
+from db import KyudenSQLite, USAGE_TABLES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+TEXTFILE_NAME = "kyuden.prom"
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        for i, b in enumerate(self.buckets):
+            if v <= b:
+                self.counts[i] += 1
+        self.sum += v
+        self.count += 1
+
+    def merge(self, counts: Tuple[int, ...], total: float, n: int):
+        """并入 SQL 聚合出的累计桶计数（与 buckets 一一对应）"""
+        for i, c in enumerate(counts):
+            self.counts[i] += c or 0
+        self.sum += total or 0.0
+        self.count += n
+
+class MetricsText:
+    """按 Prometheus text exposition format 0.0.4 拼装输出"""
+
+    def __init__(self):
+        self._lines: List[str] = []
+
+    def header(self, name: str, kind: str, help_text: str):
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, **labels):
+        self._lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+
+    def histogram(self, name: str, hist: _Histogram, **labels):
+        for b, c in zip(hist.buckets, hist.counts):
+            self.sample(f"{name}_bucket", c, **labels, le=_fmt(float(b)))
+        self.sample(f"{name}_bucket", hist.count, **labels, le="+Inf")
+        self.sample(f"{name}_sum", round(hist.sum, 6), **labels)
+        self.sample(f"{name}_count", hist.count, **labels)
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+def _epoch(v: Optional[str]) -> Optional[float]:
+    if not v:
+        return None
+    try:
+        return datetime.fromisoformat(v).timestamp()
+    except ValueError:
+        return None
+
+def _bucket_sums(expr: str, buckets: Tuple[float, ...]) -> str:
+    """SQL 聚合列：每个桶的累计计数、总和与个数"""
+    return ", ".join([f"SUM({expr} <= {float(b)!r})" for b in buckets] + [f"SUM({expr})", "COUNT(*)"])
+
+class CollectorMetrics:
+    """
+    本进程的指标状态（浏览器启动耗时、报警计数）+ 从 SQLite 派生的指标
+    库以只读方式打开（不建表、不拿写锁，路径错误时也不会新建空库）；缺少的表对应的指标不输出。
+    collection_runs 的计数器与直方图在 SQL 里聚合，并按 id 增量累加：常驻进程每次 /metrics
+    只扫描上次之后新增的运行记录，一次性运行也只做一次聚合扫描，不在 Python 里逐行解析 phases
+    """
+
+    def __init__(self, db_path: Union[str, Path], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.db_path = Path(db_path)
+        self.buckets = buckets
+        self.browser_launch_sec: Optional[float] = None
+        self.alerts: Dict[str, int] = {}
+        # 已并入的 collection_runs 最大 id 及累计结果
+        self._runs_upto = 0
+        self._runs: Dict[Tuple[str, str], int] = {}
+        self._run_hist: Dict[str, _Histogram] = {}
+        self._phase_hist: Dict[Tuple[str, str], _Histogram] = {}
+        self._login_attempts = 0
+        self._login_failures = 0
+        self._rows = {"daily": 0, "hourly": 0}
+        self._last_run: Optional[str] = None
+        self._last_ok: Optional[str] = None
+        self._lock = threading.Lock()  # /metrics 在线程中渲染，累计结果的更新需要串行
+
+    def observe_browser_launch(self, seconds: float):
+        self.browser_launch_sec = seconds
+
+    def alert_handler(self, message: str, context: Dict[str, Any]):
+        """作为 KyudenScraper 的 alert_handler 使用，按 stage 计数"""
+        stage = (context or {}).get("stage", "unknown")
+        self.alerts[stage] = self.alerts.get(stage, 0) + 1
+
+    def _update_runs(self, conn):
+        """把 id 在 (_runs_upto, 当前最大 id] 内的运行记录聚合后并入累计结果"""
+        hi = conn.execute("SELECT MAX(id) FROM collection_runs;").fetchone()[0] or 0
+        if hi <= self._runs_upto:
+            return
+        rng = (self._runs_upto, hi)
+        for mode, outcome, n, attempts, daily, hourly in conn.execute(
+            "SELECT mode, outcome, COUNT(*), SUM(login_attempts), SUM(rows_daily), SUM(rows_hourly) "
+            "FROM collection_runs WHERE id > ? AND id <= ? GROUP BY mode, outcome;", rng
+        ):
+            self._runs[(mode, outcome)] = self._runs.get((mode, outcome), 0) + n
+            self._login_attempts += attempts or 0
+            self._login_failures += n if outcome == "login-failed" else 0
+            self._rows["daily"] += daily or 0
+            self._rows["hourly"] += hourly or 0
+        k = len(self.buckets)
+        for row in conn.execute(
+            f"SELECT mode, {_bucket_sums('duration_sec', self.buckets)} "
+            "FROM collection_runs WHERE id > ? AND id <= ? GROUP BY mode;", rng
+        ):
+            self._run_hist.setdefault(row[0], _Histogram(self.buckets)).merge(row[1:1 + k], row[1 + k], row[2 + k])
+        for row in conn.execute(
+            f"SELECT r.mode, p.key, {_bucket_sums('p.value', self.buckets)} "
+            "FROM collection_runs r, json_each(r.phases) p "
+            "WHERE r.id > ? AND r.id <= ? AND r.phases IS NOT NULL GROUP BY r.mode, p.key;", rng
+        ):
+            self._phase_hist.setdefault((row[0], row[1]), _Histogram(self.buckets)).merge(
+                row[2:2 + k], row[2 + k], row[3 + k])
+        last_run, last_ok = conn.execute(
+            "SELECT MAX(finished_at), MAX(CASE WHEN outcome IN ('ok', 'unchanged') THEN finished_at END) "
+            "FROM collection_runs WHERE id > ? AND id <= ?;", rng
+        ).fetchone()
+        self._last_run = max(filter(None, (self._last_run, last_run)), default=None)
+        self._last_ok = max(filter(None, (self._last_ok, last_ok)), default=None)
+        self._runs_upto = hi
+
+    def _from_db(self, out: MetricsText) -> bool:
+        """输出从库派生的指标；库文件不存在时什么也不输出并返回 False"""
+        if not self.db_path.exists():
+            logger.debug(f"指标: 数据库不存在 {self.db_path}")
+            return False
+        with KyudenSQLite(self.db_path, read_only=True) as db:
+            conn = db.conn
+            tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view');")}
+            has_runs = "collection_runs" in tables
+            if has_runs:
+                self._update_runs(conn)
+            freshness = []
+            usage = {USAGE_TABLES[db.schema_version][k][0] for k in ("daily", "hourly")}
+            if usage <= tables and "usage_last_seen" in tables:
+                # 每个账号一组新鲜度指标；fetched_at 只在数据变化时写入，“最近抓取”取 upsert 记录的 last seen
+                freshness = [(a["name"], db.latest_usage(a["id"]), db.last_seen(a["id"])) for a in db.accounts()]
+            last_payload: Dict[str, str] = {}
+            if "raw_payloads" in tables:
+                last_payload = dict(conn.execute(
+                    "SELECT kind, MAX(last_fetched_at) FROM raw_payloads GROUP BY kind;").fetchall())
+
+        if has_runs:
+            self._render_runs(out)
+        if freshness:
+            self._render_freshness(out, freshness)
+        if last_payload:
+            out.header("kyuden_last_payload_timestamp_seconds", "gauge",
+                       "Newest chart payload fetch per kind, including unchanged payloads that were not re-upserted")
+            for kind, v in sorted(last_payload.items()):
+                if _epoch(v) is not None:
+                    out.sample("kyuden_last_payload_timestamp_seconds", _epoch(v), kind=kind)
+        return True
+
+    def _render_runs(self, out: MetricsText):
+        out.header("kyuden_runs_total", "counter", "Collector runs by mode and outcome")
+        for (mode, outcome), n in sorted(self._runs.items()):
+            out.sample("kyuden_runs_total", n, mode=mode, outcome=outcome)
+        out.header("kyuden_run_duration_seconds", "histogram", "Wall time of a whole collector run")
+        for mode, h in sorted(self._run_hist.items()):
+            out.histogram("kyuden_run_duration_seconds", h, mode=mode)
+        out.header("kyuden_phase_duration_seconds", "histogram", "Wall time per scrape / ingest phase")
+        for (mode, phase), h in sorted(self._phase_hist.items()):
+            out.histogram("kyuden_phase_duration_seconds", h, mode=mode, phase=phase)
+        out.header("kyuden_login_attempts_total", "counter", "Explicit login attempts (storage state not reusable)")
+        out.sample("kyuden_login_attempts_total", self._login_attempts)
+        out.header("kyuden_login_failures_total", "counter", "Runs that gave up after exhausting login retries")
+        out.sample("kyuden_login_failures_total", self._login_failures)
+        out.header("kyuden_rows_upserted_total", "counter", "Rows upserted by collector runs")
+        for table, n in self._rows.items():
+            out.sample("kyuden_rows_upserted_total", n, table=table)
+
+        out.header("kyuden_last_run_timestamp_seconds", "gauge", "End time of the latest collector run")
+        if _epoch(self._last_run) is not None:
+            out.sample("kyuden_last_run_timestamp_seconds", _epoch(self._last_run))
+        out.header("kyuden_last_success_timestamp_seconds", "gauge", "End time of the latest run with outcome ok or unchanged")
+        if _epoch(self._last_ok) is not None:
+            out.sample("kyuden_last_success_timestamp_seconds", _epoch(self._last_ok))
+
+    @staticmethod
+    def _render_freshness(out: MetricsText, freshness: List[Tuple[str, Any, Dict[str, Any]]]):
+        out.header("kyuden_latest_data_timestamp_seconds", "gauge",
+                   "Start of the newest day (daily) or hour (hourly) stored per account")
+        for account, (latest_daily, latest_hourly), _ in freshness:
+            if latest_daily:
+                out.sample("kyuden_latest_data_timestamp_seconds",
+                           datetime.combine(date.fromisoformat(latest_daily), datetime.min.time()).timestamp(),
+                           account=account, table="daily")
+            if latest_hourly:
+                ts = datetime.combine(date.fromisoformat(latest_hourly[0]), datetime.min.time()).timestamp()
+                out.sample("kyuden_latest_data_timestamp_seconds", ts + 3600 * latest_hourly[1],
+                           account=account, table="hourly")
+        out.header("kyuden_last_fetch_timestamp_seconds", "gauge",
+                   "Fetch time of the latest upserted batch per account and table")
+        for account, _, seen in freshness:
+            for table in ("daily", "hourly"):
+                v = _epoch(seen.get(table, {}).get("seen_at"))
+                if v is not None:
+                    out.sample("kyuden_last_fetch_timestamp_seconds", v, account=account, table=table)
+
+    def render(self) -> str:
+        out = MetricsText()
+        try:
+            with self._lock:
+                up = 1 if self._from_db(out) else 0
+        except Exception as e:
+            logger.warning(f"读取指标数据失败: {e}")
+            up = 0
+        out.header("kyuden_metrics_db_up", "gauge", "Whether the SQLite database could be read")
+        out.sample("kyuden_metrics_db_up", up)
+
+        out.header("kyuden_sqlite_size_bytes", "gauge", "Size of the SQLite database files")
+        for suffix, label in (("", "db"), ("-wal", "wal")):
+            p = Path(str(self.db_path) + suffix)
+            if p.exists():
+                out.sample("kyuden_sqlite_size_bytes", p.stat().st_size, file=label)
+        if self.browser_launch_sec is not None:
+            out.header("kyuden_browser_launch_seconds", "gauge", "Time of the latest Chromium launch in this process")
+            out.sample("kyuden_browser_launch_seconds", round(self.browser_launch_sec, 6))
+        out.header("kyuden_alerts_total", "counter", "Alerts raised via _notify_alert in this process")
+        for stage, n in sorted(self.alerts.items()):
+            out.sample("kyuden_alerts_total", n, stage=stage)
+        return out.render()
+
+    def write_textfile(self, directory: Union[str, Path]) -> Path:
+        """原子地写入 <directory>/kyuden.prom（先写临时文件再 rename，避免 node_exporter 读到半个文件）"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / TEXTFILE_NAME
+        tmp = directory / f".{TEXTFILE_NAME}.{os.getpid()}.tmp"
+        tmp.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp, path)
+        return path
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 9464) -> asyncio.AbstractServer:
+        """最小的 HTTP /metrics 端点（常驻模式使用，只响应 GET）"""
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                request = (await reader.readline()).decode("latin-1").split()
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                if len(request) >= 2 and request[0] == "GET" and request[1].split("?")[0] == "/metrics":
+                    body = (await asyncio.to_thread(self.render)).encode("utf-8")
+                    status, ctype = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    body, status, ctype = b"not found\n", "404 Not Found", "text/plain"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: close\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+            except Exception as e:
+                logger.warning(f"处理 /metrics 请求失败: {e}")
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        logger.info(f"指标端点已启动: http://{host}:{port}/metrics")
+        return server
@@ -0,0 +1,167 @@
+"""
+Playwright context 的请求路由策略（可选）
+按资源类型 / 主机名决定放行或拦截，并统计每次运行的请求数与传输字节数
+
+规则文件示例（JSON）:
+{
+  "allow_hosts": ["kyuden.co.jp"],
+  "deny_hosts": ["google-analytics.com"],
+  "deny_resource_types": ["image", "font", "media", "stylesheet"],
+  "allow_resource_types": []
+}
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterable, Union
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# 预置规则：只放行九电自家域名，且不加载图片/字体/媒体/样式
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "diet": {
+        "allow_hosts": ["kyuden.co.jp"],
+        "deny_resource_types": ["image", "font", "media", "stylesheet"],
+    },
+    "first-party": {
+        "allow_hosts": ["kyuden.co.jp"],
+    },
+    "off": {},
+}
+
+def _host_matches(host: str, patterns: Iterable[str]) -> bool:
+    """主机名后缀匹配：'kyuden.co.jp' 同时匹配 'my.kyuden.co.jp'"""
+    for p in patterns:
+        p = p.lower().lstrip(".")
+        if host == p or host.endswith("." + p):
+            return True
+    return False
+
+class NetworkStats:
+    """一次运行内的请求与字节统计"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests_allowed = 0
+        self.requests_blocked = 0
+        self.requests_failed = 0
+        self.bytes_transferred = 0
+        self.blocked_by_type: Dict[str, int] = {}
+        self.bytes_by_type: Dict[str, int] = {}
+        self.blocked_by_host: Dict[str, int] = {}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests_allowed": self.requests_allowed,
+            "requests_blocked": self.requests_blocked,
+            "requests_failed": self.requests_failed,
+            "bytes_transferred": self.bytes_transferred,
+            "blocked_by_type": dict(self.blocked_by_type),
+            "bytes_by_type": dict(self.bytes_by_type),
+            "blocked_by_host": dict(self.blocked_by_host),
+        }
+
+class NetworkPolicy:
+    """
+    判定顺序：
+    1. deny_hosts 命中 -> 拦截
+    2. allow_hosts 非空且未命中 -> 拦截（第三方请求）
+    3. allow_resource_types 非空且未命中 -> 拦截
+    4. deny_resource_types 命中 -> 拦截
+    5. 其余放行
+    文档请求（document）始终放行，避免把页面本身拦掉
+    """
+
+    def __init__(
+        self,
+        allow_hosts: Optional[Iterable[str]] = None,
+        deny_hosts: Optional[Iterable[str]] = None,
+        allow_resource_types: Optional[Iterable[str]] = None,
+        deny_resource_types: Optional[Iterable[str]] = None,
+    ):
+        self.allow_hosts = [h.lower() for h in (allow_hosts or [])]
+        self.deny_hosts = [h.lower() for h in (deny_hosts or [])]
+        self.allow_resource_types = set(allow_resource_types or [])
+        self.deny_resource_types = set(deny_resource_types or [])
+        self.stats = NetworkStats()
+
+    @classmethod
+    def from_dict(cls, rules: Dict[str, Any]) -> "NetworkPolicy":
+        return cls(
+            allow_hosts=rules.get("allow_hosts"),
+            deny_hosts=rules.get("deny_hosts"),
+            allow_resource_types=rules.get("allow_resource_types"),
+            deny_resource_types=rules.get("deny_resource_types"),
+        )
+
+    @classmethod
+    def load(cls, spec: Union[str, Path]) -> "NetworkPolicy":
+        """spec 可以是预置名（diet / first-party / off）或 JSON 规则文件路径"""
+        if str(spec) in PRESETS:
+            return cls.from_dict(PRESETS[str(spec)])
+        with open(spec, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def decide(self, url: str, resource_type: str) -> bool:
+        """返回 True 表示放行"""
+        if resource_type == "document":
+            return True
+        host = (urlparse(url).hostname or "").lower()
+        if not host:
+            # data: / blob: 等不走网络
+            return True
+        if self.deny_hosts and _host_matches(host, self.deny_hosts):
+            return False
+        if self.allow_hosts and not _host_matches(host, self.allow_hosts):
+            return False
+        if self.allow_resource_types and resource_type not in self.allow_resource_types:
+            return False
+        if resource_type in self.deny_resource_types:
+            return False
+        return True
+
+    async def _route(self, route, request):
+        if self.decide(request.url, request.resource_type):
+            await route.continue_()
+            return
+        s = self.stats
+        s.requests_blocked += 1
+        s.blocked_by_type[request.resource_type] = s.blocked_by_type.get(request.resource_type, 0) + 1
+        host = urlparse(request.url).hostname or ""
+        s.blocked_by_host[host] = s.blocked_by_host.get(host, 0) + 1
+        await route.abort("blockedbyclient")
+
+    async def _on_request_finished(self, request):
+        s = self.stats
+        s.requests_allowed += 1
+        try:
+            sizes = await request.sizes()
+            n = (sizes.get("requestHeadersSize", 0) + sizes.get("requestBodySize", 0)
+                 + sizes.get("responseHeadersSize", 0) + sizes.get("responseBodySize", 0))
+        except Exception:
+            n = 0
+        s.bytes_transferred += n
+        s.bytes_by_type[request.resource_type] = s.bytes_by_type.get(request.resource_type, 0) + n
+
+    def _on_request_failed(self, request):
+        # 被我们拦截的请求也会触发 requestfailed，这里只统计真正的网络失败
+        failure = request.failure or ""
+        if "BLOCKED_BY_CLIENT" not in failure.upper():
+            self.stats.requests_failed += 1
+
+    async def install(self, context):
+        """挂到 BrowserContext 上（每个新 context 都需要调用一次）"""
+        await context.route("**/*", self._route)
+        context.on("requestfinished", self._on_request_finished)
+        context.on("requestfailed", self._on_request_failed)
+
+    def log_summary(self):
+        s = self.stats
+        logger.info(
+            f"网络统计: 放行 {s.requests_allowed} 个请求 / {s.bytes_transferred / 1024:.1f} KiB，"
+            f"拦截 {s.requests_blocked} 个（按类型 {s.blocked_by_type}），失败 {s.requests_failed} 个"
+        )
@@ -0,0 +1,142 @@
+"""
+拟人化等待的节奏策略：
+- 命名档位（cautious / normal / minimal）控制随机等待的倍率、逐字输入延迟、是否模拟鼠标移动
+- 每次运行有硬性的睡眠预算，用完后所有拟人化等待都直接跳过
+- 按阶段统计总耗时、睡眠时间和实际工作时间，方便收紧 RuntimeMaxSec
+"""
+
+import time
+import random
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # 比默认更慢，适合登录频繁失败、怀疑被风控时使用
+    "cautious": {"scale": 1.5, "typing_delay_ms": (80, 200), "mouse_movement": True},
+    # 与历史行为一致
+    "normal": {"scale": 1.0, "typing_delay_ms": (50, 150), "mouse_movement": True},
+    # 只保留极短的等待，用于复用登录态的定时任务和本地基准测试
+    "minimal": {"scale": 0.1, "typing_delay_ms": (0, 20), "mouse_movement": False},
+}
+
+# 当前所处的阶段栈（按 asyncio 任务隔离，并行标签页也能正确归属）
+_phase_stack: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("kyuden_pacing_phase", default=())
+
+class PacingPolicy:
+    def __init__(
+        self,
+        scale: float = 1.0,
+        typing_delay_ms: Tuple[float, float] = (50, 150),
+        mouse_movement: bool = True,
+        budget_sec: Optional[float] = None,
+        name: str = "custom",
+    ):
+        self.scale = max(0.0, scale)
+        self.typing_delay_ms = typing_delay_ms
+        self.mouse_movement = mouse_movement
+        self.budget_sec = budget_sec
+        self.name = name
+        self.reset()
+
+    @classmethod
+    def from_profile(cls, name: str, budget_sec: Optional[float] = None) -> "PacingPolicy":
+        if name not in PROFILES:
+            raise ValueError(f"未知的节奏档位: {name}（可选: {', '.join(PROFILES)}）")
+        return cls(budget_sec=budget_sec, name=name, **PROFILES[name])
+
+    def reset(self):
+        """每次 scrape 开始时清零统计与预算"""
+        self.slept_sec = 0.0
+        self.skipped_sec = 0.0
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self._run_started = time.perf_counter()
+
+    @property
+    def budget_left(self) -> Optional[float]:
+        if self.budget_sec is None:
+            return None
+        return max(0.0, self.budget_sec - self.slept_sec)
+
+    def _take(self, wanted: float) -> float:
+        """从预算中扣除，返回实际允许睡眠的秒数"""
+        left = self.budget_left
+        allowed = wanted if left is None else min(wanted, left)
+        self.skipped_sec += wanted - allowed
+        self.slept_sec += allowed
+        return allowed
+
+    def _record_sleep(self, seconds: float):
+        for name in _phase_stack.get():
+            self.phases.setdefault(name, {"wall": 0.0, "sleep": 0.0})["sleep"] += seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        """标记一个阶段；阶段可嵌套，睡眠时间同时计入所有外层阶段"""
+        token = _phase_stack.set(_phase_stack.get() + (name,))
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            _phase_stack.reset(token)
+            self.phases.setdefault(name, {"wall": 0.0, "sleep": 0.0})["wall"] += time.perf_counter() - started
+
+    async def sleep(self, min_sec: float, max_sec: float):
+        """拟人化随机等待（按档位缩放并受预算约束）"""
+        wanted = random.uniform(min_sec, max_sec) * self.scale
+        allowed = self._take(wanted)
+        if allowed > 0:
+            self._record_sleep(allowed)
+            await asyncio.sleep(allowed)
+
+    async def pause(self, seconds: float):
+        """非拟人化的固定等待（例如重试退避），不缩放、不占预算，但计入统计"""
+        self._record_sleep(seconds)
+        await asyncio.sleep(seconds)
+
+    def typing_delay(self) -> float:
+        """逐字输入的单字符延迟（毫秒），同样受预算约束"""
+        lo, hi = self.typing_delay_ms
+        allowed = self._take(random.uniform(lo, hi) / 1000.0)
+        self._record_sleep(allowed)
+        return allowed * 1000.0
+
+    def summary(self) -> Dict[str, Any]:
+        total = time.perf_counter() - self._run_started
+        return {
+            "profile": self.name,
+            "budget_sec": self.budget_sec,
+            "total_sec": round(total, 3),
+            "slept_sec": round(self.slept_sec, 3),
+            "skipped_sec": round(self.skipped_sec, 3),
+            "phases": {
+                name: {
+                    "wall_sec": round(p["wall"], 3),
+                    "sleep_sec": round(p["sleep"], 3),
+                    # 并行标签页的睡眠会重叠，work 以 0 为下限
+                    "work_sec": round(max(0.0, p["wall"] - p["sleep"]), 3),
+                }
+                for name, p in self.phases.items()
+            },
+        }
+
+    def log_summary(self):
+        s = self.summary()
+        logger.info(
+            f"节奏统计[{s['profile']}]: 总耗时 {s['total_sec']:.1f}s，睡眠 {s['slept_sec']:.1f}s，"
+            f"因预算跳过 {s['skipped_sec']:.1f}s"
+        )
+        for name, p in s["phases"].items():
+            logger.info(f"  阶段 {name}: 总 {p['wall_sec']:.2f}s / 睡眠 {p['sleep_sec']:.2f}s / 工作 {p['work_sec']:.2f}s")
+
+def resolve_pacing(spec, budget_sec: Optional[float] = None) -> PacingPolicy:
+    """接受 PacingPolicy 实例、档位名或 None（= normal）"""
+    if isinstance(spec, PacingPolicy):
+        if budget_sec is not None:
+            spec.budget_sec = budget_sec
+        return spec
+    return PacingPolicy.from_profile(spec or "normal", budget_sec=budget_sec)
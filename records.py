@@ -0,0 +1,132 @@
+"""
+用电量记录类型：在 KyudenScraper、导出（_save_dataset）和 KyudenSQLite 之间传递
+
+- DailyUsage / HourlyUsage 使用 __slots__，单条记录的内存约为同等 dict 的三分之一
+- 保留 dict 风格的读取（r['date']、r.get('usage_kwh')），现有脚本无需修改
+- UsageBatch 是 list 的子类，附带数据种类与整批的抓取时间；KyudenSQLite 对它走快速路径，
+  不再逐条猜测键名和转换类型
+"""
+
+from array import array
+from datetime import date, datetime
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple
+
+from columnar import UsageColumns
+
+class DailyUsage:
+    """
+    一天的用电量记录；与 dict 及同类记录按字段值比较
+    与原先的 dict 一样不可哈希（字段可变，按值哈希会在修改后失效），需要去重时请用 (date[, hour]) 作键
+    """
+    __slots__ = ("date", "date_str", "usage_kwh", "timestamp")
+    _fields: Tuple[str, ...] = ("date", "date_str", "usage_kwh", "timestamp")
+
+    def __init__(self, date: date, date_str: str, usage_kwh: float, timestamp: datetime):
+        self.date = date
+        self.date_str = date_str
+        self.usage_kwh = usage_kwh
+        self.timestamp = timestamp
+
+    # ---- dict 兼容 ----
+    def __getitem__(self, key: str):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._fields
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def items(self):
+        return [(k, getattr(self, k)) for k in self._fields]
+
+    def copy(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON 友好的 dict（日期与时间转为 ISO 字符串）"""
+        d = dict(self.items())
+        d["date"] = self.date.isoformat()
+        d["timestamp"] = self.timestamp.isoformat()
+        return d
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, DailyUsage):
+            return type(self) is type(other) and self.items() == other.items()
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    __hash__ = None  # 定义了按值比较的 __eq__，显式声明不可哈希
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(" + ", ".join(f"{k}={getattr(self, k)!r}" for k in self._fields) + ")"
+
+class HourlyUsage(DailyUsage):
+    __slots__ = ("hour",)
+    _fields = ("date", "date_str", "hour", "usage_kwh", "timestamp")
+
+    def __init__(self, date: date, date_str: str, hour: int, usage_kwh: float, timestamp: datetime):
+        super().__init__(date, date_str, usage_kwh, timestamp)
+        self.hour = hour
+
+class UsageBatch(list):
+    """同一种类（daily / hourly）记录的列表，通常共用一个抓取时间"""
+
+    __slots__ = ("kind", "fetched_at")
+
+    def __init__(self, kind: str, records: Iterable[DailyUsage] = (), fetched_at: Optional[datetime] = None):
+        if kind not in ("daily", "hourly"):
+            raise ValueError(f"未知的数据种类: {kind}")
+        super().__init__(records)
+        self.kind = kind
+        self.fetched_at = fetched_at
+
+    @property
+    def is_hourly(self) -> bool:
+        return self.kind == "hourly"
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [r.to_dict() for r in self]
+
+    def db_params(self) -> Iterator[Tuple]:
+        """upsert 参数元组：(date, usage, fetched_at) 或 (date, hour, usage, fetched_at)"""
+        iso: Dict[date, str] = {}
+        last_ts, last_iso = None, None
+        hourly = self.is_hourly
+        for r in self:
+            d = iso.get(r.date)
+            if d is None:
+                d = iso[r.date] = r.date.isoformat()
+            if r.timestamp is not last_ts:
+                last_ts, last_iso = r.timestamp, r.timestamp.isoformat()
+            if hourly:
+                yield (d, r.hour, float(r.usage_kwh), last_iso)
+            else:
+                yield (d, float(r.usage_kwh), last_iso)
+
+    def to_columns(self) -> UsageColumns:
+        days = array("l", (r.date.toordinal() for r in self))
+        usage = array("d", (float(r.usage_kwh) for r in self))
+        hours = array("b", (r.hour for r in self)) if self.is_hourly else None
+        return UsageColumns(days, usage, hours=hours, fetched_at=self.fetched_at)
+
+def as_dicts(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """把记录或 dict 统一成 JSON 友好的 dict 列表（导出用）"""
+    out = []
+    for r in rows:
+        if isinstance(r, DailyUsage):
+            out.append(r.to_dict())
+            continue
+        obj = dict(r)
+        if isinstance(obj.get("date"), date):
+            obj["date"] = obj["date"].isoformat()
+        if isinstance(obj.get("timestamp"), datetime):
+            obj["timestamp"] = obj["timestamp"].isoformat()
+        out.append(obj)
+    return out
@@ -0,0 +1,119 @@
+"""
+登录态的廉价校验：在做完整的 DOM 检查之前，先看
+1. storage state 里是否有站点的 cookie、是否已全部过期
+2. 上一次成功运行的时间是否在信任窗口内
+3. （可选）对 /member/account 做一次不跟随跳转的 HEAD 探测
+只有这些信号都不明确时才交给 KyudenScraper.is_logged_in() 做完整的页面检查
+"""
+
+import json
+import time
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, Union
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+class SessionCheck:
+    """校验结果：valid 为 True/False 表示结论明确，None 表示需要 DOM 检查"""
+
+    def __init__(self, valid: Optional[bool], path: str, detail: str = ""):
+        self.valid = valid
+        self.path = path
+        self.detail = detail
+
+    def __repr__(self):
+        return f"SessionCheck(valid={self.valid}, path={self.path!r}, detail={self.detail!r})"
+
+class SessionValidator:
+    def __init__(
+        self,
+        storage_state_path: Optional[Union[str, Path]],
+        meta: Optional[Dict[str, Any]] = None,
+        base_url: str = "https://my.kyuden.co.jp",
+        trust_window_sec: float = 600.0,
+        probe: bool = True,
+        probe_timeout: float = 5.0,
+        cookie_domain: str = "kyuden.co.jp",
+    ):
+        self.storage_state_path = Path(storage_state_path) if storage_state_path else None
+        self.meta = meta or {}
+        self.base_url = base_url.rstrip("/")
+        self.trust_window_sec = trust_window_sec
+        self.probe_enabled = probe
+        self.probe_timeout = probe_timeout
+        self.cookie_domain = cookie_domain
+
+    def _load_cookies(self) -> Optional[list]:
+        if not self.storage_state_path or not self.storage_state_path.exists():
+            return None
+        try:
+            with open(self.storage_state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取 storage state 失败: {e}")
+            return None
+        return [c for c in state.get("cookies", []) if self.cookie_domain in c.get("domain", "")]
+
+    def check_cookies(self, cookies: list, now: Optional[float] = None) -> Optional[bool]:
+        """所有持久 cookie 都已过期 -> False；存在未过期的持久 cookie -> None（仍需其它信号）"""
+        now = now or time.time()
+        if not cookies:
+            return False
+        persistent = [c for c in cookies if c.get("expires", -1) > 0]
+        if persistent and all(c["expires"] <= now for c in persistent):
+            return False
+        return None
+
+    def check_recent_success(self, now: Optional[datetime] = None) -> bool:
+        last = self.meta.get("last_success_at")
+        if not last:
+            return False
+        try:
+            age = ((now or datetime.now()) - datetime.fromisoformat(last)).total_seconds()
+        except ValueError:
+            return False
+        return 0 <= age <= self.trust_window_sec
+
+    def probe(self) -> Optional[bool]:
+        """HEAD /member/account（不跟随跳转）：200 -> True，跳到登录页 -> False，其它 -> None"""
+        from http_fetch import KyudenHttpFetcher, FastPathUnavailable
+        import requests
+
+        fetcher = KyudenHttpFetcher(self.storage_state_path, base_url=self.base_url, timeout=self.probe_timeout)
+        try:
+            fetcher.load_cookies()
+            resp = fetcher.session.head(f"{self.base_url}/member/account", allow_redirects=False,
+                                        timeout=self.probe_timeout)
+        except (FastPathUnavailable, requests.RequestException) as e:
+            logger.debug(f"登录态探测失败: {e}")
+            return None
+        finally:
+            fetcher.close()
+        if resp.status_code == 200:
+            return True
+        if resp.status_code in (301, 302, 303, 307, 308):
+            location = urlparse(resp.headers.get("Location", "")).path.rstrip("/")
+            if location.endswith("/member") or "login" in location.lower():
+                return False
+        return None
+
+    def validate(self) -> SessionCheck:
+        cookies = self._load_cookies()
+        if cookies is None:
+            return SessionCheck(False, "no-state", "storage state 不存在")
+        if not cookies:
+            return SessionCheck(False, "no-cookies", f"storage state 中没有 {self.cookie_domain} 的 cookie")
+        if self.check_cookies(cookies) is False:
+            return SessionCheck(False, "cookies-expired", "cookie 已全部过期")
+        if self.check_recent_success():
+            return SessionCheck(True, "recent-success", f"上次成功: {self.meta.get('last_success_at')}")
+        if self.probe_enabled:
+            result = self.probe()
+            if result is True:
+                return SessionCheck(True, "probe-ok")
+            if result is False:
+                return SessionCheck(False, "probe-redirect", "探测被重定向到登录页")
+        return SessionCheck(None, "dom", "廉价信号不明确")
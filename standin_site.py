@@ -0,0 +1,262 @@
+"""
+本地的九电网站替身，用于离线端到端测试和基准测试（只依赖标准库）
+
+模拟的页面:
+- GET/POST /member                 登录页（body_1$TxtKaiinId / body_1$TxtPasswd / button.fs-submit）
+- GET/HEAD /member/account         账户页（-daily / -hourly 详情按钮），未登录时 302 到 /member
+- GET /member/chart_days_current   每日图表页（隐藏字段 body_0$Data，?offset=N 为往前第 N 个周期）
+- GET /member/chart_hours_current  每小时图表页（?offset=N 为往前第 N 天）
+两个图表页都带有 button.fs-chart_nav__prev，与 KyudenScraper.previous_chart_payload 配合
+（该按钮是照着推测的 CHART_PREV_SELECTOR 写的，并非来自真实页面的录制；
+替身站点上的回填 / 历史爬取只验证了抓取器自身的一致性，不能证明选择器在真实站点可用）
+
+图表数据来自 fixtures/ 下录制的 JSON；每日数据也可以直接使用 test_real_data.json 这类导出记录
+
+用法:
+    python standin_site.py --port 8765
+    python kyuden_scraper.py --base-url http://127.0.0.1:8765 -u demo -p demo
+"""
+
+import json
+import html
+import time
+import secrets
+import logging
+import threading
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Optional, Dict, Any, Union
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+SESSION_COOKIE = "KYUDEN_STANDIN_SID"
+
+def load_daily_fixture(path: Union[str, Path]) -> Dict[str, Any]:
+    """读取每日图表 JSON；若是 test_real_data.json 这类记录列表，则还原成图表结构"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return data
+    return {
+        "columns": [["使用電力量"] + [r["usage_kwh"] for r in data], ["dummy"] + [None] * len(data)],
+        "shiyoKikan": ["x"] + [r["date_str"] for r in data],
+        "groups": [["使用電力量", "dummy"]],
+        "order": ["使用電力量", "dummy"],
+    }
+
+def load_hourly_fixture(path: Union[str, Path]) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _page(title: str, body: str) -> bytes:
+    return (
+        "<!DOCTYPE html><html lang=\"ja\"><head><meta charset=\"utf-8\">"
+        f"<title>{html.escape(title)}</title></head><body>{body}</body></html>"
+    ).encode("utf-8")
+
+def _chart_body(payload: Dict[str, Any], action: str, offset: int) -> str:
+    value = html.escape(json.dumps(payload, ensure_ascii=False), quote=True)
+    return (
+        f'<input type="hidden" name="body_0$Data" id="body_0_Data" value="{value}" />'
+        f'<form method="get" action="{action}">'
+        f'<input type="hidden" name="offset" value="{offset + 1}" />'
+        '<button type="submit" class="fs-chart_nav__prev">前へ</button>'
+        "</form>"
+    )
+
+class StandinState:
+    """替身站点的配置与会话表（多线程共享）"""
+
+    def __init__(
+        self,
+        daily: Dict[str, Any],
+        hourly: Dict[str, Any],
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        latency_ms: float = 0.0,
+        history_periods: int = 12,
+        today: Optional[date] = None,
+    ):
+        self.daily = daily
+        self.hourly = hourly
+        self.username = username
+        self.password = password
+        self.latency_ms = latency_ms
+        self.history_periods = history_periods
+        self.today = today
+        self.sessions: set = set()
+        self.lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+
+    def daily_payload(self, offset: int) -> Dict[str, Any]:
+        """第 offset 个往前的周期：按 fixture 长度整体平移日期标签"""
+        values = self.daily["columns"][0][1:]
+        n = len(values)
+        if offset > self.history_periods:
+            values = [None] * n
+        end = (self.today or date.today()) - timedelta(days=offset * n)
+        labels = [f"{d.month}/{d.day}" for d in (end - timedelta(days=n - 1 - i) for i in range(n))]
+        payload = dict(self.daily)
+        payload["columns"] = [[self.daily["columns"][0][0]] + list(values)] + self.daily["columns"][1:]
+        payload["shiyoKikan"] = ["x"] + labels
+        return payload
+
+    def hourly_payload(self, offset: int) -> Dict[str, Any]:
+        if offset > self.history_periods * 31:
+            payload = dict(self.hourly)
+            payload["columns"] = [[self.hourly["columns"][0][0]] + [None] * 24] + self.hourly["columns"][1:]
+            return payload
+        return self.hourly
+
+class StandinHandler(BaseHTTPRequestHandler):
+    state: StandinState = None  # 由 make_server 注入
+    server_version = "KyudenStandin/1.0"
+
+    def log_message(self, fmt, *args):
+        logger.debug("standin: " + fmt % args)
+
+    def _count(self, path: str):
+        with self.state.lock:
+            self.state.hits[path] = self.state.hits.get(path, 0) + 1
+
+    def _delay(self):
+        if self.state.latency_ms:
+            time.sleep(self.state.latency_ms / 1000.0)
+
+    def _logged_in(self) -> bool:
+        for part in self.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == SESSION_COOKIE and value in self.state.sessions:
+                return True
+        return False
+
+    def _send(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None, head: bool = False):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _redirect(self, location: str, headers: Optional[Dict[str, str]] = None, head: bool = False):
+        h = {"Location": location}
+        h.update(headers or {})
+        self._send(302, b"", h, head=head)
+
+    def _route(self, head: bool = False):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/") or "/"
+        query = parse_qs(url.query)
+        offset = int((query.get("offset") or ["0"])[0])
+        self._count(path)
+        self._delay()
+
+        if path == "/member":
+            body = (
+                '<form method="post" action="/member">'
+                '<input type="text" name="body_1$TxtKaiinId" />'
+                '<input type="password" name="body_1$TxtPasswd" />'
+                '<button type="submit" class="fs-submit">ログイン</button>'
+                "</form>"
+            )
+            return self._send(200, _page("ログイン", body), head=head)
+
+        if not self._logged_in():
+            return self._redirect("/member", head=head)
+
+        if path == "/member/account":
+            body = (
+                '<form method="get" action="/member/chart_days_current">'
+                '<button type="submit" class="fs-top_card__detail_button -daily">日別</button></form>'
+                '<form method="get" action="/member/chart_hours_current">'
+                '<button type="submit" class="fs-top_card__detail_button -hourly">時間別</button></form>'
+            )
+            return self._send(200, _page("アカウント", body), head=head)
+        if path == "/member/chart_days_current":
+            body = _chart_body(self.state.daily_payload(offset), "/member/chart_days_current", offset)
+            return self._send(200, _page("日別", body), head=head)
+        if path == "/member/chart_hours_current":
+            body = _chart_body(self.state.hourly_payload(offset), "/member/chart_hours_current", offset)
+            return self._send(200, _page("時間別", body), head=head)
+        return self._send(404, _page("Not Found", "not found"), head=head)
+
+    def do_GET(self):
+        self._route()
+
+    def do_HEAD(self):
+        self._route(head=True)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        self._count("POST " + urlparse(self.path).path)
+        self._delay()
+        user = (form.get("body_1$TxtKaiinId") or [""])[0]
+        pw = (form.get("body_1$TxtPasswd") or [""])[0]
+        ok = bool(user and pw)
+        if self.state.username is not None:
+            ok = ok and user == self.state.username and pw == self.state.password
+        if not ok:
+            return self._redirect("/member")
+        sid = secrets.token_hex(16)
+        with self.state.lock:
+            self.state.sessions.add(sid)
+        expires = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 86400))
+        self._redirect("/member/account", {"Set-Cookie": f"{SESSION_COOKIE}={sid}; Path=/; Expires={expires}; HttpOnly"})
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    daily_fixture: Union[str, Path] = FIXTURES_DIR / "daily_chart.json",
+    hourly_fixture: Union[str, Path] = FIXTURES_DIR / "hourly_chart.json",
+    **state_kwargs,
+) -> ThreadingHTTPServer:
+    """创建替身服务器（port=0 时自动分配端口，见 server.server_address）"""
+    state = StandinState(load_daily_fixture(daily_fixture), load_hourly_fixture(hourly_fixture), **state_kwargs)
+    handler = type("BoundStandinHandler", (StandinHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+def start_in_thread(**kwargs):
+    """在后台线程中启动，返回 (server, base_url)"""
+    server = make_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, name="kyuden-standin", daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Local stand-in for the Kyuden member site")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--daily-fixture", default=str(FIXTURES_DIR / "daily_chart.json"),
+                        help="每日图表 JSON，或 test_real_data.json 这类导出记录")
+    parser.add_argument("--hourly-fixture", default=str(FIXTURES_DIR / "hourly_chart.json"))
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个请求额外的响应延迟")
+    parser.add_argument("--username", default=None, help="只接受该用户名（默认任意非空）")
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host, args.port, args.daily_fixture, args.hourly_fixture,
+        username=args.username, password=args.password, latency_ms=args.latency_ms,
+    )
+    print(f"Kyuden stand-in listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    main()
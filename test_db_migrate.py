@@ -0,0 +1,73 @@
+"""
+测试在线迁移：版本 1 / 2 的库经 migrate() 升到版本 3 后行数、取值与汇总一致
+"""
+
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from db import KyudenSQLite, USAGE_DDL, SCHEMA_VERSION, ROLLUP_TABLES
+
+START = date(2024, 12, 20)
+DAYS = 40
+
+def _legacy_db(path, version: int) -> KyudenSQLite:
+    """按旧版本的表结构建库，再经 KyudenSQLite 写入数据"""
+    conn = sqlite3.connect(str(path))
+    for ddl in USAGE_DDL[version]:
+        conn.execute(ddl)
+    if version >= 2:
+        conn.execute(f"PRAGMA user_version = {version};")
+    conn.commit()
+    conn.close()
+    db = KyudenSQLite(path)
+    db.connect()
+    db.init_schema()
+    assert db.schema_version == version
+    db.upsert_daily([{"date": START + timedelta(days=i), "usage_kwh": 5.0 + i % 3, "timestamp": "2025-01-30T01:00:00"}
+                     for i in range(DAYS)])
+    db.upsert_hourly([{"date": START + timedelta(days=i // 24), "hour": i % 24, "usage_kwh": (i % 24) / 8,
+                       "timestamp": "2025-01-30T01:00:00"} for i in range(DAYS * 24)])
+    return db
+
+def _snapshot(db: KyudenSQLite):
+    return (
+        [(r.date, r.usage_kwh, r.timestamp) for r in db.iter_daily()],
+        [(r.date, r.hour, r.usage_kwh, r.timestamp) for r in db.iter_hourly()],
+        db.last_seen(),
+    )
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_migrate_keeps_rows(tmp_path, version):
+    db = _legacy_db(tmp_path / "usage.db", version)
+    try:
+        before = _snapshot(db)
+        report = db.migrate(chunk_rows=100, pause_sec=0)
+        assert report["migrated"] and report["from_version"] == version
+        assert report["rows"]["daily"] == DAYS and report["rows"]["hourly"] == DAYS * 24
+        assert db.schema_version == SCHEMA_VERSION
+        assert db.conn.execute("PRAGMA user_version;").fetchone()[0] == SCHEMA_VERSION
+        assert db.conn.execute("SELECT COUNT(*) FROM daily_usage_v3;").fetchone()[0] == DAYS
+        assert db.conn.execute("SELECT COUNT(*) FROM hourly_usage_v3;").fetchone()[0] == DAYS * 24
+        assert _snapshot(db) == before
+        # 兼容视图仍可按旧的列名读取
+        assert db.conn.execute("SELECT COUNT(*) FROM hourly_usage;").fetchone()[0] == DAYS * 24
+
+        rollups = {t: db.conn.execute(f"SELECT * FROM {t} ORDER BY 1, 2;").fetchall() for t in ROLLUP_TABLES}
+        db.rebuild_rollups()
+        assert {t: db.conn.execute(f"SELECT * FROM {t} ORDER BY 1, 2;").fetchall() for t in ROLLUP_TABLES} == rollups
+        assert db.migrate() == {"migrated": False, "schema_version": SCHEMA_VERSION}
+    finally:
+        db.close()
+
+def test_writes_after_migrate(tmp_path):
+    db = _legacy_db(tmp_path / "usage.db", 1)
+    try:
+        db.migrate(pause_sec=0)
+        result = db.upsert_daily([{"date": START, "usage_kwh": 99.0, "timestamp": "2025-02-01T01:00:00"}])
+        assert (result.updated, result.inserted) == (1, 0)
+        assert db.rollup_total("month", START) == sum(
+            r.usage_kwh for r in db.iter_daily(START.replace(day=1), date(2024, 12, 31)))
+    finally:
+        db.close()
@@ -0,0 +1,74 @@
+"""
+测试范围读取 API 与汇总表：触发器维护的日 / 周 / 月合计与从头重建的结果一致
+"""
+
+import math
+from datetime import date, timedelta
+
+from db import KyudenSQLite, ROLLUP_TABLES
+
+START = date(2025, 1, 1)
+
+def _open(tmp_path) -> KyudenSQLite:
+    db = KyudenSQLite(tmp_path / "usage.db")
+    db.connect()
+    db.init_schema()
+    return db
+
+def _rollups(db: KyudenSQLite):
+    return {t: [tuple(r) for r in db.conn.execute(f"SELECT * FROM {t} ORDER BY 1, 2;")] for t in ROLLUP_TABLES}
+
+def _fill(db: KyudenSQLite, days: int, scale: float, ts: str, account: int = 1):
+    db.upsert_daily([{"date": START + timedelta(days=i), "usage_kwh": round(scale * (i % 7 + 1), 1), "timestamp": ts}
+                     for i in range(days)], account=account)
+    db.upsert_hourly([{"date": START + timedelta(days=i // 24), "hour": i % 24,
+                       "usage_kwh": round(scale * (i % 24) / 10, 3), "timestamp": ts}
+                      for i in range(days * 24)], account=account)
+
+def test_range_reads(tmp_path):
+    db = _open(tmp_path)
+    try:
+        _fill(db, 10, 1.0, "2025-01-11T01:00:00")
+        daily = list(db.iter_daily("2025-01-03", "2025-01-05"))
+        assert [r.date for r in daily] == [date(2025, 1, 3), date(2025, 1, 4), date(2025, 1, 5)]
+        hourly = list(db.iter_hourly("2025-01-02", "2025-01-02"))
+        assert [r.hour for r in hourly] == list(range(24))
+        peaks = db.top_peak_hours(3, "2025-01-01", "2025-01-10")
+        assert [p.hour for p in peaks] == [23, 23, 23]
+        assert [p.date for p in peaks] == [date(2025, 1, 1), date(2025, 1, 2), date(2025, 1, 3)]
+    finally:
+        db.close()
+
+def test_rollup_totals_follow_upserts(tmp_path):
+    db = _open(tmp_path)
+    try:
+        for n, scale in enumerate((1.0, 1.1, 0.3, 1.7, 0.9)):
+            _fill(db, 45, scale, f"2025-02-{n + 1:02d}T01:00:00")
+        kept = _rollups(db)
+        db.rebuild_rollups()
+        assert _rollups(db) == kept
+
+        day = START + timedelta(days=3)
+        hours = [r.usage_kwh for r in db.iter_hourly(day, day)]
+        assert math.isclose(db.rollup_total("day", day), math.fsum(hours), abs_tol=1e-9)
+        assert [(d, h) for d, _, h in db.iter_daily_totals(day, day)] == [(day, 24)]
+        january = [r.usage_kwh for r in db.iter_daily("2025-01-01", "2025-01-31")]
+        assert math.isclose(db.rollup_total("month", "2025-01"), math.fsum(january), abs_tol=1e-9)
+        week = [r.usage_kwh for r in db.iter_daily("2025-01-06", "2025-01-12")]
+        assert math.isclose(db.rollup_total("week", "2025-01-08"), math.fsum(week), abs_tol=1e-9)
+    finally:
+        db.close()
+
+def test_rollups_are_per_account(tmp_path):
+    db = _open(tmp_path)
+    try:
+        other = db.account_id("second")
+        _fill(db, 7, 1.0, "2025-01-08T01:00:00")
+        _fill(db, 7, 2.0, "2025-01-08T01:00:00", account=other)
+        assert math.isclose(db.rollup_total("month", "2025-01", account=other),
+                            2 * db.rollup_total("month", "2025-01"), rel_tol=1e-9)
+        db.conn.execute("DELETE FROM daily_usage_v3 WHERE account = ?;", (other,))
+        assert db.rollup_total("month", "2025-01", account=other) is None
+        assert db.rollup_total("month", "2025-01") is not None
+    finally:
+        db.close()
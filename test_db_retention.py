@@ -0,0 +1,70 @@
+"""
+测试 hourly 保留策略：压缩旧日期后每日合计与汇总表不变，之后对这些日期的 upsert 计为 skipped
+"""
+
+from datetime import date, timedelta
+
+from db import KyudenSQLite, RetentionPolicy
+
+TODAY = date(2025, 10, 16)
+START = date(2025, 1, 1)
+
+def _open(tmp_path) -> KyudenSQLite:
+    db = KyudenSQLite(tmp_path / "usage.db")
+    db.connect()
+    db.init_schema()
+    return db
+
+def _hourly(days: int, ts: str = "2025-10-16T01:00:00"):
+    return [{"date": START + timedelta(days=i // 24), "hour": i % 24,
+             "usage_kwh": round(((i * 37) % 101) / 50, 3), "timestamp": ts} for i in range(days * 24)]
+
+def test_retention_keeps_daily_totals(tmp_path):
+    db = _open(tmp_path)
+    try:
+        other = db.account_id("second")
+        days = (TODAY - START).days
+        db.upsert_hourly(_hourly(days))
+        db.upsert_hourly(_hourly(40), account=other)
+        policy = RetentionPolicy(keep_months=6, pause_sec=0)
+        cutoff = policy.cutoff(TODAY)
+        totals = {a: list(db.iter_daily_totals(account=a)) for a in (1, other)}
+        day_total = db.rollup_total("day", START + timedelta(days=10))
+
+        dry = db.apply_retention(policy, today=TODAY, dry_run=True)
+        assert dry["rows_compacted"] == ((cutoff - START).days + 40) * 24
+        assert db.conn.execute("SELECT COUNT(*) FROM hourly_compacted;").fetchone()[0] == 0
+
+        report = db.apply_retention(policy, today=TODAY)
+        assert report["rows_compacted"] == dry["rows_compacted"]
+        assert report["days_compacted"] == (cutoff - START).days + 40
+        assert {a: list(db.iter_daily_totals(account=a)) for a in (1, other)} == totals
+        assert db.rollup_total("day", START + timedelta(days=10)) == day_total
+        db.rebuild_rollups()
+        assert {a: list(db.iter_daily_totals(account=a)) for a in (1, other)} == totals
+
+        # 已压缩的日期没有逐小时数据，但在回填看来是完整的
+        assert list(db.iter_hourly(START, cutoff - timedelta(days=1))) == []
+        assert len(list(db.iter_hourly(cutoff, cutoff))) == 24
+        assert START.isoformat() in db.hourly_complete_days(START, START)
+    finally:
+        db.close()
+
+def test_upserts_on_compacted_days_are_skipped(tmp_path):
+    db = _open(tmp_path)
+    try:
+        db.upsert_hourly(_hourly((TODAY - START).days))
+        policy = RetentionPolicy(keep_months=6, pause_sec=0)
+        db.apply_retention(policy, today=TODAY)
+        cutoff = policy.cutoff(TODAY)
+        before = list(db.iter_daily_totals(START, START))
+
+        rows = [{"date": START, "hour": 0, "usage_kwh": 50.0, "timestamp": "2025-10-17T01:00:00"},
+                {"date": cutoff, "hour": 0, "usage_kwh": 50.0, "timestamp": "2025-10-17T01:00:00"}]
+        result = db.upsert_hourly(rows)
+        assert (result.skipped, result.updated, result.unchanged) == (1, 1, 0)
+        assert result.total == 2
+        assert list(db.iter_daily_totals(START, START)) == before
+        assert list(db.iter_hourly(START, START)) == []
+    finally:
+        db.close()
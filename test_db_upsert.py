@@ -0,0 +1,59 @@
+"""
+测试变化检测 upsert：新增 / 更新 / 未变化的计数，以及 fetched_at 只在值变化时刷新
+"""
+
+from db import KyudenSQLite, UpsertResult
+
+def _open(tmp_path) -> KyudenSQLite:
+    db = KyudenSQLite(tmp_path / "usage.db")
+    db.connect()
+    db.init_schema()
+    return db
+
+def _daily(values, ts):
+    return [{"date": f"2025-03-{i + 1:02d}", "usage_kwh": u, "timestamp": ts} for i, u in enumerate(values)]
+
+def test_upsert_counts(tmp_path):
+    db = _open(tmp_path)
+    try:
+        first = db.upsert_daily(_daily([1.0, 2.0, 3.0], "2025-03-04T01:00:00"))
+        assert first == UpsertResult(inserted=3)
+
+        second = db.upsert_daily(_daily([1.0, 2.5, 3.0, 4.0], "2025-03-05T01:00:00"))
+        assert (second.inserted, second.updated, second.unchanged) == (1, 1, 2)
+        assert second.written == 2 and second.total == 4
+        assert (first + second).as_dict() == {"inserted": 4, "updated": 1, "unchanged": 2, "skipped": 0}
+
+        again = db.upsert_daily(_daily([1.0, 2.5, 3.0, 4.0], "2025-03-06T01:00:00"))
+        assert again == UpsertResult(unchanged=4)
+    finally:
+        db.close()
+
+def test_fetched_at_tracks_last_change(tmp_path):
+    db = _open(tmp_path)
+    try:
+        db.upsert_daily(_daily([1.0, 2.0], "2025-03-03T01:00:00"))
+        db.upsert_daily(_daily([1.0, 2.5], "2025-03-04T01:00:00"))
+        stamps = {r.date.isoformat(): r.timestamp.isoformat() for r in db.iter_daily()}
+        assert stamps == {"2025-03-01": "2025-03-03T01:00:00", "2025-03-02": "2025-03-04T01:00:00"}
+        assert db.last_seen()["daily"]["seen_at"] == "2025-03-04T01:00:00"
+
+        db.upsert_daily(_daily([1.0, 2.5], "2025-03-05T01:00:00"), touch_unchanged=True)
+        assert {r.timestamp.isoformat() for r in db.iter_daily()} == {"2025-03-05T01:00:00"}
+    finally:
+        db.close()
+
+def test_hourly_counts_and_record_seen(tmp_path):
+    db = _open(tmp_path)
+    try:
+        rows = [{"date": "2025-03-01", "hour": h, "usage_kwh": 0.1 * h, "timestamp": "2025-03-02T01:00:00"}
+                for h in range(24)]
+        assert db.upsert_hourly(rows, record_seen=False) == UpsertResult(inserted=24)
+        assert "hourly" not in db.last_seen()
+
+        rows[5] = dict(rows[5], usage_kwh=9.0, timestamp="2025-03-03T01:00:00")
+        result = db.upsert_hourly(rows)
+        assert (result.inserted, result.updated, result.unchanged) == (0, 1, 23)
+        assert db.last_seen()["hourly"]["rows"] == 24
+    finally:
+        db.close()
@@ -0,0 +1,83 @@
+"""
+测试指标导出：只读打开数据库、缺库 / 缺表时不输出派生指标、collection_runs 的增量聚合与整表重放一致
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+from db import KyudenSQLite
+from metrics import CollectorMetrics
+
+BASE = datetime(2025, 10, 1, 6, 0, 0)
+
+def _record_runs(path, start: int, n: int):
+    with KyudenSQLite(path) as db:
+        db.init_schema()
+        for i in range(start, start + n):
+            finished = BASE + timedelta(hours=i)
+            db.record_run({
+                "started_at": finished - timedelta(seconds=40), "finished_at": finished,
+                "duration_sec": 3.0 * (i % 9), "mode": "both" if i % 2 else "hourly",
+                "outcome": "login-failed" if i % 5 == 0 else "ok", "login_attempts": i % 3,
+                "phases": {"login": 0.4 * (i % 4), "ingest": 0.1 * (i % 7)},
+                "rows_daily": i % 2, "rows_hourly": 24,
+            })
+
+def _samples(text: str):
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in text.splitlines() if line and not line.startswith("#")}
+
+def test_missing_database_is_not_created(tmp_path):
+    path = tmp_path / "missing.db"
+    samples = _samples(CollectorMetrics(path).render())
+    assert samples["kyuden_metrics_db_up"] == 0
+    assert not any(k.startswith("kyuden_runs_total") for k in samples)
+    assert not path.exists()
+
+def test_missing_tables(tmp_path):
+    path = tmp_path / "empty.db"
+    sqlite3.connect(str(path)).close()
+    samples = _samples(CollectorMetrics(path).render())
+    assert samples["kyuden_metrics_db_up"] == 1
+    assert not any(k.startswith(("kyuden_runs_total", "kyuden_latest_data")) for k in samples)
+    assert sqlite3.connect(str(path)).execute("SELECT COUNT(*) FROM sqlite_master;").fetchone()[0] == 0
+
+def test_incremental_matches_full_replay(tmp_path):
+    path = tmp_path / "usage.db"
+    _record_runs(path, 0, 30)
+    daemon = CollectorMetrics(path)
+    first = _samples(daemon.render())
+    assert first['kyuden_runs_total{mode="hourly",outcome="login-failed"}'] == 3
+    assert first["kyuden_login_failures_total"] == 6
+    assert first["kyuden_login_attempts_total"] == sum(i % 3 for i in range(30))
+    assert first['kyuden_rows_upserted_total{table="hourly"}'] == 30 * 24
+    assert first['kyuden_run_duration_seconds_count{mode="both"}'] == 15
+    assert first['kyuden_run_duration_seconds_bucket{mode="both",le="5.0"}'] == sum(
+        1 for i in range(1, 30, 2) if 3.0 * (i % 9) <= 5)
+    assert first['kyuden_phase_duration_seconds_count{mode="hourly",phase="login"}'] == 15
+
+    _record_runs(path, 30, 7)
+    incremental = _samples(daemon.render())
+    replay = _samples(CollectorMetrics(path).render())
+    assert incremental == replay
+    assert incremental["kyuden_last_run_timestamp_seconds"] == (BASE + timedelta(hours=36)).timestamp()
+    assert incremental["kyuden_last_success_timestamp_seconds"] == (BASE + timedelta(hours=36)).timestamp()
+
+    _record_runs(path, 40, 1)  # 第 40 次是 login-failed：最近运行时间前进，最近成功时间不变
+    latest = _samples(daemon.render())
+    assert latest["kyuden_last_run_timestamp_seconds"] == (BASE + timedelta(hours=40)).timestamp()
+    assert latest["kyuden_last_success_timestamp_seconds"] == (BASE + timedelta(hours=36)).timestamp()
+
+def test_reads_while_writer_holds_lock(tmp_path):
+    path = tmp_path / "usage.db"
+    _record_runs(path, 0, 3)
+    writer = sqlite3.connect(str(path), isolation_level=None)
+    try:
+        writer.execute("BEGIN IMMEDIATE;")
+        writer.execute("DELETE FROM collection_runs;")
+        samples = _samples(CollectorMetrics(path).render())
+        assert samples["kyuden_metrics_db_up"] == 1
+        assert samples['kyuden_rows_upserted_total{table="hourly"}'] == 3 * 24
+    finally:
+        writer.execute("ROLLBACK;")
+        writer.close()
@@ -0,0 +1,37 @@
+"""
+测试 payload 存档的入库标记：解析失败的 payload 不会被标记为已入库，下次运行仍会重新解析
+"""
+
+from collector import _classify_outcome
+from db import PayloadArchive
+from kyuden_scraper import KyudenScraper
+
+GOOD = {"shiyoKikan": ["x", "8/20", "8/21"], "columns": [["使用電力量", 2.2, 2.1]]}
+WEIRD = {"weird": "shape"}
+
+def _run(archive: PayloadArchive, payload):
+    """模拟 run_collect 的一次 daily 运行：解析后把 payload_hashes 中未跳过的 kind 标记为已入库"""
+    scraper = KyudenScraper(payload_archive=archive)
+    rows = scraper._parse_payload("daily", payload)
+    unchanged = scraper.run_info.get("unchanged") or []
+    hashes = scraper.run_info.get("payload_hashes") or {}
+    archive.mark_ingested([h for k, h in hashes.items() if k not in unchanged])
+    return rows, scraper.run_info
+
+def test_unparseable_payload_is_not_marked_ingested(tmp_path):
+    archive = PayloadArchive(tmp_path / "usage.db")
+    rows, info = _run(archive, WEIRD)
+    assert not rows and "daily" not in (info.get("payload_hashes") or {})
+
+    rows, info = _run(archive, WEIRD)
+    assert "daily" not in (info.get("unchanged") or [])
+    assert _classify_outcome("daily", {"daily": rows}, info) == "no-data"
+
+def test_parsed_payload_is_skipped_next_time(tmp_path):
+    archive = PayloadArchive(tmp_path / "usage.db")
+    rows, info = _run(archive, GOOD)
+    assert len(rows) == 2 and "daily" in info["payload_hashes"]
+
+    rows, info = _run(archive, GOOD)
+    assert not rows and info["unchanged"] == ["daily"]
+    assert _classify_outcome("daily", {"daily": rows}, info) == "unchanged"
@@ -0,0 +1,36 @@
+"""
+测试登录态的廉价校验：storage state 缺失、没有站点 cookie、cookie 全部过期时各自的校验路径
+"""
+
+import json
+import time
+
+from session import SessionValidator
+
+def _validator(tmp_path, cookies=None, **kwargs) -> SessionValidator:
+    path = tmp_path / "state.json"
+    if cookies is not None:
+        path.write_text(json.dumps({"cookies": cookies, "origins": []}), encoding="utf-8")
+    return SessionValidator(path, probe=False, **kwargs)
+
+def test_missing_state(tmp_path):
+    check = _validator(tmp_path).validate()
+    assert (check.valid, check.path) == (False, "no-state")
+
+def test_no_site_cookies(tmp_path):
+    other = [{"name": "x", "domain": ".example.com", "expires": time.time() + 3600}]
+    for cookies in ([], other):
+        check = _validator(tmp_path, cookies).validate()
+        assert (check.valid, check.path) == (False, "no-cookies")
+
+def test_expired_cookies(tmp_path):
+    cookies = [{"name": "sid", "domain": "my.kyuden.co.jp", "expires": time.time() - 60}]
+    check = _validator(tmp_path, cookies).validate()
+    assert (check.valid, check.path) == (False, "cookies-expired")
+
+def test_recent_success_and_dom_fallback(tmp_path):
+    cookies = [{"name": "sid", "domain": "my.kyuden.co.jp", "expires": -1}]
+    recent = {"last_success_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    assert _validator(tmp_path, cookies, meta=recent).validate().path == "recent-success"
+    check = _validator(tmp_path, cookies).validate()
+    assert (check.valid, check.path) == (None, "dom")
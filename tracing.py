@@ -0,0 +1,184 @@
+"""
+轻量级阶段追踪：用上下文管理器包住抓取 / 解析 / 入库的各个阶段，记录嵌套耗时和计数器
+
+- 未启用时 get_tracer() 返回空实现，span() 直接返回一个可复用的空上下文管理器，开销接近于零
+- 子 span 结束时把计数器累加到父 span，根 span 上即是整次运行的总数
+- 导出器可插拔，目前提供 JSON Lines（每个 span 结束时写一行）
+
+启用方式：设置环境变量 KYUDEN_TRACE=<文件路径>（"-" 表示写到 stderr），或调用 configure()
+"""
+
+import sys
+import json
+import time
+import uuid
+import threading
+import functools
+import contextvars
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, Union, Callable, TextIO
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("kyuden_span", default=None)
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attrs", "counters",
+                 "started_at", "_t0", "duration_sec", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.attrs = attrs
+        self.counters: Dict[str, float] = {}
+        self.started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        self.duration_sec: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def count(self, key: str, n: float = 1):
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.started_at.isoformat(),
+            "duration_ms": round((self.duration_sec or 0.0) * 1000, 3),
+        }
+        if self.attrs:
+            d["attrs"] = self.attrs
+        if self.counters:
+            d["counters"] = self.counters
+        if self.error:
+            d["error"] = self.error
+        return d
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def count(self, key: str, n: float = 1):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+class _NoopContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+_NOOP_CONTEXT = _NoopContext()
+
+class _SpanContext:
+    __slots__ = ("tracer", "name", "attrs", "span", "token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.name, _current_span.get(), self.attrs)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        sp = self.span
+        sp.duration_sec = time.perf_counter() - sp._t0
+        if exc is not None:
+            sp.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self.token)
+        if sp.parent is not None:
+            for k, v in sp.counters.items():
+                sp.parent.count(k, v)
+        self.tracer.exporter.export(sp)
+        return False
+
+class JsonLinesExporter:
+    """每个 span 结束时写一行 JSON（线程安全）"""
+
+    def __init__(self, target: Union[str, Path, TextIO]):
+        if hasattr(target, "write"):
+            self._fp = target
+            self._owns = False
+        else:
+            path = Path(target)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._fp = open(path, "a", encoding="utf-8")
+            self._owns = True
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._fp.write(line + "\n")
+            self._fp.flush()
+
+    def close(self):
+        if self._owns:
+            self._fp.close()
+
+class Tracer:
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+        self.enabled = exporter is not None
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return _NOOP_CONTEXT
+        return _SpanContext(self, name, attrs)
+
+    def count(self, key: str, n: float = 1):
+        """累加到当前 span 的计数器（没有活动 span 时忽略）"""
+        if self.enabled:
+            sp = _current_span.get()
+            if sp is not None:
+                sp.count(key, n)
+
+_tracer = Tracer()
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    global _tracer
+    _tracer = tracer
+    return tracer
+
+def configure(target: Optional[str]) -> Tracer:
+    """target 为 None / 空时关闭追踪；"-" 写到 stderr；其它视为 JSON Lines 文件路径"""
+    if not target:
+        return set_tracer(Tracer())
+    exporter = JsonLinesExporter(sys.stderr if target == "-" else target)
+    return set_tracer(Tracer(exporter))
+
+def traced(name: str, count_result_as: Optional[str] = None) -> Callable:
+    """装饰器：为同步函数包一层 span；count_result_as 非空时把 len(返回值) 计入该计数器"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            with tracer.span(name) as sp:
+                result = fn(*args, **kwargs)
+                if count_result_as and result is not None:
+                    try:
+                        sp.count(count_result_as, len(result))
+                    except TypeError:
+                        pass
+                return result
+        return wrapper
+    return decorator